@@ -1,53 +1,171 @@
 # Contenido para: api/main.py (Versión 2.3.1 - ¡CON MEMORIA!)
 
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import uvicorn
-import joblib
+import numpy as np
 import pandas as pd
 import os
+import sys
+import threading
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
+from typing import Optional
 from operator import itemgetter # ¡NUEVA IMPORTACIÓN!
 
-# Importaciones de Langchain
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+# Permite importar 'src' al correr 'python api/main.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# LangChain, OpenAI, FAISS y xgboost (vía joblib) se importan dentro de los
+# cargadores: el worker arranca rápido y los carga en segundo plano.
+from src import audit, batch_scoring
+from src.compiled_model import compile_model, make_batch_scorer
+from src.memory import ConversationMemory, count_tokens, make_llm_summarizer
+from src.metrics import (PROMETHEUS_CONTENT_TYPE, REGISTRY, RequestMetricsMiddleware, current_llm_call,
+                         stage, start_llm_call)
+from src import rag_cache
+from src.rag_cache import RAGResponseCache, current_kb_version
+from src.pred_cache import MODEL_WATCHER, PREDICTION_CACHE, artifact_version
+from src.providers import get_chat_model, is_configured
+from src.microbatch import ENABLED as MICROBATCH_ENABLED, MicroBatcher, QueueFullError, WorkerStoppedError
+from src.readiness import DISABLED, FAILED, ComponentDisabled, ComponentUnavailable, Components
+from src.sessions import Session, make_session_store
+from src.streaming import SSE_HEADERS, SSE_MEDIA_TYPE, sse_stream, stream_chain
+from src.transformer import COLS_RAW, TRANSFORMER_PATH, load_transformer
 
 # --- 1. Carga de .env y Aplicación ---
 load_dotenv() 
+components = Components()
+components.started_at = _IMPORT_STARTED
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carga y calentamiento en segundo plano: /healthz responde de inmediato
+    # y /readyz pasa a 200 cuando todo está listo.
+    print(f"Worker importado en {(time.perf_counter() - _IMPORT_STARTED) * 1000:.1f} ms; cargando componentes...")
+    components.start_background()
+    yield
+
 app = FastAPI(
     title="API Coach de Bienestar Hídrido (ML + RAG)",
     version="2.3.1",
-    description="Predice riesgo (ML) y chatea sobre consejos (RAG)."
+    description="Predice riesgo (ML) y chatea sobre consejos (RAG).",
+    lifespan=lifespan,
 )
+# Peticiones, latencia y errores por endpoint en /metrics (ASGI puro: sin costo por petición apreciable)
+app.add_middleware(RequestMetricsMiddleware)
 
 # --- 2. Carga de Modelos (ML y RAG) ---
 MODEL_PATH = "models/hypertension_model.joblib"
 FAISS_PATH = "models/faiss_index"
 openai_api_key = os.getenv("OPENAI_API_KEY")
+# Pregunta sintética para calentar el retriever (embeddings + búsqueda)
+WARMUP_QUESTION = "¿Cómo puedo bajar la presión arterial?"
+
+# Transformador ajustado: perfil crudo -> features (mismas medianas que en train)
+feature_transformer = None
+
+def load_feature_transformer():
+    global feature_transformer
+    feature_transformer = load_transformer(TRANSFORMER_PATH)
+    print(f"Transformador de features cargado desde {TRANSFORMER_PATH}")
 
 # Cargar Cerebro 1: Modelo ML (El Analista)
-try:
-    ml_model = joblib.load(MODEL_PATH)
-    print(f"Modelo ML (Analista) cargado desde {MODEL_PATH}")
-except Exception as e:
-    ml_model = None
-    print(f"ERROR al cargar modelo ML: {e}")
+ml_model = compiled_model = native_scorer = None
+ml_model_version = None
+_model_reload_lock = threading.Lock()  # Una recarga a la vez (se libera en el hilo que recarga)
+_failed_model_version = None           # Versión en disco que no se pudo cargar
+
+def load_ml_model():
+    """
+    (Re)carga el modelo y sus evaluadores. 'ml_model_version' etiqueta las
+    entradas de la caché de predicciones con la versión realmente cargada.
+    """
+    global ml_model, compiled_model, native_scorer, ml_model_version
+    import joblib
+    version = artifact_version(MODEL_PATH)
+    model = joblib.load(MODEL_PATH)
+    # Evaluador compilado (arreglos planos) para puntuar una fila sin pandas ni DMatrix
+    compiled, scorer = compile_model(model), make_batch_scorer(model)
+    # El evaluador lee las features por posición: deben ser las del transformador, en el mismo orden
+    if feature_transformer is not None and tuple(feature_transformer.features) != compiled.feature_names:
+        raise RuntimeError(f"Las features del transformador {list(feature_transformer.features)} no coinciden "
+                           f"con las del modelo {list(compiled.feature_names)}.")
+    ml_model, compiled_model, native_scorer = model, compiled, scorer
+    ml_model_version = version
+    print(f"Modelo ML (Analista) cargado desde {MODEL_PATH} (versión {version})")
+
+def warm_ml_model():
+    # Una predicción sintética por cada camino (fila única y lote nativo)
+    if feature_transformer is not None:
+        row = feature_transformer.transform_one({})
+    else:
+        row = [0.0] * compiled_model.n_features
+    compiled_model.predict_proba_one(row)
+    native_scorer(np.asarray([row] * 8, dtype=np.float32))
+
+def refresh_ml_model():
+    """
+    Si el artefacto del modelo cambió en disco, lo recarga en un hilo de fondo
+    (joblib.load + compilación tardan ~1 s): la petición no espera y se sigue
+    atendiendo con el modelo vigente hasta el cambio. La caché se invalida sola.
+    """
+    version = MODEL_WATCHER.current()
+    if version == ml_model_version or version == _failed_model_version:
+        return
+    if not _model_reload_lock.acquire(blocking=False):
+        return  # Ya hay una recarga en curso
+    threading.Thread(target=_reload_ml_model, name="nexusbyte-model-reload", daemon=True).start()
+
+def _reload_ml_model():
+    global _failed_model_version
+    try:
+        if MODEL_WATCHER.current() != ml_model_version:
+            load_ml_model()
+    except Exception as e:
+        # Se sigue atendiendo con el modelo anterior; no se reintenta hasta que el archivo vuelva a cambiar
+        _failed_model_version = MODEL_WATCHER.current()
+        print(f"ERROR al recargar modelo ML: {e}")
+    finally:
+        _model_reload_lock.release()
+
+# Micro-batching opcional (NEXUSBYTE_MICROBATCH=1): junta las filas de /predict concurrentes.
+# Se llama a native_scorer a través de la lambda para usar siempre el modelo vigente.
+predict_batcher = MicroBatcher(lambda X: native_scorer(X)) if MICROBATCH_ENABLED else None
 
 # Cargar Cerebro 2: Sistema RAG (El Coach)
-try:
-    if not openai_api_key:
-        raise ValueError("OPENAI_API_KEY no encontrada. Revisa tu .env")
-    if not os.path.exists(FAISS_PATH):
-        raise FileNotFoundError(f"Índice FAISS no encontrado en {FAISS_PATH}.")
-    
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-    vectorstore = FAISS.load_local(FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.1, openai_api_key=openai_api_key)
-    retriever = vectorstore.as_retriever() 
+rag_chain = retriever = embeddings = rag_manifest = None
+rag_response_cache = None
+chat_memory = ConversationMemory()
+# Historial, resumen y contadores de tokens por sesión (memoria o SQLite)
+session_store = make_session_store()
+
+def load_rag_system():
+    global rag_chain, retriever, embeddings, rag_manifest, rag_response_cache, chat_memory
+    if not is_configured(openai_api_key):
+        raise ComponentDisabled("OPENAI_API_KEY no encontrada. Revisa tu .env")
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda
+    from src.bm25 import BM25_PATH, RETRIEVER_MODE
+    from src.context_packer import ContextPacker, make_context_step
+    from src.rag import load_index, query_embeddings, read_manifest
+
+    # Índice prebuilt por src/build_rag.py (el mismo que usa la app)
+    # En modo 'bm25' no se usa FAISS: la búsqueda no llama a la API de embeddings
+    embeddings = None
+    if RETRIEVER_MODE != "bm25":
+        # LRU de embeddings de preguntas (compartido por el retriever y la caché de respuestas)
+        embeddings = query_embeddings(read_manifest(FAISS_PATH), openai_api_key)
+    retriever, rag_manifest = load_index(embeddings, RETRIEVER_MODE, FAISS_PATH, BM25_PATH)
+    llm = get_chat_model(temperature=0.1, api_key=openai_api_key)
 
     # --- ¡PROMPT CON MEMORIA! ---
     prompt_template = """
@@ -56,7 +174,6 @@ try:
 
     **Mi Base de Conocimiento (Contexto):**
     Mi conocimiento se limita *estrictamente* a la información proporcionada en el "Contexto" de abajo.
-    {context}
 
     **Mis Reglas de Operación (¡Muy Importante!):**
     1. Revisa el "Historial del Chat". Úsalo para entender preguntas de seguimiento (ej. "cómo hago eso", "por qué").
@@ -79,36 +196,73 @@ try:
     NexusByte (Respuesta en español):
     """
     prompt = PromptTemplate.from_template(prompt_template)
+
+    def prompt_ready(prompt_value):
+        # Entre el prompt y el LLM: aquí empieza el tiempo del LLM y se cuentan los tokens enviados
+        llm_call = current_llm_call()
+        if llm_call is not None:
+            llm_call.prompt_ready(count_tokens(prompt_value.to_string()))
+        return prompt_value
     
     # --- ¡CADENA CON MEMORIA! ---
     # Reconfiguramos la cadena para aceptar 'question' e 'history'
     rag_chain = (
         {
-            "context": itemgetter("question") | retriever, # El retriever sigue buscando solo con la última pregunta
+            # El retriever sigue buscando solo con la última pregunta; el packer
+            # deduplica, ordena y recorta los chunks (src/context_packer.py)
+            "context": make_context_step(retriever, ContextPacker()),
             "question": itemgetter("question"),
             "chat_history": itemgetter("history") # Pasamos el historial al prompt
         }
         | prompt
+        | RunnableLambda(prompt_ready)
         | llm
         | StrOutputParser()
     )
     
+    # Memoria con presupuesto de tokens: el mismo LLM resume los turnos viejos
+    chat_memory = ConversationMemory(summarize=make_llm_summarizer(llm))
+
+    # Caché de respuestas del coach (exacta + semántica con los mismos embeddings)
+    if rag_cache.ENABLED:
+        rag_response_cache = RAGResponseCache(embed=embeddings.aembed_query if embeddings is not None else None)
     print("Sistema RAG (Coach v2.3.1 con Memoria) cargado exitosamente.")
 
-except Exception as e:
-    rag_chain = None
-    print(f"ERROR al cargar sistema RAG: {e}")
+def warm_rag_system():
+    # Una búsqueda sintética: abre la conexión con la API de embeddings y
+    # carga el índice en caché. No se llama al LLM (costaría tokens).
+    retriever.invoke(WARMUP_QUESTION)
+    count_tokens(WARMUP_QUESTION)  # Carga la codificación de tiktoken
+
+components.add("feature_transformer", load_feature_transformer)
+components.add("ml_model", load_ml_model, warm_ml_model)
+components.add("rag", load_rag_system, warm_rag_system)
 
 
 # --- 3. Modelos de Datos (Pydantic) ---
+# Se envían exactamente las features del modelo cargado; las demás se dejan sin valor (422 si no)
 class FeaturesInput(BaseModel):
-    feat_imc: float = Field(..., json_schema_extra={'example': 28.5})
-    feat_whtr: float = Field(..., json_schema_extra={'example': 0.55})
-    feat_age: int = Field(..., json_schema_extra={'example': 45})
-    feat_sex: int = Field(..., json_schema_extra={'example': 0}, description="0: Hombre, 1: Mujer")
-    feat_is_smoker: int = Field(..., json_schema_extra={'example': 1}, description="0: No, 1: Sí")
-    feat_sleep_hours: float = Field(..., json_schema_extra={'example': 6.5})
-    feat_activity_days: float = Field(..., json_schema_extra={'example': 2.0})
+    feat_imc: Optional[float] = Field(None, json_schema_extra={'example': 28.5})
+    feat_whtr: Optional[float] = Field(None, json_schema_extra={'example': 0.55})
+    feat_age: Optional[int] = Field(None, json_schema_extra={'example': None})
+    feat_sex: Optional[int] = Field(None, json_schema_extra={'example': None}, description="0: Hombre, 1: Mujer")
+    feat_is_smoker: Optional[int] = Field(None, json_schema_extra={'example': 1}, description="0: No, 1: Sí")
+    feat_sleep_hours: Optional[float] = Field(None, json_schema_extra={'example': 6.5})
+    feat_activity_days: Optional[float] = Field(None, json_schema_extra={'example': 2.0})
+
+# Perfil crudo (códigos NHANES). Los campos omitidos se imputan con la mediana de train.
+class ProfileInput(BaseModel):
+    age: Optional[float] = Field(None, json_schema_extra={'example': 45}, description="RIDAGEYR: edad en años")
+    sex: Optional[int] = Field(None, json_schema_extra={'example': 1}, description="RIAGENDR: 1=Hombre, 2=Mujer")
+    height: Optional[float] = Field(None, json_schema_extra={'example': 175.0}, description="BMXHT: altura en cm")
+    weight: Optional[float] = Field(None, json_schema_extra={'example': 80.0}, description="BMXWT: peso en kg")
+    waist: Optional[float] = Field(None, json_schema_extra={'example': 90.0}, description="BMXWAIST: cintura en cm")
+    sleep_hours: Optional[float] = Field(None, json_schema_extra={'example': 6.5}, description="SLD_HOURS: horas de sueño (77/99 = no sabe)")
+    is_smoker: Optional[int] = Field(None, json_schema_extra={'example': 2}, description="SMQ020: 1=Sí, 2=No")
+    activity_days: Optional[int] = Field(None, json_schema_extra={'example': 1}, description="PAQ650: 1=Sí, 2=No (7/9 = no sabe)")
+
+    def to_raw(self) -> dict:
+        return {COLS_RAW[key]: value for key, value in self.dict().items()}
 
 class PredictionOutput(BaseModel):
     risk_score: float
@@ -118,6 +272,8 @@ class PredictionOutput(BaseModel):
 class ChatInput(BaseModel):
     query: str = Field(..., example="¿Qué es la dieta DASH?")
     history: list = Field(default_factory=list, example=[{"role": "user", "content": "Hola"}])
+    # Con session_id el historial vive en el servidor (POST /sessions) y 'history' se ignora
+    session_id: Optional[str] = Field(None, example=None)
 
 
 # --- 4. Endpoints de la API ---
@@ -125,58 +281,313 @@ class ChatInput(BaseModel):
 def read_root():
     return {"status": "API Híbrida (ML + RAG) está en línea."}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: el proceso responde (aunque los modelos sigan cargando)."""
+    return {"status": "ok", "uptime_s": round(time.perf_counter() - _IMPORT_STARTED, 1)}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 solo cuando todos los componentes están cargados y calentados."""
+    report = components.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+def require_components(*names):
+    """503 mientras un componente carga; 500 si falló o está deshabilitado."""
+    try:
+        for name in names:
+            components.require(name)
+    except ComponentUnavailable as e:
+        status = 503 if e.component.state not in (FAILED, DISABLED) else 500
+        raise HTTPException(status_code=status, detail=str(e))
+
+# Caché de predicciones (src/pred_cache.py) etiquetada con la versión cargada del modelo.
+# Solo se guarda tras calcular (un acierto no renueva el TTL de la entrada).
+# El modelo compilado recorre los árboles una sola vez; la etiqueta sale del umbral.
+def cached_score(row, version) -> Optional[float]:
+    if PREDICTION_CACHE is None:
+        return None
+    return PREDICTION_CACHE.get(row, version)
+
+def store_score(row, version, risk_score: float) -> None:
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.put(row, version, risk_score)
+
+def prediction_output(row, risk_score: float, cached: bool) -> PredictionOutput:
+    prediction = int(risk_score > 0.5)
+    # Auditoría (app/results.csv): solo se encola; el disco lo escribe un hilo de fondo.
+    # 'row' sigue el orden del modelo (igual al del transformador, se verifica al cargar);
+    # 'cached' distingue las respuestas servidas desde la caché de las calculadas
+    audit.log_prediction(dict(zip(compiled_model.feature_names, row)), risk_score, prediction,
+                         cached=int(cached))
+    return PredictionOutput(risk_score=risk_score, prediction=prediction)
+
 @app.post("/predict", response_model=PredictionOutput)
-def predict_hypertension(data: FeaturesInput):
-    # (Cerebro 1: El Analista ML)
-    if ml_model is None:
-        raise HTTPException(status_code=500, detail="Modelo ML no está cargado.")
+async def predict_hypertension(data: ProfileInput):
+    # (Cerebro 1: El Analista ML) - recibe el perfil crudo y aplica el transformador de train
+    require_components("feature_transformer", "ml_model")
+    refresh_ml_model()
+    try:
+        with stage("feature_prep"):
+            row = feature_transformer.transform_one(data.to_raw())
+        version = ml_model_version
+        risk_score = cached_score(row, version)
+        cached = risk_score is not None
+        if not cached:
+            with stage("model_scoring"):  # Con micro-batching incluye la espera en la cola
+                if predict_batcher is None:
+                    risk_score = compiled_model.predict_proba_one(row)
+                else:
+                    risk_score = await predict_batcher.submit(row)
+            store_score(row, version, risk_score)
+        return prediction_output(row, risk_score, cached)
+    except (QueueFullError, WorkerStoppedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en predicción: {e}")
+
+@app.post("/predict/features", response_model=PredictionOutput)
+def predict_from_features(data: FeaturesInput):
+    # Compatibilidad: clientes que ya envían las features 'feat_*' calculadas
+    require_components("ml_model")
+    refresh_ml_model()
+    try:
+        row = compiled_model.row_from_features(data.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     try:
-        input_data = pd.DataFrame([data.dict()])
-        probabilities = ml_model.predict_proba(input_data)[0]
-        prediction = ml_model.predict(input_data)[0]
-        risk_score = float(probabilities[1])
-        return PredictionOutput(risk_score=risk_score, prediction=int(prediction))
+        version = ml_model_version
+        risk_score = cached_score(row, version)
+        cached = risk_score is not None
+        if not cached:
+            with stage("model_scoring"):
+                risk_score = compiled_model.predict_proba_one(row)
+            store_score(row, version, risk_score)
+        return prediction_output(row, risk_score, cached)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en predicción: {e}")
 
+def score_batch(df: pd.DataFrame) -> np.ndarray:
+    # Un bloque completo: transformador vectorizado + una sola llamada a predict_proba
+    with stage("feature_prep"):
+        X = feature_transformer.transform_array(df)
+    with stage("model_scoring"):
+        return native_scorer(X)
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    """
+    Puntúa una lista de perfiles crudos (JSON, NDJSON o Arrow IPC).
+    Responde en NDJSON: una línea por perfil y una línea final de resumen.
+    """
+    require_components("feature_transformer", "ml_model")
+    refresh_ml_model()
+
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    spool = None
+    try:
+        if content_type in batch_scoring.NDJSON_TYPES:
+            spool = await batch_scoring.spool_body(request.stream())
+            frames = batch_scoring.as_async(batch_scoring.ndjson_frames(spool), close=spool.close)
+        elif content_type in batch_scoring.ARROW_STREAM_TYPES + batch_scoring.ARROW_FILE_TYPES:
+            spool = await batch_scoring.spool_body(request.stream())
+            is_file = content_type in batch_scoring.ARROW_FILE_TYPES
+            frames = batch_scoring.as_async(batch_scoring.arrow_frames(spool, file_format=is_file),
+                                            close=spool.close)
+        elif content_type in batch_scoring.JSON_TYPES:
+            body = await batch_scoring.read_limited(request.stream())
+            frames = batch_scoring.as_async(batch_scoring.json_frames(body))
+        else:
+            raise HTTPException(status_code=415, detail=f"Content-Type no soportado: {content_type}")
+    except batch_scoring.BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except batch_scoring.BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # El temporal se cierra al terminar el stream (as_async) y, por si el stream
+    # nunca arranca (cliente desconectado), también después de la respuesta
+    return StreamingResponse(batch_scoring.stream_scores(frames, score_batch, content_type),
+                             media_type="application/x-ndjson",
+                             background=BackgroundTask(spool.close) if spool is not None else None)
+
+@app.get("/metrics")
+def metrics():
+    """
+    Métricas en formato Prometheus: latencia por etapa (nexusbyte_stage_seconds),
+    peticiones/errores/tokens por endpoint, micro-batching, cachés, etc.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def coach_question(data: PredictionOutput) -> str:
+    if data.prediction == 1:
+        riesgo_desc = f"Mi riesgo de hipertensión es alto (score: {data.risk_score:.2f})."
+    else:
+        riesgo_desc = f"Mi riesgo de hipertensión es bajo (score: {data.risk_score:.2f})."
+    return f"{riesgo_desc} ¿Qué consejos de salud (nutrición, ejercicio, estrés) me puedes dar basándote en tu conocimiento?"
+
+def get_session(session_id: str) -> Session:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Sesión '{session_id}' no encontrada o expirada.")
+    return session
+
+async def prepare_chat(data: ChatInput):
+    """
+    Sesión (o None) y el historial dentro del presupuesto de tokens (src/memory.py):
+    turnos recientes literales y los más viejos resumidos.
+    """
+    if data.session_id:
+        session = get_session(data.session_id)
+        memory = await chat_memory.build(session.messages, session.summary, session.summary_turns)
+        return session, memory
+    return None, await chat_memory.build(data.history)
+
+def record_turn(session: Optional[Session], question: str, answer: str, memory) -> dict:
+    """
+    Registra el turno en la bitácora (app/logs.jsonl) y, con sesión, guarda el
+    turno y los contadores de tokens en ella; devuelve campos para la respuesta.
+    """
+    audit.log_chat(question, answer, session_id=session.session_id if session else None)
+    if session is None:
+        return {}
+    base_turns = session.turns
+    tokens_in, tokens_out = count_tokens(question), count_tokens(answer)
+
+    def apply(current: Session) -> None:
+        # Sobre la versión actual de la sesión: si otra petición guardó un turno
+        # entretanto, se conserva el suyo y el resumen (de un historial viejo) no se toca
+        if memory.folded_turns and current.turns == base_turns:
+            current.summary, current.summary_turns = memory.summary, memory.folded_turns
+        current.add_turn(question, answer, tokens_in, tokens_out, memory.history_tokens)
+
+    if session_store.update(session.session_id, apply) is None:
+        # Expiró o se borró mientras se generaba la respuesta: el turno no quedó guardado
+        return {"session_id": None,
+                "session_error": f"Sesión '{session.session_id}' no encontrada o expirada; el turno no se guardó."}
+    return {"session_id": session.session_id}
+
+def require_rag_chain():
+    require_components("rag")
+
+def coach_scope(data: PredictionOutput) -> str:
+    # La caché semántica no mezcla planes de riesgo alto y bajo (ni con /chat)
+    return f"coach:{data.prediction}"
+
+async def ask_rag(question: str, history: str, scope: str):
+    """Respuesta del RAG chain pasando por la caché. Devuelve (respuesta, origen)."""
+    inputs = {"question": question, "history": history}
+
+    async def compute():
+        llm_call = start_llm_call()
+        answer = await rag_chain.ainvoke(inputs)
+        llm_call.finish(count_tokens(answer))
+        return answer
+
+    if rag_response_cache is None:
+        return await compute(), "disabled"
+    return await rag_response_cache.get_or_compute(question, history, current_kb_version(), compute, scope)
+
 @app.post("/coach")
-def get_coaching_advice(data: PredictionOutput):
+async def get_coaching_advice(data: PredictionOutput):
     # (Cerebro 2: El Coach RAG para Consejo Específico)
-    if rag_chain is None:
-        raise HTTPException(status_code=500, detail="Sistema RAG (Coach) no está cargado.")
+    require_rag_chain()
     try:
-        if data.prediction == 1:
-            riesgo_desc = f"Mi riesgo de hipertensión es alto (score: {data.risk_score:.2f})."
-        else:
-            riesgo_desc = f"Mi riesgo de hipertensión es bajo (score: {data.risk_score:.2f})."
-        
-        pregunta_usuario = f"{riesgo_desc} ¿Qué consejos de salud (nutrición, ejercicio, estrés) me puedes dar basándote en tu conocimiento?"
-        coach_message = rag_chain.invoke({
-            "question": pregunta_usuario,
-            "history": "" # El coach inicial no tiene historial
-        })
-
-        return {"user_risk_score": data.risk_score, "coach_message": coach_message}
+        # El coach inicial no tiene historial
+        question = coach_question(data)
+        coach_message, origin = await ask_rag(question, "", coach_scope(data))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en el RAG chain: {e}")
+    audit.log_chat(question, coach_message, risk_score=data.risk_score)
+    return {"user_risk_score": data.risk_score, "coach_message": coach_message, "cache": origin}
+
+@app.post("/coach/stream")
+async def stream_coaching_advice(data: PredictionOutput):
+    """Igual que /coach, pero envía los tokens a medida que se generan (SSE)."""
+    require_rag_chain()
+    inputs = {"question": coach_question(data), "history": ""}
+
+    def on_done(answer: str) -> None:
+        audit.log_chat(inputs["question"], answer, risk_score=data.risk_score)
+
+    return StreamingResponse(sse_stream(rag_chain, inputs, rag_response_cache, current_kb_version(), on_done,
+                                        scope=coach_scope(data), user_risk_score=data.risk_score),
+                             media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+# --- Sesiones de chat (src/sessions.py) ---
+@app.post("/sessions")
+def create_session():
+    """Nueva sesión: desde aquí /chat solo necesita {'query', 'session_id'}."""
+    return {"session_id": session_store.create().session_id}
+
+@app.get("/sessions/{session_id}")
+def read_session(session_id: str):
+    return get_session(session_id).to_dict()
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Sesión '{session_id}' no encontrada o expirada.")
+    return {"deleted": session_id}
 
 # --- ¡ENDPOINT DE CHAT CON MEMORIA! ---
 @app.post("/chat")
-def handle_chat_query(data: ChatInput):
+async def handle_chat_query(data: ChatInput):
     """Cerebro 3: El Chatbot General (RAG)"""
-    if rag_chain is None:
-        raise HTTPException(status_code=500, detail="Sistema RAG (Coach) no está cargado.")
+    require_rag_chain()
+    session, memory = await prepare_chat(data)
     try:
-        # Formatear el historial para que sea un texto simple
-        history_formatted = "\n".join([f"{msg['role']}: {msg['content']}" for msg in data.history])
-        
-        response = rag_chain.invoke({
-            "question": data.query,
-            "history": history_formatted
-        })
-        return {"user_query": data.query, "coach_message": response}
+        response, origin = await ask_rag(data.query, memory.text, "chat")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en el RAG chain: {e}")
+    return {"user_query": data.query, "coach_message": response, "cache": origin,
+            **record_turn(session, data.query, response, memory)}
+
+@app.post("/chat/stream")
+async def stream_chat_query(data: ChatInput):
+    """Igual que /chat, pero envía los tokens a medida que se generan (SSE)."""
+    require_rag_chain()
+    session, memory = await prepare_chat(data)
+    inputs = {"question": data.query, "history": memory.text}
+    on_done = lambda answer: record_turn(session, data.query, answer, memory)
+    return StreamingResponse(sse_stream(rag_chain, inputs, rag_response_cache, current_kb_version(), on_done,
+                                        scope="chat", user_query=data.query),
+                             media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat por WebSocket: cada mensaje del cliente es un ChatInput en JSON
+    ({"query": ..., "history": [...]} o {"query": ..., "session_id": ...}); la respuesta llega como mensajes
+    {"type": "token"} y un {"type": "done"} final. La conexión se reutiliza.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                components.require("rag")
+            except ComponentUnavailable as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            try:
+                data = ChatInput(**payload)
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": f"Mensaje inválido: {e}"})
+                continue
+            try:
+                session, memory = await prepare_chat(data)
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+            inputs = {"question": data.query, "history": memory.text}
+            on_done = lambda answer: record_turn(session, data.query, answer, memory)
+            async for message in stream_chain(rag_chain, inputs, rag_response_cache, current_kb_version(), on_done,
+                                              scope="chat"):
+                if message["type"] == "done":
+                    message["user_query"] = data.query
+                await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
 
 # --- 5. Ejecución ---
 if __name__ == "__main__":
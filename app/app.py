@@ -29,7 +29,13 @@ if project_root not in sys.path:
 
 # --- Importaciones de Librerías y Lógica ---
 try:
-    from src.inference import load_ml_model, load_rag_system, get_risk_score, generate_rag_response
+    from src.inference import load_ml_model, load_feature_transformer, load_rag_system, get_risk_score, generate_rag_response
+    from src.pred_cache import current_model_version
+    from src.audit import log_chat, log_prediction
+    from src.memory import count_tokens
+    from src.rag import current_index_version
+    from src.sessions import make_session_store
+    from src.transformer import COLS_RAW, FEATURE_NAMES
     from src.prompts import RAG_PROMPT_TEMPLATE 
 
 except ImportError as e:
@@ -41,11 +47,8 @@ except ImportError as e:
 
 RISK_THRESHOLD_HIGH = 0.65 
 MODEL_PATH = "models/hypertension_model.joblib"
-# CRÍTICO: COLUMNAS ESPERADAS POR EL MODELO ML
-FEATURE_COLS = [
-    'Age', 'Gender', 'Weight_kg', 'Height_m', 'Sleep_Hours', 
-    'Cigarettes_Day', 'Days_MVPA_Week', 'Fruit_Veg_Portions', 'Waist_cm'
-]
+# CRÍTICO: COLUMNAS ESPERADAS POR EL MODELO ML (las genera el transformador de src/transformer.py)
+FEATURE_COLS = list(FEATURE_NAMES)
 
 
 st.set_page_config(
@@ -86,8 +89,12 @@ st.markdown("""
 # --- FUNCIONES DE CARGA Y CACHÉ ---
 
 @st.cache_resource
-def get_ml_model():
-    """Carga el modelo de Machine Learning y lo cachea para eficiencia."""
+def get_ml_model(model_version: str):
+    """
+    Carga el modelo de Machine Learning y lo cachea para eficiencia.
+    'model_version' forma parte de la clave del caché: si el artefacto
+    cambia en disco, se recarga.
+    """
     try:
         model = load_ml_model(MODEL_PATH) 
         return model
@@ -96,8 +103,17 @@ def get_ml_model():
         return None
 
 @st.cache_resource
-def get_rag_system():
-    """Carga el sistema RAG (retriever y LLM) y lo cachea."""
+def get_feature_transformer():
+    """Carga el transformador de features ajustado en train y lo cachea."""
+    return load_feature_transformer()
+
+@st.cache_resource
+def get_rag_system(index_version: Optional[str]):
+    """
+    Carga el sistema RAG (retriever y LLM) desde el índice prebuilt y lo
+    cachea. 'index_version' (manifiesto) es parte de la clave: si se
+    reconstruye el índice, se recarga.
+    """
     try:
         retriever, llm = load_rag_system()
         return retriever, llm
@@ -105,6 +121,11 @@ def get_rag_system():
         print(f"Error al cargar RAG System en app: {e}")
         return None, None
 
+@st.cache_resource
+def get_session_store():
+    """Store de sesiones de chat (src/sessions.py): en st.session_state solo queda el session_id."""
+    return make_session_store()
+
 # --- GENERACIÓN DE PDF (Se mantiene) ---
 
 def create_pdf_report(user_data: Dict[str, Any], risk_score: float, drivers: List[str], plan_content: str) -> bytes:
@@ -167,12 +188,14 @@ def main():
     st.markdown("---")
 
     # 1. Carga de Modelos
-    ml_model = get_ml_model() 
-    retriever, llm = get_rag_system() 
+    model_version = current_model_version()
+    ml_model = get_ml_model(model_version) 
+    feature_transformer = get_feature_transformer()
+    retriever, llm = get_rag_system(current_index_version()) 
 
     # 2. Sidebar para Configuración/Estado
     st.sidebar.markdown("## ⚙️ Estado del Sistema Híbrido")
-    st.sidebar.markdown(f"**Estado del Modelo ML:** {'✅ Listo' if ml_model is not None else '❌ No Cargado'}")
+    st.sidebar.markdown(f"**Estado del Modelo ML:** {'✅ Listo' if ml_model is not None and feature_transformer is not None else '❌ No Cargado'}")
     # CRÍTICO: Si falló, mostramos el mensaje de que la clave NO fue inyectada
     if retriever is None or llm is None:
         st.sidebar.markdown(f"**Estado del Sistema RAG:** ❌ No Cargado (Clave no inyectada en el entorno)")
@@ -205,23 +228,26 @@ def main():
             user_data['fruit_veg_portions_day'] = st.slider("Porciones Frutas/Verduras/Día", min_value=0.0, max_value=12.0, value=5.0, step=0.5)
 
         
+        # Perfil crudo con los códigos NHANES que espera el transformador
         ml_features = {
-            'Age': user_data['age'], 
-            'Gender': user_data['sex_code'], 
-            'Weight_kg': user_data['weight_kg'],
-            'Height_m': user_data['height_cm'] / 100, 
-            'Sleep_Hours': user_data['sleep_hours'],
-            'Cigarettes_Day': user_data['smokes_cig_day'],
-            'Days_MVPA_Week': user_data['days_mvpa_week'],
-            'Fruit_Veg_Portions': user_data['fruit_veg_portions_day'],
-            'Waist_cm': user_data['waist_cm']
+            COLS_RAW['age']: user_data['age'],
+            COLS_RAW['sex']: 1 if user_data['sex'] == 'Masculino' else 2,  # RIAGENDR: 1=Hombre, 2=Mujer
+            COLS_RAW['height']: user_data['height_cm'],
+            COLS_RAW['weight']: user_data['weight_kg'],
+            COLS_RAW['waist']: user_data['waist_cm'],
+            COLS_RAW['sleep_hours']: user_data['sleep_hours'],
+            COLS_RAW['is_smoker']: 1 if user_data['smokes_cig_day'] > 0 else 2,  # SMQ020: 1=Sí, 2=No
+            COLS_RAW['activity_days']: 1 if user_data['days_mvpa_week'] > 0 else 2,  # PAQ650: 1=Sí, 2=No
         }
         
         if st.button("📊 Estimar Riesgo Cardiometabólico", type="primary"):
             if ml_model is not None:
-                risk_score_value = get_risk_score(ml_model, ml_features, FEATURE_COLS) 
+                risk_score_value = get_risk_score(ml_model, ml_features, feature_transformer, model_version) 
 
                 if risk_score_value >= 0:
+                    # Auditoría en app/results.csv (en cola; la escribe un hilo de fondo)
+                    features = dict(zip(feature_transformer.features, feature_transformer.transform_one(ml_features)))
+                    log_prediction(features, risk_score_value, int(risk_score_value > 0.5))
                     drivers = get_mock_drivers(user_data) 
                     st.session_state['risk_score'] = risk_score_value
                     st.session_state['drivers'] = drivers
@@ -280,19 +306,23 @@ def main():
             st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
             st.markdown("### 💬 Coach IA: Preguntas y Plan de Acción")
             
-            if 'messages' not in st.session_state:
-                st.session_state.messages = []
+            session_store = get_session_store()
+            session = session_store.get(st.session_state.get('session_id', ''))
+            if session is None:
+                # Sesión nueva (o expirada): el historial vive en el store, no en st.session_state
+                session = session_store.create()
+                st.session_state['session_id'] = session.session_id
                 initial_message = f"Hola! Soy tu Coach de Bienestar NexusByte. Acabas de obtener un riesgo de **{risk_score:.2f}**. Mi objetivo es ayudarte a crear un plan de 2 semanas basado en tus factores clave ({', '.join(drivers)}). ¿Qué pregunta tienes o quieres que **genere tu plan de inmediato**?"
-                st.session_state.messages.append({"role": "assistant", "content": initial_message})
+                session.messages.append({"role": "assistant", "content": initial_message})
+                session_store.save(session)
 
             
-            for message in st.session_state.messages:
+            for message in session.messages:
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
 
             if prompt := st.chat_input("Pregúntale a tu Coach (ej: 'Quiero mi plan de 2 semanas')"):
                 
-                st.session_state.messages.append({"role": "user", "content": prompt})
                 with st.chat_message("user"):
                     st.markdown(prompt)
 
@@ -317,7 +347,14 @@ def main():
                             st.session_state['plan_content'] = response
                             st.info("✅ Plan de acción guardado. Ya puedes descargar el PDF.")
                             
-                    st.session_state.messages.append({"role": "assistant", "content": response})
+                    log_chat(llm_query, response, session_id=session.session_id)
+                    # update(): la API puede estar guardando turnos en la misma sesión (store SQLite compartido)
+                    tokens_in, tokens_out = count_tokens(prompt), count_tokens(response)
+                    saved = session_store.update(
+                        session.session_id, lambda current: current.add_turn(prompt, response, tokens_in, tokens_out))
+                    if saved is None:
+                        st.warning("La sesión expiró: este turno no quedó guardado en el historial.")
+                        st.session_state.pop('session_id', None)
             
             st.markdown("</div>", unsafe_allow_html=True)
 
@@ -0,0 +1,346 @@
+# Contenido para: src/audit.py
+#
+# Bitácoras de auditoría: app/results.csv (cada predicción) y app/logs.jsonl
+# (cada turno del chat).
+#
+# Escribir en disco dentro de la petición suma la latencia del disco a la del
+# usuario, y varios workers escribiendo el mismo archivo pueden mezclar sus
+# líneas. Aquí:
+#   - log_prediction() / log_chat() solo encolan (cola acotada en memoria).
+#   - Un hilo de fondo por archivo junta lotes (hasta FLUSH_INTERVAL_S o
+#     MAX_BATCH registros) y los escribe con un solo write + fsync.
+#   - Cada lote se escribe con flock sobre '<archivo>.lock': los workers de
+#     otros procesos no intercalan líneas ni rotan a mitad de una escritura.
+#   - Rotación por tamaño (MAX_BYTES) y por tiempo (ROTATE_INTERVAL_S, al
+#     cambiar de período): el archivo pasa a '<archivo>.<fecha>' y se
+#     comprime a .gz; se conservan BACKUP_COUNT rotaciones.
+#   - Cola llena: 'drop' descarta el registro (y lo cuenta) o 'block' espera
+#     hasta BLOCK_TIMEOUT_S (en el threadpool si se llama desde un event loop).
+#     Profundidad de cola y descartes van a /metrics.
+
+import asyncio
+import atexit
+import csv
+import datetime
+import glob
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.metrics import REGISTRY
+
+try:
+    import fcntl  # POSIX: bloqueo entre procesos
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# --- Configuración ---
+ENABLED = os.getenv("NEXUSBYTE_AUDIT", "1") == "1"
+RESULTS_PATH = os.getenv("NEXUSBYTE_AUDIT_RESULTS", os.path.join("app", "results.csv"))
+CHAT_LOG_PATH = os.getenv("NEXUSBYTE_AUDIT_CHAT_LOG", os.path.join("app", "logs.jsonl"))
+QUEUE_SIZE = int(os.getenv("NEXUSBYTE_AUDIT_QUEUE", "10000"))
+POLICY = os.getenv("NEXUSBYTE_AUDIT_POLICY", "drop")  # drop | block
+BLOCK_TIMEOUT_S = float(os.getenv("NEXUSBYTE_AUDIT_BLOCK_TIMEOUT_S", "1.0"))
+FLUSH_INTERVAL_S = float(os.getenv("NEXUSBYTE_AUDIT_FLUSH_S", "0.5"))
+MAX_BATCH = int(os.getenv("NEXUSBYTE_AUDIT_MAX_BATCH", "1000"))
+MAX_BYTES = int(os.getenv("NEXUSBYTE_AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))  # 0 = sin límite
+ROTATE_INTERVAL_S = float(os.getenv("NEXUSBYTE_AUDIT_ROTATE_S", str(24 * 3600)))  # 0 = sin rotación por tiempo
+BACKUP_COUNT = int(os.getenv("NEXUSBYTE_AUDIT_BACKUPS", "30"))  # 0 = conservar todas
+
+_STOP = object()
+
+_QUEUE_DEPTH = REGISTRY.gauge(
+    "nexusbyte_audit_queue_depth", "Registros de auditoría en cola, pendientes de escribir.", ("log",))
+_RECORDS = REGISTRY.counter(
+    "nexusbyte_audit_records_total", "Registros de auditoría (escritos, descartados por cola llena, fallidos).",
+    ("log", "result"))
+_FLUSH_SECONDS = REGISTRY.histogram(
+    "nexusbyte_audit_flush_seconds", "Tiempo de escritura + fsync por lote.", ("log",))
+_BATCH_SIZE = REGISTRY.histogram(
+    "nexusbyte_audit_batch_records", "Registros por lote escrito.", ("log",),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+_ROTATIONS = REGISTRY.counter("nexusbyte_audit_rotations_total", "Rotaciones de bitácoras.", ("log",))
+
+
+class AuditWriter:
+    """
+    Escritor en segundo plano para un archivo 'jsonl' o 'csv'. En CSV, las
+    columnas son las del encabezado existente o, si el archivo es nuevo,
+    'fieldnames' (por defecto, las claves del primer registro).
+    """
+
+    def __init__(self, path: str, kind: str = "jsonl", fieldnames: Optional[Sequence[str]] = None,
+                 queue_size: int = QUEUE_SIZE, policy: str = POLICY, block_timeout_s: float = BLOCK_TIMEOUT_S,
+                 flush_interval_s: float = FLUSH_INTERVAL_S, max_batch: int = MAX_BATCH,
+                 max_bytes: int = MAX_BYTES, rotate_interval_s: float = ROTATE_INTERVAL_S,
+                 backup_count: int = BACKUP_COUNT):
+        if kind not in ("jsonl", "csv"):
+            raise ValueError(f"Formato de auditoría inválido: '{kind}'. Opciones: jsonl, csv")
+        if policy not in ("drop", "block"):
+            raise ValueError(f"NEXUSBYTE_AUDIT_POLICY inválido: '{policy}'. Opciones: drop, block")
+        self.path = path
+        self.kind = kind
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.rotate_interval_s = rotate_interval_s
+        self.backup_count = backup_count
+        self.name = os.path.basename(path)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        self._ignored_fields: set = set()  # Columnas que no están en el encabezado (ya avisadas)
+        _QUEUE_DEPTH.labels(log=self.name).set_function(self._queue.qsize)
+
+    # --- Productores (ruta de la petición) ---
+    def write(self, record: Dict[str, Any]) -> bool:
+        """
+        Encola el registro; False si se descartó por cola llena. Nunca bloquea
+        un event loop: con 'block' y la cola llena, dentro de un handler async
+        la espera pasa al threadpool (un descarte por timeout solo se ve en
+        /metrics); fuera de un loop (handlers sync, scripts) espera aquí.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            pass
+        if self.policy == "block":
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self._put_blocking(record)
+            loop.run_in_executor(None, self._put_blocking, record)
+            return True
+        _RECORDS.labels(log=self.name, result="dropped").inc()
+        return False
+
+    def _put_blocking(self, record: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put(record, timeout=self.block_timeout_s)
+            return True
+        except queue.Full:
+            _RECORDS.labels(log=self.name, result="dropped").inc()
+            return False
+
+    def flush(self) -> None:
+        """Espera a que todo lo encolado hasta ahora esté escrito en disco."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Escribe lo pendiente y detiene el hilo."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _ensure_started(self) -> None:
+        # Tras un fork (p.ej. gunicorn --preload) el hilo no existe en el hijo, y
+        # el descriptor del lock se comparte con el padre: se rearma todo.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._thread is not None:
+                # Hijo de un fork: cola propia y descriptor de lock propio
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                _QUEUE_DEPTH.labels(log=self.name).set_function(self._queue.qsize)
+                if self._lock_fd is not None:
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"nexusbyte-audit-{self.name}", daemon=True)
+            self._thread.start()
+
+    # --- Hilo escritor ---
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while batch[-1] is not _STOP and len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                self._write_batch(records)
+            for _ in batch:
+                self._queue.task_done()
+            if len(records) != len(batch):
+                return
+
+    def _write_batch(self, records: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        rotated = None
+        try:
+            with self._file_lock():
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                data = self._encode(records, size)
+                rotated = self._maybe_rotate(size, len(data))
+                if rotated is not None:
+                    data = self._encode(records, 0)  # Archivo nuevo: el CSV lleva encabezado
+                self._append(data)
+        except Exception as e:
+            # Cualquier error (disco, encabezado CSV ilegible, ...) pierde solo este lote: el hilo sigue vivo
+            _RECORDS.labels(log=self.name, result="failed").inc(len(records))
+            print(f"ERROR al escribir la bitácora {self.path}: {type(e).__name__}: {e}")
+            return
+        _FLUSH_SECONDS.labels(log=self.name).observe(time.perf_counter() - start)
+        _BATCH_SIZE.labels(log=self.name).observe(len(records))
+        _RECORDS.labels(log=self.name, result="written").inc(len(records))
+        if rotated is not None:
+            # Fuera del lock: comprimir no bloquea a los demás procesos
+            self._compress(rotated)
+
+    def _encode(self, records: List[Dict[str, Any]], size: int) -> bytes:
+        if self.kind == "jsonl":
+            return "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records).encode("utf-8")
+        if self.fieldnames is None:
+            self.fieldnames = self._read_header() if size else None
+        if self.fieldnames is None:
+            self.fieldnames = list(records[0])
+        ignored = {key for r in records for key in r} - set(self.fieldnames) - self._ignored_fields
+        if ignored:
+            # El encabezado existente manda; si las columnas cambiaron (p.ej. otro modelo), se avisa una vez
+            self._ignored_fields |= ignored
+            print(f"AVISO: {self.path}: columnas {sorted(ignored)} fuera del encabezado {self.fieldnames}; "
+                  f"no se escriben (rota o mueve el archivo para cambiar el encabezado).")
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.fieldnames, extrasaction="ignore", lineterminator="\n")
+        if size == 0:
+            writer.writeheader()
+        writer.writerows(records)
+        return buffer.getvalue().encode("utf-8")
+
+    def _read_header(self) -> Optional[List[str]]:
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            header = next(csv.reader(f), None)
+        return header or None
+
+    def _append(self, data: bytes) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            os.fsync(fd)  # Un fsync por lote
+        finally:
+            os.close(fd)
+
+    # --- Bloqueo entre procesos ---
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # --- Rotación ---
+    def _maybe_rotate(self, size: int, incoming: int) -> Optional[str]:
+        # Con el lock tomado: otro proceso puede haber rotado ya (size == 0)
+        if size == 0:
+            return None
+        mtime = os.path.getmtime(self.path)
+        by_size = self.max_bytes > 0 and size + incoming > self.max_bytes
+        by_time = (self.rotate_interval_s > 0
+                   and int(mtime // self.rotate_interval_s) != int(time.time() // self.rotate_interval_s))
+        if not (by_size or by_time):
+            return None
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(mtime))
+        target, n = f"{self.path}.{stamp}", 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target, n = f"{self.path}.{stamp}.{n}", n + 1
+        os.replace(self.path, target)
+        _ROTATIONS.labels(log=self.name).inc()
+        return target
+
+    def _compress(self, rotated: str) -> None:
+        try:
+            tmp = rotated + ".gz.tmp"
+            with open(rotated, "rb") as src, gzip.open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp, rotated + ".gz")
+            os.remove(rotated)
+            if self.backup_count > 0:
+                backups = sorted(glob.glob(glob.escape(self.path) + ".*.gz"), key=os.path.getmtime)
+                for old in backups[:-self.backup_count]:
+                    os.remove(old)
+        except Exception as e:
+            print(f"AVISO: no se pudo comprimir la rotación {rotated}: {e}")
+
+
+# --- Bitácoras de la app ---
+_writers: Dict[str, AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str, kind: str) -> AuditWriter:
+    """Un escritor por archivo y proceso."""
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = AuditWriter(path, kind)
+        return writer
+
+
+def _timestamp() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+def log_prediction(features: Dict[str, float], risk_score: float, prediction: int, **extra) -> bool:
+    """Fila para results.csv: features, risk_score, prediction, timestamp."""
+    if not ENABLED:
+        return False
+    record = dict(features, risk_score=risk_score, prediction=prediction, timestamp=_timestamp(), **extra)
+    return get_writer(RESULTS_PATH, "csv").write(record)
+
+
+def log_chat(prompt: str, response: str, **extra) -> bool:
+    """Línea para logs.jsonl: timestamp, prompt, response (+ origen, sesión, ...)."""
+    if not ENABLED:
+        return False
+    return get_writer(CHAT_LOG_PATH, "jsonl").write(
+        dict(timestamp=_timestamp(), prompt=prompt, response=response, **extra))
+
+
+def flush_all() -> None:
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+@atexit.register
+def close_all() -> None:
+    """Al salir: escribe lo pendiente de todas las bitácoras."""
+    for writer in list(_writers.values()):
+        writer.close()
@@ -0,0 +1,223 @@
+# Contenido para: src/batch_scoring.py
+#
+# Scoring por lotes para POST /predict/batch (api/main.py).
+#
+# Acepta una lista de perfiles crudos en tres formatos:
+#   - application/json:                  [ {...}, {...} ] o {"profiles": [...]}
+#   - application/x-ndjson:              un perfil JSON por línea
+#   - application/vnd.apache.arrow.stream (o .file): tabla Arrow IPC
+# Las claves/columnas pueden ser los nombres genéricos de la API (age, sex,
+# height...) o las columnas NHANES (RIDAGEYR, RIAGENDR, BMXHT...).
+#
+# Los perfiles se agrupan en bloques de CHUNK_ROWS filas; cada bloque pasa
+# por el transformador de features y UNA llamada vectorizada a predict_proba,
+# y sus resultados se devuelven como NDJSON apenas están listos. Así la
+# memoria depende del tamaño del bloque, no del de la subida (NDJSON y Arrow
+# se vuelcan a disco y se leen de forma incremental; el JSON clásico tiene
+# un tope de tamaño).
+
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from starlette.concurrency import run_in_threadpool
+
+from src.transformer import COLS_RAW
+
+# --- Configuración ---
+CHUNK_ROWS = int(os.getenv("NEXUSBYTE_BATCH_CHUNK_ROWS", "5000"))
+MAX_JSON_BYTES = int(os.getenv("NEXUSBYTE_BATCH_MAX_JSON_MB", "32")) * 1024 * 1024
+# Cuerpos NDJSON/Arrow más grandes que esto se vuelcan a disco mientras se reciben
+SPOOL_BYTES = 8 * 1024 * 1024
+
+JSON_TYPES = ("application/json",)
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
+ARROW_STREAM_TYPES = ("application/vnd.apache.arrow.stream",)
+ARROW_FILE_TYPES = ("application/vnd.apache.arrow.file",)
+
+# Columna opcional que se devuelve tal cual para identificar cada fila
+ID_FIELDS = ("id", "SEQN")
+THRESHOLD = 0.5  # Igual que model.predict
+
+
+class BatchInputError(ValueError):
+    """Cuerpo del lote inválido (formato o JSON mal formado)."""
+
+
+class BatchTooLargeError(BatchInputError):
+    """El cuerpo JSON supera MAX_JSON_BYTES."""
+
+
+def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Renombra las claves genéricas de la API a las columnas NHANES."""
+    rename = {key: raw for key, raw in COLS_RAW.items() if key in df.columns and raw not in df.columns}
+    return df.rename(columns=rename) if rename else df
+
+
+def _records_to_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    if any(not isinstance(r, dict) for r in records):
+        raise BatchInputError("Cada perfil debe ser un objeto JSON.")
+    return normalize_columns(pd.DataFrame.from_records(records))
+
+
+def _chunked(records: List[Any], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, len(records), chunk_rows):
+        yield _records_to_frame(records[start:start + chunk_rows])
+
+
+# --- Lectores por formato (todos entregan DataFrames de <= chunk_rows filas) ---
+async def read_limited(stream: AsyncIterator[bytes], limit: int = MAX_JSON_BYTES) -> bytes:
+    """Lee el cuerpo completo, con un tope de tamaño."""
+    parts, size = [], 0
+    async for part in stream:
+        size += len(part)
+        if size > limit:
+            raise BatchTooLargeError(f"El cuerpo JSON supera {limit // (1024 * 1024)} MB; usa NDJSON o Arrow.")
+        parts.append(part)
+    return b"".join(parts)
+
+
+def json_frames(body: bytes, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    try:
+        payload = json.loads(body or b"[]")
+    except json.JSONDecodeError as e:
+        raise BatchInputError(f"JSON inválido: {e}")
+    if isinstance(payload, dict):
+        payload = payload.get("profiles")
+    if not isinstance(payload, list):
+        raise BatchInputError("Se esperaba una lista de perfiles (o {\"profiles\": [...]}).")
+    return _chunked(payload, chunk_rows)
+
+
+def ndjson_frames(source, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Lee el NDJSON línea a línea; nunca guarda más de un bloque de perfiles."""
+    records = []
+    for line_no, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise BatchInputError(f"Línea {line_no}: JSON inválido ({e}).")
+        if len(records) >= chunk_rows:
+            yield _records_to_frame(records)
+            records = []
+    if records:
+        yield _records_to_frame(records)
+
+
+async def spool_body(stream: AsyncIterator[bytes]):
+    """
+    Guarda el cuerpo en un archivo temporal (en memoria hasta SPOOL_BYTES).
+    Se recibe completo antes de responder: StreamingResponse escucha la
+    desconexión del cliente por el mismo canal, así que el cuerpo no se
+    puede seguir leyendo mientras se emite la respuesta.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        async for part in stream:
+            spool.write(part)
+    except BaseException:
+        spool.close()  # Cliente desconectado a mitad de la subida: no dejar el temporal abierto
+        raise
+    spool.seek(0)
+    return spool
+
+
+def arrow_frames(source, file_format: bool = False, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Lee los record batches de un cuerpo Arrow IPC y los re-agrupa en bloques."""
+    try:
+        reader = pa.ipc.open_file(source) if file_format else pa.ipc.open_stream(source)
+    except pa.ArrowInvalid as e:
+        raise BatchInputError(f"Cuerpo Arrow IPC inválido: {e}")
+    batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) if file_format else reader
+    for batch in batches:
+        for start in range(0, batch.num_rows, chunk_rows):
+            yield normalize_columns(batch.slice(start, chunk_rows).to_pandas())
+
+
+_END = object()
+
+
+async def as_async(frames: Iterable[pd.DataFrame],
+                   close: Optional[Callable[[], None]] = None) -> AsyncIterator[pd.DataFrame]:
+    """
+    Recorre un lector sync en el threadpool (json.loads por línea y la
+    decodificación Arrow no corren en el event loop). 'close' (p.ej. el
+    archivo de spool_body) se llama al terminar, también si se corta antes.
+    """
+    frames = iter(frames)
+    try:
+        while True:
+            frame = await run_in_threadpool(next, frames, _END)
+            if frame is _END:
+                return
+            yield frame
+    finally:
+        if close is not None:
+            close()
+
+
+# --- Scoring y salida ---
+def _row_ids(df: pd.DataFrame) -> Optional[list]:
+    for field in ID_FIELDS:
+        if field in df.columns:
+            return df[field].astype(object).where(df[field].notna(), None).tolist()
+    return None
+
+
+def _format_chunk(scores: np.ndarray, ids: Optional[list], offset: int) -> bytes:
+    lines = []
+    for i, score in enumerate(scores.tolist()):
+        item = {"row": offset + i, "risk_score": score, "prediction": int(score > THRESHOLD)}
+        if ids is not None:
+            item["id"] = ids[i]
+        lines.append(json.dumps(item))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def stream_scores(frames: AsyncIterator[pd.DataFrame],
+                        score_frame: Callable[[pd.DataFrame], np.ndarray],
+                        payload_format: str) -> AsyncIterator[bytes]:
+    """
+    Puntúa bloque a bloque (en un hilo, para no bloquear el event loop) y
+    emite una línea NDJSON por perfil. La última línea es un resumen con
+    el throughput de la petición; un error a mitad de camino se informa
+    como una línea {"error": ...}.
+    """
+    start = time.perf_counter()
+    rows = chunks = 0
+    score_s = 0.0
+    error = None
+    try:
+        async for frame in frames:
+            if len(frame) == 0:
+                continue
+            t0 = time.perf_counter()
+            scores = await run_in_threadpool(score_frame, frame)
+            score_s += time.perf_counter() - t0
+            yield _format_chunk(np.asarray(scores, dtype=np.float64), _row_ids(frame), rows)
+            rows += len(frame)
+            chunks += 1
+    except BatchInputError as e:
+        error = str(e)
+    except Exception as e:
+        error = f"Error en predicción: {e}"
+    if error:
+        yield (json.dumps({"error": error, "rows_scored": rows}) + "\n").encode("utf-8")
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "format": payload_format,
+        "rows": rows,
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 4),
+        "scoring_s": round(score_s, 4),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    yield (json.dumps({"summary": summary}) + "\n").encode("utf-8")
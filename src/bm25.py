@@ -0,0 +1,236 @@
+# Contenido para: src/bm25.py
+#
+# Recuperador léxico BM25 local para la base de conocimiento (data/kb).
+#
+# La KB es chica (unas pocas fichas en español), así que no hace falta pagar
+# un embedding de OpenAI (ida y vuelta por la red) en cada pregunta: un índice
+# invertido BM25 en memoria responde en microsegundos.
+#   - Tokenización para español: minúsculas, sin tildes (presión == presion),
+#     sin stopwords y con un recorte simple de plurales (grasas == grasa).
+#   - Índice compacto en disco (models/bm25_index.npz): vocabulario + postings
+#     en formato CSR con el peso BM25 ya calculado por (término, chunk), así una
+#     consulta es solo sumar unas pocas rebanadas de arrays.
+#   - src/build_rag.py lo construye con los mismos chunks que el índice FAISS.
+#
+# api/main.py elige el retriever con NEXUSBYTE_RETRIEVER:
+#   vector (FAISS, por defecto) | bm25 | hybrid (fusión de ambos rankings)
+
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- Configuración ---
+BM25_PATH = os.path.join("models", "bm25_index.npz")
+RETRIEVER_MODE = os.getenv("NEXUSBYTE_RETRIEVER", "vector")  # vector | bm25 | hybrid
+RETRIEVER_MODES = ("vector", "bm25", "hybrid")
+TOP_K = int(os.getenv("NEXUSBYTE_RETRIEVER_K", "4"))  # Igual que as_retriever() por defecto
+K1 = 1.5
+B = 0.75
+HYBRID_WEIGHT = float(os.getenv("NEXUSBYTE_HYBRID_WEIGHT", "0.5"))  # Peso de BM25 en la fusión
+RRF_K = 60  # Constante estándar de Reciprocal Rank Fusion
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales
+cuando de del desde donde durante e el ella ellas ello ellos en entre era eran es esa
+esas ese eso esos esta estan estas este esto estos fue fueron ha han hasta hay la las
+le les lo los mas me mi mis muy ni no nos o os otra otras otro otros para pero poco
+por porque que se sea sean segun ser si sin sobre son su sus tambien te tiene tienen
+todo todos tu tus u un una unas uno unos y ya yo
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Quita tildes y diéresis (NFKD sin marcas combinantes): 'presión' -> 'presion'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _light_stem(token: str) -> str:
+    # Plurales regulares: 'grasas' -> 'grasa', 'presiones' -> 'presion'
+    if len(token) > 5 and token.endswith("es") and token[-3] not in "aeiou":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados para BM25 (mismo proceso para chunks y preguntas)."""
+    text = fold_accents((text or "").casefold())
+    return [_light_stem(tok) for tok in _TOKEN_RE.findall(text) if tok not in STOPWORDS]
+
+
+@dataclass
+class BM25Index:
+    """Índice invertido con pesos BM25 precalculados (CSR por término)."""
+    vocab: Dict[str, int]
+    indptr: np.ndarray      # int64 [n_terms + 1]
+    doc_ids: np.ndarray     # int32 [n_postings]
+    weights: np.ndarray     # float32 [n_postings]: idf * tf saturado
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+
+    @classmethod
+    def build(cls, texts: Sequence[str], metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+              k1: float = K1, b: float = B) -> "BM25Index":
+        texts = list(texts)
+        metadatas = [dict(m) for m in metadatas] if metadatas is not None else [{} for _ in texts]
+        term_freqs = [Counter(tokenize(t)) for t in texts]
+        doc_len = np.array([sum(tf.values()) for tf in term_freqs], dtype=np.float64)
+        avg_len = float(doc_len.mean()) if len(texts) and doc_len.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, tf in enumerate(term_freqs):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        n_docs = len(texts)
+        vocab, indptr, doc_ids, weights = {}, [0], [], []
+        for term in sorted(postings):
+            plist = postings[term]
+            idf = np.log(1.0 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            ids = np.array([d for d, _ in plist], dtype=np.int32)
+            tf = np.array([c for _, c in plist], dtype=np.float64)
+            norm = k1 * (1.0 - b + b * doc_len[ids] / avg_len)
+            vocab[term] = len(vocab)
+            doc_ids.append(ids)
+            weights.append((idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+            indptr.append(indptr[-1] + len(ids))
+
+        return cls(
+            vocab=vocab,
+            indptr=np.array(indptr, dtype=np.int64),
+            doc_ids=np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            texts=texts,
+            metadatas=metadatas,
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """Score BM25 de cada chunk para la pregunta."""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for term, qtf in Counter(tokenize(query)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            np.add.at(scores, self.doc_ids[start:end], qtf * self.weights[start:end])
+        return scores
+
+    def search(self, query: str, k: int = TOP_K) -> List[Tuple[int, float]]:
+        """Los k mejores chunks (índice, score), solo los que comparten algún término."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        order = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def document(self, doc_id: int) -> Document:
+        return Document(page_content=self.texts[doc_id], metadata=dict(self.metadatas[doc_id]))
+
+    # --- Persistencia (npz sin pickle) ---
+    def save(self, path: str = BM25_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        np.savez_compressed(
+            path,
+            terms=np.array(terms, dtype=str),
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            weights=self.weights,
+            texts=np.array(self.texts, dtype=str),
+            metadatas=np.array(json.dumps(self.metadatas, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path: str = BM25_PATH) -> "BM25Index":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Índice BM25 no encontrado en {path}. Ejecuta src/build_rag.py.")
+        with np.load(path, allow_pickle=False) as data:
+            terms = data["terms"].tolist()
+            return cls(
+                vocab={term: i for i, term in enumerate(terms)},
+                indptr=data["indptr"],
+                doc_ids=data["doc_ids"],
+                weights=data["weights"],
+                texts=data["texts"].tolist(),
+                metadatas=json.loads(str(data["metadatas"])),
+            )
+
+
+class BM25Retriever(BaseRetriever):
+    """Retriever de LangChain sobre un BM25Index (sin red, sin embeddings)."""
+    index: BM25Index
+    k: int = TOP_K
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.index.document(doc_id) for doc_id, _ in self.index.search(query, self.k)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fusión de BM25 y FAISS con Reciprocal Rank Fusion ponderada: los scores
+    BM25 y las distancias L2 de FAISS no están en la misma escala, los rankings sí.
+    """
+    index: BM25Index
+    vectorstore: Any
+    k: int = TOP_K
+    fetch_k: int = 2 * TOP_K
+    weight: float = HYBRID_WEIGHT
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _fuse(self, lexical: List[Document], semantic: List[Document]) -> List[Document]:
+        fused: Dict[str, Tuple[float, Document]] = {}
+        for weight, docs in ((self.weight, lexical), (1.0 - self.weight, semantic)):
+            for rank, doc in enumerate(docs):
+                score, _ = fused.get(doc.page_content, (0.0, doc))
+                fused[doc.page_content] = (score + weight / (RRF_K + rank + 1), doc)
+        ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in ranked[:self.k]]
+
+    def _lexical(self, query: str) -> List[Document]:
+        return [self.index.document(doc_id) for doc_id, _ in self.index.search(query, self.fetch_k)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._fuse(self._lexical(query), self.vectorstore.similarity_search(query, k=self.fetch_k))
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        semantic = await self.vectorstore.asimilarity_search(query, k=self.fetch_k)
+        return self._fuse(self._lexical(query), semantic)
+
+
+def build_bm25_index(documents: Sequence[Document], path: str = BM25_PATH) -> BM25Index:
+    """Construye y guarda el índice a partir de los chunks (los mismos que FAISS)."""
+    index = BM25Index.build([d.page_content for d in documents], [d.metadata for d in documents])
+    index.save(path)
+    return index
+
+
+def make_retriever(mode: str = RETRIEVER_MODE, vectorstore=None, bm25_path: str = BM25_PATH,
+                   k: int = TOP_K) -> BaseRetriever:
+    """Retriever para el RAG chain según el modo (vector | bm25 | hybrid)."""
+    if mode not in RETRIEVER_MODES:
+        raise ValueError(f"NEXUSBYTE_RETRIEVER inválido: '{mode}'. Opciones: {', '.join(RETRIEVER_MODES)}")
+    if mode == "vector":
+        return vectorstore.as_retriever(search_kwargs={"k": k})
+    index = BM25Index.load(bm25_path)
+    if mode == "bm25":
+        return BM25Retriever(index=index, k=k)
+    return HybridRetriever(index=index, vectorstore=vectorstore, k=k, fetch_k=2 * k)
@@ -1,9 +1,10 @@
 # Contenido para: src/build_rag.py (VERSIÓN CORREGIDA)
 
 import os
+import sys
+import time
 from dotenv import load_dotenv
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
@@ -18,54 +19,178 @@ PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
 # 3. Construir las rutas a 'data/kb' y 'models/' desde la raíz
 KB_DIR = os.path.join(PROJECT_ROOT, "data/kb")
 FAISS_PATH = os.path.join(PROJECT_ROOT, "models/faiss_index") # El "cerebro" cocinado se guarda aquí
+BM25_PATH = os.path.join(PROJECT_ROOT, "models/bm25_index.npz") # Índice léxico (no usa la API)
+EMBEDDING_CACHE_PATH = os.path.join(PROJECT_ROOT, "models/embedding_cache.sqlite") # Vectores ya pagados
 
 # 4. Cargar el .env desde la raíz del proyecto
 load_dotenv(os.path.join(PROJECT_ROOT, ".env"))
 
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
 
-def build_vector_store():
-    print("--- Iniciando construcción del Vector Store (RAG) ---")
-    
-    # 1. Cargar la API Key de OpenAI (de forma segura desde .env)
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print(f"ERROR: OPENAI_API_KEY no encontrada en {os.path.join(PROJECT_ROOT, '.env')}")
-        print("Asegúrate de tener un archivo .env en la raíz del proyecto.")
-        return
+from src.bm25 import build_bm25_index
+from src.embedding_cache import CachedEmbeddings, EmbeddingStore, chunk_id, embedding_model_name
+from src.providers import get_embeddings, is_configured
+from src.rag import IndexManifest, index_version, read_manifest, write_manifest
 
-    # 2. Cargar los documentos de la Base de Conocimiento
-    print(f"Cargando documentos desde {KB_DIR}...")
-    if not os.path.exists(KB_DIR):
-        print(f"ERROR: La ruta de KB no existe: {KB_DIR}")
-        return
+
+def load_kb_splits(kb_dir=KB_DIR):
+    """Documentos .txt de la KB divididos en chunks (None si no hay KB)."""
+    # 1. Cargar los documentos de la Base de Conocimiento
+    print(f"Cargando documentos desde {kb_dir}...")
+    if not os.path.exists(kb_dir):
+        print(f"ERROR: La ruta de KB no existe: {kb_dir}")
+        return None
         
     loader = DirectoryLoader(
-        KB_DIR, 
+        kb_dir, 
         glob="*.txt", 
         loader_cls=TextLoader, 
         loader_kwargs={'encoding': 'utf-8'}
     )
     docs = loader.load()
     if not docs:
-        print(f"ERROR: No se encontraron archivos .txt en {KB_DIR}")
-        return
+        print(f"ERROR: No se encontraron archivos .txt en {kb_dir}")
+        return None
     print(f"Se encontraron {len(docs)} documentos.")
 
-    # 3. Dividir los documentos en "chunks" (trozos)
+    # 2. Dividir los documentos en "chunks" (trozos)
     print("Dividiendo documentos en chunks...")
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
     splits = text_splitter.split_documents(docs)
+    if not splits:
+        print(f"ERROR: Los documentos de {kb_dir} están vacíos; no hay chunks que indexar.")
+        return None
+    return splits
+
+
+def build_vector_store():
+    print("--- Iniciando construcción del Vector Store (RAG) ---")
     
-    # 4. Crear los "Embeddings" (vectores) y FAISS
+    # 1-2. Documentos de la KB en chunks
+    splits = load_kb_splits(KB_DIR)
+    if splits is None:
+        return
+
+    # 3. Índice BM25 (local, sin API) con los mismos chunks que FAISS
+    bm25_index = build_bm25_index(splits, BM25_PATH)
+    print(f"✅ Índice BM25 guardado en: {BM25_PATH} ({len(bm25_index.vocab)} términos, {len(splits)} chunks)")
+
+    # 4. Cargar la API Key de OpenAI (de forma segura desde .env)
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not is_configured(api_key):
+        print(f"ERROR: OPENAI_API_KEY no encontrada en {os.path.join(PROJECT_ROOT, '.env')}")
+        print("Asegúrate de tener un archivo .env en la raíz del proyecto.")
+        print("AVISO: sin FAISS, solo queda disponible NEXUSBYTE_RETRIEVER=bm25.")
+        # El manifiesto nuevo ya no lista FAISS: un índice viejo en disco quedaría
+        # desalineado con los chunks de BM25, así que se borra
+        remove_faiss_index(FAISS_PATH)
+        save_manifest(splits, embedding_model="", faiss_built=False)
+        return
+
+    # 5. Crear los "Embeddings" (vectores) y FAISS
     # ¡ESTE PASO USA TU API KEY Y CUESTA DINERO! (muy poco)
-    print("Creando embeddings con OpenAI y guardando en FAISS...")
-    embeddings = OpenAIEmbeddings(openai_api_key=api_key)
-    vectorstore = FAISS.from_documents(splits, embeddings)
-    
-    # 5. Guardar el índice de FAISS localmente
-    vectorstore.save_local(FAISS_PATH)
-    
-    print(f"\n✅ ¡Éxito! Vector Store guardado en: {FAISS_PATH}")
+    # Solo se piden a OpenAI los chunks que no están en la caché de embeddings
+    store = EmbeddingStore(EMBEDDING_CACHE_PATH)
+    embeddings = CachedEmbeddings(get_embeddings(api_key=api_key), store=store)
+    changed = update_faiss_index(splits, embeddings, FAISS_PATH)
+    store.close()
+
+    # 6. Manifiesto: lo que cargan la API y la app (src/rag.py)
+    save_manifest(splits, embedding_model=embeddings.model, faiss_built=True)
+
+    if changed:
+        print(f"\n✅ ¡Éxito! Vector Store guardado en: {FAISS_PATH}")
+    else:
+        print(f"\n✅ Vector Store ya estaba al día: {FAISS_PATH}")
+
+
+def save_manifest(splits, embedding_model, faiss_built):
+    """Escribe el manifiesto solo si cambió la versión (mismo contenido -> mismo archivo)."""
+    version = index_version((chunk_id(doc) for doc in splits), embedding_model or "bm25")
+    try:
+        if read_manifest(FAISS_PATH).version == version:
+            print(f"Manifiesto sin cambios (versión {version}).")
+            return
+    except Exception:
+        pass
+    files = {"bm25": os.path.basename(BM25_PATH)}
+    if faiss_built:
+        files["faiss"] = os.path.basename(FAISS_PATH)
+    manifest = IndexManifest(version=version, embedding_model=embedding_model,
+                             n_chunks=len(splits), built_at=time.time(), files=files)
+    path = write_manifest(manifest, FAISS_PATH)
+    print(f"✅ Manifiesto del índice (versión {version}) guardado en: {path}")
+
+
+def remove_faiss_index(faiss_path=FAISS_PATH):
+    """Borra los archivos de FAISS (no el manifiesto, que vive en la misma carpeta)."""
+    removed = False
+    for name in ("index.faiss", "index.pkl"):
+        path = os.path.join(faiss_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    if removed:
+        print(f"AVISO: se eliminó el índice FAISS anterior de {faiss_path}.")
+    return removed
+
+
+def _same_embedding_model(faiss_path, embeddings):
+    """Los vectores de modelos distintos no se mezclan: si cambió el modelo, se reconstruye."""
+    try:
+        previous = read_manifest(faiss_path).embedding_model
+    except Exception:
+        return True  # Índice sin manifiesto (anterior a los manifiestos): se parcha
+    current = embedding_model_name(embeddings)
+    if previous and previous != current:
+        print(f"AVISO: el índice se construyó con '{previous}' y ahora se usa '{current}'; "
+              "se reconstruye completo.")
+        return False
+    return True
+
+
+def update_faiss_index(splits, embeddings, faiss_path=FAISS_PATH):
+    """
+    Parcha el índice FAISS existente: borra los chunks que ya no están y agrega
+    los nuevos (ids estables por contenido). Si nada cambió, no reescribe el
+    índice (así la caché de respuestas de la API sigue siendo válida).
+    Devuelve True si el índice se guardó.
+    """
+    if not splits:
+        raise ValueError("No hay chunks para el índice FAISS (FAISS no admite un índice vacío).")
+    ids = [chunk_id(doc) for doc in splits]
+    by_id = dict(zip(ids, splits))  # Chunks repetidos -> una sola entrada
+
+    vectorstore = None
+    if os.path.exists(os.path.join(faiss_path, "index.faiss")) and _same_embedding_model(faiss_path, embeddings):
+        vectorstore = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+        existing = set(vectorstore.index_to_docstore_id.values())
+    else:
+        existing = set()
+
+    to_delete = sorted(existing - by_id.keys())
+    to_add = [i for i in by_id if i not in existing]
+    print(f"Chunks: {len(by_id)} | sin cambios: {len(by_id) - len(to_add)} | "
+          f"nuevos: {len(to_add)} | eliminados: {len(to_delete)}")
+    if vectorstore is not None and not to_add and not to_delete:
+        return False
+
+    docs = [by_id[i] for i in to_add]
+    vectors = embeddings.embed_documents([d.page_content for d in docs])
+    text_embeddings = list(zip([d.page_content for d in docs], vectors))
+    metadatas = [d.metadata for d in docs]
+    if vectorstore is None:
+        vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=to_add)
+    else:
+        if to_delete:
+            vectorstore.delete(to_delete)
+        if to_add:
+            vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=to_add)
+
+    # Guardar el índice de FAISS localmente
+    vectorstore.save_local(faiss_path)
+    return True
 
 if __name__ == "__main__":
     build_vector_store()
\ No newline at end of file
@@ -0,0 +1,310 @@
+# Contenido para: src/compiled_model.py
+#
+# Evaluador "compilado" del modelo XGBoost de hipertensión para servir.
+#
+# Para una sola fila, el wrapper de sklearn (DataFrame -> DMatrix -> C++)
+# cuesta mucho más que recorrer los árboles: son ~30 árboles de 7 features.
+# Aquí el booster se exporta una vez (save_raw JSON) a arreglos planos
+# (feature, umbral, hijo izq./der., default_left, valor de hoja) y se evalúa:
+#   - predict_proba_one(fila): Python puro sobre listas, sin pandas ni DMatrix
+#   - predict_proba(X):        numpy vectorizado, nivel por nivel de los árboles
+# Respeta best_iteration (early stopping), el base_score del modelo y el
+# manejo de faltantes (NaN -> rama por defecto) de XGBoost. Las features se
+# leen por posición: row_from_features arma la fila por nombre (en el orden
+# de feature_names) y redondea a float32, como compara XGBoost los umbrales.
+#
+# Uso (desde la raíz del proyecto): chequeo de paridad + microbenchmark
+#   python src/compiled_model.py
+
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# --- Configuración ---
+MODEL_PATH = os.path.join("models", "hypertension_model.joblib")
+THRESHOLD = 0.5  # Igual que XGBClassifier.predict
+PARITY_ATOL = 1e-6
+
+
+@dataclass
+class CompiledModel:
+    """Árboles del booster en arreglos planos (índices globales de nodo)."""
+    feature: np.ndarray       # int32, -1 en las hojas
+    threshold: np.ndarray     # float32: x < umbral -> izquierda
+    left: np.ndarray          # int32, índice global del hijo izquierdo
+    right: np.ndarray         # int32
+    default_left: np.ndarray  # bool: a dónde va un NaN
+    value: np.ndarray         # float32: valor de hoja (0 en nodos internos)
+    roots: np.ndarray         # int32: nodo raíz de cada árbol
+    max_depth: int
+    base_margin: float        # logit(base_score)
+    feature_names: Tuple[str, ...] = ()
+    threshold_label: float = THRESHOLD
+
+    def __post_init__(self):
+        # Copia en listas de Python: indexar listas es mucho más rápido que
+        # indexar arrays de numpy elemento a elemento.
+        self._nodes = list(zip(self.feature.tolist(), self.threshold.tolist(), self.left.tolist(),
+                               self.right.tolist(), self.default_left.tolist(), self.value.tolist()))
+        self._roots = self.roots.tolist()
+        used = int(self.feature.max()) + 1 if len(self.feature) else 0
+        self.n_features = len(self.feature_names) or used
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def row_from_features(self, values: Mapping[str, Optional[float]]) -> List[float]:
+        """
+        Fila en el orden de feature_names a partir de {nombre: valor}, en float32.
+        ValueError si faltan features del modelo o sobran otras (con valor).
+        """
+        names = self.feature_names
+        missing = [name for name in names if values.get(name) is None]
+        unused = [name for name, value in values.items() if value is not None and name not in names]
+        if missing or unused:
+            raise ValueError(f"Las features no coinciden con las del modelo {list(names)}: "
+                             f"faltan {missing}, sobran {unused}.")
+        return [float(np.float32(values[name])) for name in names]
+
+    # --- Una fila (servir) ---
+    def margin_one(self, row: Sequence[float]) -> float:
+        if len(row) != self.n_features:
+            raise ValueError(f"La fila tiene {len(row)} features; el modelo espera {self.n_features}.")
+        nodes = self._nodes
+        total = self.base_margin
+        for node_id in self._roots:
+            feat, thr, left, right, default_left, value = nodes[node_id]
+            while feat >= 0:
+                x = row[feat]
+                if x != x:  # NaN
+                    node_id = left if default_left else right
+                else:
+                    node_id = left if x < thr else right
+                feat, thr, left, right, default_left, value = nodes[node_id]
+            total += value
+        return total
+
+    def predict_proba_one(self, row: Sequence[float]) -> float:
+        """Probabilidad de la clase 1 para una fila (lista de floats en orden del modelo)."""
+        margin = self.margin_one(row)
+        if margin >= 0:
+            return 1.0 / (1.0 + math.exp(-margin))
+        z = math.exp(margin)
+        return z / (1.0 + z)
+
+    def predict_one(self, row: Sequence[float]) -> Tuple[float, int]:
+        """(probabilidad, etiqueta) con una sola evaluación de los árboles."""
+        score = self.predict_proba_one(row)
+        return score, int(score > self.threshold_label)
+
+    # --- Lotes (numpy) ---
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X tiene forma {X.shape}; el modelo espera {self.n_features} features.")
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            feat = self.feature[nodes]
+            internal = feat >= 0
+            if not internal.any():
+                break
+            x = X[rows, np.where(internal, feat, 0)]
+            go_left = np.where(np.isnan(x), self.default_left[nodes], x < self.threshold[nodes])
+            nxt = np.where(go_left, self.left[nodes], self.right[nodes])
+            nodes = np.where(internal, nxt, nodes)
+        return self.base_margin + self.value[nodes].astype(np.float64).sum(axis=1)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase 1 para cada fila de X (n x features)."""
+        return 1.0 / (1.0 + np.exp(-self.margin(X)))
+
+
+def _tree_depth(left: List[int], right: List[int]) -> int:
+    depth, frontier = 0, [0]
+    while frontier:
+        frontier = [c for n in frontier for c in (left[n], right[n]) if c != -1]
+        if frontier:
+            depth += 1
+    return depth
+
+
+def compile_booster(booster, iteration_end: Optional[int] = None) -> CompiledModel:
+    """
+    Convierte un xgboost.Booster (binary:logistic) a CompiledModel.
+    'iteration_end' limita las iteraciones usadas (best_iteration + 1).
+    """
+    model = json.loads(booster.save_raw(raw_format="json"))
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise ValueError(f"Objetivo no soportado: {objective}")
+
+    gbm = learner["gradient_booster"]
+    if gbm.get("name") != "gbtree":
+        raise ValueError(f"Booster no soportado: {gbm.get('name')}")
+    trees = gbm["model"]["trees"]
+    indptr = gbm["model"].get("iteration_indptr")
+    if iteration_end is not None and indptr:
+        trees = trees[:indptr[min(iteration_end, len(indptr) - 1)]]
+
+    feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+    max_depth = 0
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("Los splits categóricos no están soportados.")
+        offset = len(feature)
+        roots.append(offset)
+        t_left, t_right = tree["left_children"], tree["right_children"]
+        max_depth = max(max_depth, _tree_depth(t_left, t_right))
+        for nid, (lc, rc) in enumerate(zip(t_left, t_right)):
+            cond = tree["split_conditions"][nid]
+            if lc == -1:  # Hoja: split_conditions guarda el valor de la hoja
+                feature.append(-1); threshold.append(0.0); value.append(cond)
+                left.append(offset + nid); right.append(offset + nid); default_left.append(False)
+            else:
+                feature.append(tree["split_indices"][nid]); threshold.append(cond); value.append(0.0)
+                left.append(offset + lc); right.append(offset + rc)
+                default_left.append(bool(tree["default_left"][nid]))
+
+    base_score = float(learner["learner_model_param"]["base_score"])
+    return CompiledModel(
+        feature=np.asarray(feature, dtype=np.int32),
+        threshold=np.asarray(threshold, dtype=np.float32),
+        left=np.asarray(left, dtype=np.int32),
+        right=np.asarray(right, dtype=np.int32),
+        default_left=np.asarray(default_left, dtype=bool),
+        value=np.asarray(value, dtype=np.float32),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max_depth,
+        base_margin=math.log(base_score / (1.0 - base_score)),
+        feature_names=tuple(learner.get("feature_names") or ()),
+    )
+
+
+def compile_model(model) -> CompiledModel:
+    """Compila un XGBClassifier entrenado (usa best_iteration si hubo early stopping)."""
+    best_iteration = getattr(model, "best_iteration", None)
+    iteration_end = best_iteration + 1 if best_iteration is not None else None
+    return compile_booster(model.get_booster(), iteration_end)
+
+
+def make_batch_scorer(model) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Puntuador de lotes con el predictor nativo de XGBoost (inplace_predict,
+    sin DMatrix ni wrapper de sklearn). Desde ~64 filas es más rápido que
+    CompiledModel.predict_proba; para una sola fila conviene predict_one.
+    """
+    booster = model.get_booster()
+    best_iteration = getattr(model, "best_iteration", None)
+    iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+    def score(X: np.ndarray) -> np.ndarray:
+        return booster.inplace_predict(np.asarray(X, dtype=np.float32), iteration_range=iteration_range)
+    return score
+
+
+def load_compiled(model_path: str = MODEL_PATH) -> CompiledModel:
+    """Carga el .joblib del modelo y lo compila."""
+    import joblib
+    return compile_model(joblib.load(model_path))
+
+
+# --- Paridad y microbenchmark ---
+def check_parity(model, compiled: CompiledModel, X: np.ndarray) -> Dict[str, float]:
+    """
+    Compara el evaluador compilado (fila a fila y en lote) con
+    model.predict_proba. Devuelve las diferencias máximas y las etiquetas distintas.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    expected = model.predict_proba(X)[:, 1].astype(np.float64)
+    batch = compiled.predict_proba(X)
+    single = np.array([compiled.predict_proba_one(row) for row in X.tolist()])
+    return {
+        "rows": len(X),
+        "max_abs_diff_batch": float(np.max(np.abs(batch - expected))) if len(X) else 0.0,
+        "max_abs_diff_single": float(np.max(np.abs(single - expected))) if len(X) else 0.0,
+        "label_mismatches": int(((single > THRESHOLD) != (expected > THRESHOLD)).sum()),
+    }
+
+
+def _time_per_call(fn, repeat: int) -> float:
+    fn()  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def benchmark(model, compiled: CompiledModel, row: Sequence[float], repeat: int = 2000) -> Dict[str, float]:
+    """Latencia (µs por fila) de cada forma de puntuar una sola fila."""
+    import pandas as pd
+    names = list(compiled.feature_names) or [f"f{i}" for i in range(len(row))]
+    frame = pd.DataFrame([dict(zip(names, row))])
+    array = np.asarray([row], dtype=np.float32)
+    booster = model.get_booster()
+    best_iteration = getattr(model, "best_iteration", None)
+    iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    return {
+        "sklearn_dataframe_proba_y_predict": _time_per_call(
+            lambda: (model.predict_proba(frame), model.predict(frame)), repeat),
+        "sklearn_numpy_predict_proba": _time_per_call(lambda: model.predict_proba(array), repeat),
+        "booster_inplace_predict": _time_per_call(
+            lambda: booster.inplace_predict(array, iteration_range=iteration_range), repeat),
+        "compiled_predict_one": _time_per_call(lambda: compiled.predict_one(row), repeat),
+    }
+
+
+def main():
+    print(f"--- Iniciando script: src/compiled_model.py ---")
+    import joblib
+    from src.features import OUTPUT_TEST
+    from src.storage import read_table
+
+    try:
+        model = joblib.load(MODEL_PATH)
+    except FileNotFoundError:
+        print(f"ERROR: No se encontró el modelo en {MODEL_PATH}. Ejecuta 'python src/model.py' primero.")
+        return
+    compiled = compile_model(model)
+    print(f"Modelo compilado: {compiled.n_trees} árboles, {len(compiled.feature)} nodos, "
+          f"profundidad máx. {compiled.max_depth}")
+
+    try:
+        df = read_table(OUTPUT_TEST, columns=list(compiled.feature_names))
+        X = df[list(compiled.feature_names)].to_numpy(dtype=np.float32)
+    except FileNotFoundError:
+        print(f"AVISO: No se encontró {OUTPUT_TEST}; se usan filas aleatorias para la paridad.")
+        X = np.random.default_rng(42).normal(size=(1000, len(compiled.feature_names))).astype(np.float32)
+    X[::10, ::3] = np.nan  # Incluir faltantes para probar default_left
+
+    parity = check_parity(model, compiled, X)
+    print("\n--- Paridad con model.predict_proba ---")
+    for key, val in parity.items():
+        print(f"  {key}: {val}")
+    ok = parity["max_abs_diff_single"] <= PARITY_ATOL and parity["max_abs_diff_batch"] <= PARITY_ATOL \
+        and parity["label_mismatches"] == 0
+    print("✅ Paridad OK." if ok else "ERROR: El evaluador compilado no coincide con el modelo.")
+
+    print("\n--- Microbenchmark (una fila, µs por llamada) ---")
+    results = benchmark(model, compiled, X[1].tolist())
+    baseline = results["sklearn_dataframe_proba_y_predict"]
+    for name, us in results.items():
+        print(f"  {name:<36} {us:>9.1f} µs   (x{baseline / us:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Contenido para: src/context_packer.py
+#
+# Armado del contexto del prompt: etapa entre el retriever y el LLM.
+#
+# Antes, los chunks del retriever entraban tal cual (top-k, sin límite) y el
+# prompt los repetía dos veces. Aquí:
+#   1. Se descartan los casi-duplicados (coseno entre bolsas de términos
+#      >= DEDUP_THRESHOLD; el splitter deja chunks que se solapan).
+#   2. Se ordenan estilo MMR: relevancia (posición del retriever + similitud
+#      léxica con la pregunta) menos redundancia con lo ya elegido.
+#   3. Se agregan hasta CONTEXT_TOKEN_BUDGET tokens (el primero se recorta si
+#      no entra solo) y cada bloque se emite una sola vez.
+# Los tokens ahorrados por petición se registran (log y /metrics).
+
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from src.bm25 import tokenize
+from src.memory import count_tokens, truncate_tokens
+from src.metrics import REGISTRY, stage
+
+# --- Configuración ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("NEXUSBYTE_CONTEXT_TOKENS", "1500"))
+DEDUP_THRESHOLD = float(os.getenv("NEXUSBYTE_CONTEXT_DEDUP", "0.9"))
+MMR_LAMBDA = float(os.getenv("NEXUSBYTE_CONTEXT_MMR_LAMBDA", "0.7"))
+LOG_SAVINGS = os.getenv("NEXUSBYTE_CONTEXT_LOG", "1") == "1"
+SEPARATOR = "\n\n---\n\n"
+
+_TOKENS = REGISTRY.histogram(
+    "nexusbyte_context_tokens", "Tokens de contexto por petición (recuperados vs. enviados).", ("stage",),
+    buckets=(0, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+_SAVED = REGISTRY.counter(
+    "nexusbyte_context_tokens_saved_total", "Tokens de contexto ahorrados (duplicados, presupuesto, doble {context}).")
+
+
+def _vector(text: str) -> Dict[str, float]:
+    counts = Counter(tokenize(text))
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {term: c / norm for term, c in counts.items()}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+
+@dataclass
+class PackedContext:
+    text: str
+    kept: int
+    duplicates: int
+    dropped: int              # Fuera del presupuesto
+    retrieved_tokens: int     # Suma de los chunks recibidos
+    context_tokens: int       # Lo que entra al prompt
+    order: List[int] = field(default_factory=list)  # Índices (del retriever) elegidos, en orden
+
+    @property
+    def saved_tokens(self) -> int:
+        # El prompt anterior incluía todos los chunks dos veces
+        return 2 * self.retrieved_tokens - self.context_tokens
+
+
+class ContextPacker:
+    """Deduplica, ordena (MMR) y recorta los chunks recuperados a un presupuesto de tokens."""
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, dedup_threshold: float = DEDUP_THRESHOLD,
+                 mmr_lambda: float = MMR_LAMBDA, log: bool = LOG_SAVINGS):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.mmr_lambda = mmr_lambda
+        self.log = log
+
+    def pack(self, question: str, docs: Sequence) -> PackedContext:
+        texts = [getattr(d, "page_content", d) for d in docs]
+        costs = [count_tokens(t) for t in texts]
+        vectors = [_vector(t) for t in texts]
+        query = _vector(question)
+
+        # 1. Casi-duplicados: se queda el que el retriever puso primero
+        unique: List[int] = []
+        for i, vec in enumerate(vectors):
+            if not texts[i].strip():
+                continue
+            if all(_cosine(vec, vectors[j]) < self.dedup_threshold for j in unique):
+                unique.append(i)
+        duplicates = len(texts) - len(unique)
+
+        # 2. MMR: relevancia = mitad posición en el retriever, mitad similitud léxica con la pregunta
+        n = max(len(texts), 1)
+        relevance = {i: 0.5 * (1.0 - i / n) + 0.5 * _cosine(query, vectors[i]) for i in unique}
+        order: List[int] = []
+        remaining = list(unique)
+        while remaining:
+            def mmr(i):
+                redundancy = max((_cosine(vectors[i], vectors[j]) for j in order), default=0.0)
+                return self.mmr_lambda * relevance[i] - (1.0 - self.mmr_lambda) * redundancy
+            best = max(remaining, key=mmr)
+            order.append(best)
+            remaining.remove(best)
+
+        # 3. Presupuesto de tokens
+        blocks, used, chosen = [], 0, []
+        sep_cost = count_tokens(SEPARATOR)
+        for i in order:
+            cost = costs[i] + (sep_cost if blocks else 0)
+            if used + cost <= self.token_budget:
+                blocks.append(texts[i])
+                chosen.append(i)
+                used += cost
+            elif not blocks:
+                blocks.append(truncate_tokens(texts[i], self.token_budget))
+                chosen.append(i)
+                used = count_tokens(blocks[0])
+        text = SEPARATOR.join(blocks)
+
+        packed = PackedContext(text=text, kept=len(chosen), duplicates=duplicates,
+                               dropped=len(unique) - len(chosen), retrieved_tokens=sum(costs),
+                               context_tokens=count_tokens(text) if text else 0, order=chosen)
+        _TOKENS.labels(stage="retrieved").observe(packed.retrieved_tokens)
+        _TOKENS.labels(stage="prompt").observe(packed.context_tokens)
+        _SAVED.inc(max(packed.saved_tokens, 0))
+        if self.log:
+            print(f"Contexto: {packed.kept}/{len(texts)} chunks (duplicados {duplicates}, fuera de presupuesto "
+                  f"{packed.dropped}), {packed.context_tokens} tokens; ahorro {packed.saved_tokens} tokens")
+        return packed
+
+
+def make_context_step(retriever, packer: ContextPacker):
+    """Runnable {'question': ...} -> texto de contexto (recupera y empaqueta)."""
+    from langchain_core.runnables import RunnableLambda
+
+    def pack(inputs: Dict) -> str:
+        question = inputs["question"]
+        with stage("retrieval"):
+            docs = retriever.invoke(question)
+        with stage("prompt_build"):
+            return packer.pack(question, docs).text
+
+    async def apack(inputs: Dict) -> str:
+        question = inputs["question"]
+        with stage("retrieval"):
+            docs = await retriever.ainvoke(question)
+        with stage("prompt_build"):
+            return packer.pack(question, docs).text
+
+    return RunnableLambda(pack, afunc=apack, name="context_packer")
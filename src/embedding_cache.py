@@ -0,0 +1,199 @@
+# Contenido para: src/embedding_cache.py
+#
+# Caché de embeddings (persistente para la KB, LRU en memoria para preguntas).
+#
+# build_rag.py volvía a pedir a OpenAI el embedding de todos los chunks en
+# cada ejecución y reconstruía FAISS desde cero; la API, a su vez, calculaba
+# de nuevo el embedding de cada pregunta repetida. Aquí:
+#   - EmbeddingStore: SQLite (models/embedding_cache.sqlite) con clave
+#     sha256(modelo + texto) -> vector float32. Cambiar de modelo o editar un
+#     chunk genera otra clave, así que nunca se sirve un vector viejo.
+#   - CachedEmbeddings: envoltorio de cualquier Embeddings de LangChain. Los
+#     documentos se buscan en el store y solo los que faltan se piden a la API,
+#     en lotes concurrentes; las preguntas pasan por un LRU acotado.
+#   - chunk_id: id estable por chunk (texto + fuente), para que build_rag
+#     pueda parchar el índice FAISS existente (borrar/agregar solo lo que cambió).
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.metrics import REGISTRY, stage
+
+# --- Configuración ---
+CACHE_PATH = os.path.join("models", "embedding_cache.sqlite")
+BATCH_SIZE = int(os.getenv("NEXUSBYTE_EMBED_BATCH", "64"))
+CONCURRENCY = int(os.getenv("NEXUSBYTE_EMBED_CONCURRENCY", "4"))
+QUERY_CACHE_SIZE = int(os.getenv("NEXUSBYTE_QUERY_EMBED_CACHE", "512"))
+
+_LOOKUPS = REGISTRY.counter(
+    "nexusbyte_embedding_cache_requests_total", "Consultas a la caché de embeddings.", ("kind", "result"))
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """Nombre del modelo (OpenAIEmbeddings.model, etc.), parte de la clave de caché."""
+    for attr in ("model", "model_name", "deployment"):
+        value = getattr(embeddings, attr, None)
+        if value:
+            return str(value)
+    return type(embeddings).__name__
+
+
+def text_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def chunk_id(doc: Document) -> str:
+    """Id estable de un chunk: mismo texto y misma fuente -> mismo id en FAISS."""
+    source = str(doc.metadata.get("source", ""))
+    return hashlib.sha256(f"{source}\x00{doc.page_content}".encode("utf-8")).hexdigest()[:32]
+
+
+class EmbeddingStore:
+    """Vectores float32 en SQLite, por clave sha256(modelo + texto)."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), 500):  # Límite de parámetros de SQLite
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            arr = np.asarray(vector, dtype=np.float32)
+            rows.append((key, model, int(arr.shape[0]), arr.tobytes(), now))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings con caché. 'store' (opcional) guarda los vectores de documentos
+    entre ejecuciones; las preguntas usan un LRU en memoria de 'query_cache_size'.
+    """
+
+    def __init__(self, inner: Embeddings, store: Optional[EmbeddingStore] = None,
+                 batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY,
+                 query_cache_size: int = QUERY_CACHE_SIZE):
+        self.inner = inner
+        self.store = store
+        self.model = embedding_model_name(inner)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Documentos (store persistente + lotes concurrentes) ---
+    def _split_missing(self, texts: List[str]):
+        keys = [text_key(self.model, t) for t in texts]
+        found = self.store.get_many(keys) if self.store is not None else {}
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        n_missing = sum(k not in found for k in keys)
+        _LOOKUPS.labels(kind="document", result="hit").inc(len(keys) - n_missing)
+        _LOOKUPS.labels(kind="document", result="miss").inc(n_missing)
+        return keys, found, missing
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _finish(self, keys, found, missing, vectors) -> List[List[float]]:
+        new = {text_key(self.model, t): v for t, v in zip(missing, vectors)}
+        if new and self.store is not None:
+            self.store.put_many(self.model, new)
+        found.update(new)
+        return [found[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split_missing(list(texts))
+        vectors: List[List[float]] = []
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for batch_vectors in pool.map(self.inner.embed_documents, self._batches(missing)):
+                    vectors.extend(batch_vectors)
+        return self._finish(keys, found, missing, vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split_missing(list(texts))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch):
+            async with semaphore:
+                return await self.inner.aembed_documents(batch)
+
+        results = await asyncio.gather(*(run(b) for b in self._batches(missing)))
+        vectors = [v for batch_vectors in results for v in batch_vectors]
+        return self._finish(keys, found, missing, vectors)
+
+    # --- Preguntas (LRU en memoria) ---
+    def _query_get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+        _LOOKUPS.labels(kind="query", result="hit" if vector is not None else "miss").inc()
+        return vector
+
+    def _query_put(self, text: str, vector: List[float]) -> None:
+        with self._lock:
+            self._queries[text] = vector
+            self._queries.move_to_end(text)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        with stage("embedding"):
+            vector = self._query_get(text)
+            if vector is None:
+                vector = self.inner.embed_query(text)
+                self._query_put(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with stage("embedding"):
+            vector = self._query_get(text)
+            if vector is None:
+                vector = await self.inner.aembed_query(text)
+                self._query_put(text, vector)
+        return vector
@@ -0,0 +1,465 @@
+# Contenido para: src/eval.py
+#
+# Suite de benchmarks offline: etapas del pipeline y rutas calientes de inferencia.
+#
+# Corre en un directorio de trabajo temporal con datos NHANES sintéticos
+# (deterministas, misma semilla -> mismos datos), así que no toca data/ ni
+# models/ del proyecto y no necesita red:
+#   - pipeline:  load (merge), targets, features y entrenamiento, una por una.
+#   - scoring:   get_risk_score fila a fila (caché fría y caliente) y por lotes
+#                (transformador vectorizado + predictor nativo).
+#   - api:       POST /predict y /predict/batch con el TestClient de FastAPI.
+#   - retrieval: índice de data/kb (FAISS + BM25) con embeddings deterministas;
+#                búsqueda por modo, armado del contexto y respuesta RAG de la
+#                app con un LLM determinista.
+# Los resultados (mediana, p95, items/s) se guardan en JSON con el commit,
+# para comparar entre commits con --compare.
+#
+# Uso (desde la raíz del proyecto):
+#   python src/eval.py                               # todo
+#   python src/eval.py --only scoring,api --rows 20000
+#   python src/eval.py --compare benchmarks/<anterior>.json
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from langchain_core.embeddings import Embeddings
+
+from src.local_llm import DeterministicChatModel, DeterministicEmbeddings
+
+# --- Configuración ---
+RESULTS_DIR = os.getenv("NEXUSBYTE_BENCH_DIR", os.path.join(PROJECT_ROOT, "benchmarks"))
+KB_DIR = os.path.join(PROJECT_ROOT, "data", "kb")
+GROUPS = ("pipeline", "scoring", "api", "retrieval")
+SEED = 42
+DEFAULT_ROWS = 5000        # Filas sintéticas por split
+REPEAT = 5                 # Repeticiones de los benchmarks por lote
+SINGLE_CALLS = 500         # Llamadas fila a fila (cada una se mide por separado)
+BATCH_ROWS = 1000          # Filas por lote en scoring/api
+REGRESSION_TOLERANCE = 0.20  # --compare: más de +20% en la mediana es regresión
+SCHEMA_VERSION = 1
+
+# Preguntas fijas para la búsqueda (temas de data/kb)
+QUESTIONS = (
+    "¿Qué es la dieta DASH?",
+    "¿Cuánta sal puedo comer al día?",
+    "¿Cuántas horas debo dormir para cuidar mi presión?",
+    "¿Qué ejercicio ayuda a bajar la presión arterial?",
+    "¿Cómo afecta el tabaco a la presión?",
+    "¿Qué alimentos tienen potasio?",
+    "¿Cómo manejo el estrés?",
+    "¿El alcohol sube la presión?",
+    "Quiero bajar de peso, ¿por dónde empiezo?",
+    "¿Qué significa tener la cintura grande?",
+    "¿Cada cuánto debo medirme la presión?",
+    "Dame un plan de 2 semanas",
+)
+
+
+# --- Resultados ---
+@dataclass
+class BenchResult:
+    name: str
+    group: str
+    samples_s: List[float]         # Una muestra por llamada o repetición
+    items: int = 1                 # Filas / consultas / peticiones por muestra
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        samples = np.asarray(self.samples_s, dtype=np.float64)
+        median = float(np.median(samples))
+        return {
+            "name": self.name,
+            "group": self.group,
+            "samples": len(samples),
+            "items": self.items,
+            "median_ms": median * 1000,
+            "p95_ms": float(np.percentile(samples, 95)) * 1000,
+            "min_ms": float(samples.min()) * 1000,
+            "mean_ms": float(samples.mean()) * 1000,
+            "per_item_us": median / self.items * 1e6,
+            "items_per_s": self.items / median if median > 0 else math.inf,
+            **self.extra,
+        }
+
+
+def time_calls(fn: Callable[[Any], Any], inputs: Sequence[Any], warmup: int = 1) -> List[float]:
+    """Mide cada llamada fn(x) por separado (percentiles de latencia reales)."""
+    for x in inputs[:warmup]:
+        fn(x)
+    samples = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_repeat(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silencia los print de las etapas mientras se miden."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# --- Datos sintéticos ---
+def synthetic_profiles(rows: int, seed: int = SEED) -> pd.DataFrame:
+    """Perfiles crudos (columnas NHANES) con faltantes y códigos 77/99, 7/9."""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(18, 86, rows)
+    sex = rng.integers(1, 3, rows)
+    height = rng.normal(168, 10, rows).clip(140, 205)
+    bmi = rng.normal(28, 5, rows).clip(16, 55)
+    weight = bmi * (height / 100) ** 2
+    waist = (height * rng.normal(0.55, 0.07, rows)).clip(55, 160)
+    sleep = rng.normal(7, 1.3, rows).clip(2, 14).round(1)
+    sleep[rng.random(rows) < 0.01] = 99
+    smoker = rng.choice([1, 2], rows, p=[0.4, 0.6])
+    activity = rng.choice([1, 2, 7, 9], rows, p=[0.45, 0.5, 0.03, 0.02])
+    df = pd.DataFrame({
+        "RIDAGEYR": age, "RIAGENDR": sex, "BMXHT": height.round(1), "BMXWT": weight.round(1),
+        "BMXWAIST": waist.round(1), "SLD_HOURS": sleep, "SMQ020": smoker, "PAQ650": activity,
+    })
+    for col in ("BMXHT", "BMXWT", "BMXWAIST", "SLD_HOURS"):
+        df.loc[rng.random(rows) < 0.05, col] = np.nan
+    return df
+
+
+def write_synthetic_nhanes(root: str, rows: int, seed: int = SEED) -> None:
+    """Componentes '<Nombre>_TRAIN.csv' / '_TEST.csv' como los de la raíz del proyecto."""
+    rng = np.random.default_rng(seed + 1)
+    for split, offset in (("TRAIN", 0), ("TEST", 10_000_000)):
+        profiles = synthetic_profiles(rows, seed + offset)
+        seqn = np.arange(rows) + 1 + offset
+        year = rng.choice([2011, 2013, 2015, 2017], rows)
+        base = pd.DataFrame({"SEQN": seqn, "year": year})
+        # Presión sistólica con relación a edad, IMC y cintura (el modelo tiene algo que aprender)
+        bmi = profiles["BMXWT"] / (profiles["BMXHT"] / 100) ** 2
+        systolic = 95 + 0.45 * profiles["RIDAGEYR"] + 0.6 * bmi.fillna(28) + rng.normal(0, 12, rows)
+        diastolic = 55 + 0.5 * bmi.fillna(28) + 0.1 * profiles["RIDAGEYR"] + rng.normal(0, 8, rows)
+        components = {
+            "AgeAndSex": profiles[["RIAGENDR", "RIDAGEYR"]],
+            "BodyMeasures": profiles[["BMXWT", "BMXHT", "BMXWAIST"]],
+            "SleepDisorder": profiles[["SLD_HOURS"]],
+            "TabacoUse": profiles[["SMQ020"]],
+            "PhysicalActivity": profiles[["PAQ650"]],
+        }
+        if split == "TRAIN":  # Como en NHANES: el test es ciego
+            components["BloodPressure"] = pd.DataFrame({"BPXSY2": systolic.round(), "BPXDI2": diastolic.round()})
+        for name, columns in components.items():
+            df = pd.concat([base[["SEQN"]], columns.reset_index(drop=True), base[["year"]]], axis=1)
+            df.to_csv(os.path.join(root, f"{name}_{split}.csv"), index=False)
+
+
+# --- Contexto de la corrida ---
+@dataclass
+class BenchContext:
+    workdir: str
+    rows: int
+    repeat: int
+    profiles: pd.DataFrame            # Perfiles crudos para servir (distintos a los de train)
+    results: List[BenchResult] = field(default_factory=list)
+
+    def add(self, result: BenchResult) -> BenchResult:
+        self.results.append(result)
+        row = result.to_dict()
+        print(f"  {result.group:<10} {result.name:<34} mediana {row['median_ms']:>10.3f} ms   "
+              f"p95 {row['p95_ms']:>10.3f} ms   {row['per_item_us']:>10.1f} µs/item")
+        return result
+
+    def raw_profiles(self, n: int) -> List[Dict[str, Any]]:
+        # Vía JSON: NaN -> None y tipos de Python, como llegan a la API
+        return json.loads(self.profiles.head(n).to_json(orient="records"))
+
+
+def _pipeline_stages():
+    from src import features, load, model, targets
+    return [
+        ("load_merge", lambda: load.merge_files("_TRAIN.csv", "train_dataset.parquet")),
+        ("targets", targets.process_train),
+        ("features", features.build_train_features),
+        ("train_model", model.train_model),
+    ]
+
+
+def bench_pipeline(ctx: BenchContext) -> None:
+    """Cada etapa de la rama de entrenamiento, en orden (la salida de una es la entrada de la siguiente)."""
+    from src.pipeline import _peak_memory_mb
+    for name, run in _pipeline_stages():
+        with quiet():
+            samples = time_repeat(run, repeat=1, warmup=0)
+        ctx.add(BenchResult(name, "pipeline", samples, items=ctx.rows,
+                            extra={"peak_mb": _peak_memory_mb()}))
+
+
+def ensure_model(ctx: BenchContext) -> None:
+    """Sin el grupo 'pipeline', el modelo igual hace falta: se entrena sin medir."""
+    from src.model import MODEL_PATH
+    if os.path.exists(MODEL_PATH):
+        return
+    print("  (entrenando el modelo sintético, sin medir)")
+    with quiet():
+        for _, run in _pipeline_stages():
+            run()
+
+
+def bench_scoring(ctx: BenchContext) -> None:
+    from src.compiled_model import make_batch_scorer
+    from src.inference import get_risk_score, load_feature_transformer, load_ml_model
+    from src.pred_cache import PREDICTION_CACHE, current_model_version
+
+    model = load_ml_model()
+    transformer = load_feature_transformer()
+    version = current_model_version()
+    profiles = ctx.raw_profiles(SINGLE_CALLS)
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.clear()
+
+    score = lambda p: get_risk_score(model, p, transformer, version)
+    ctx.add(BenchResult("get_risk_score_cold", "scoring", time_calls(score, profiles, warmup=0)))
+    ctx.add(BenchResult("get_risk_score_cached", "scoring", time_calls(score, profiles)))
+    ctx.add(BenchResult("transform_one", "scoring", time_calls(transformer.transform_one, profiles)))
+
+    batch = ctx.profiles.head(BATCH_ROWS)
+    scorer = make_batch_scorer(model)
+    ctx.add(BenchResult("batch_transform", "scoring",
+                        time_repeat(lambda: transformer.transform_array(batch), ctx.repeat), items=len(batch)))
+    ctx.add(BenchResult("batch_transform_and_score", "scoring",
+                        time_repeat(lambda: scorer(transformer.transform_array(batch)), ctx.repeat),
+                        items=len(batch)))
+
+
+API_FIELDS = {"age": "RIDAGEYR", "sex": "RIAGENDR", "height": "BMXHT", "weight": "BMXWT", "waist": "BMXWAIST",
+              "sleep_hours": "SLD_HOURS", "is_smoker": "SMQ020", "activity_days": "PAQ650"}
+
+
+def bench_api(ctx: BenchContext) -> None:
+    from fastapi.testclient import TestClient
+    from src.pred_cache import PREDICTION_CACHE
+    with quiet():
+        import api.main as api_main
+    client = TestClient(api_main.app)
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.clear()
+
+    payloads = [{key: profile[col] for key, col in API_FIELDS.items()} for profile in ctx.raw_profiles(SINGLE_CALLS)]
+    with quiet():
+        client.post("/predict", json=payloads[0])  # Carga perezosa de los componentes
+
+    def predict(payload):
+        response = client.post("/predict", json=payload)
+        assert response.status_code == 200, response.text
+    ctx.add(BenchResult("POST /predict", "api", time_calls(predict, payloads[1:])))
+
+    body = json.dumps([dict(p) for p in payloads] * max(1, BATCH_ROWS // len(payloads)))
+    n_rows = len(json.loads(body))
+
+    def predict_batch():
+        response = client.post("/predict/batch", content=body, headers={"content-type": "application/json"})
+        assert response.status_code == 200, response.text
+    ctx.add(BenchResult("POST /predict/batch", "api", time_repeat(predict_batch, ctx.repeat), items=n_rows))
+
+    from src import audit
+    audit.flush_all()
+
+
+def build_kb_index(faiss_path: str, bm25_path: str, embeddings: Embeddings) -> int:
+    """Índice de data/kb en el directorio de trabajo (mismos chunks que src/build_rag.py)."""
+    from src.bm25 import build_bm25_index
+    from src.build_rag import load_kb_splits, update_faiss_index
+    from src.embedding_cache import chunk_id
+    from src.rag import IndexManifest, index_version, write_manifest
+    with quiet():
+        splits = load_kb_splits(KB_DIR)
+        if not splits:
+            raise FileNotFoundError(f"No hay documentos en {KB_DIR}")
+        build_bm25_index(splits, bm25_path)
+        update_faiss_index(splits, embeddings, faiss_path)
+    version = index_version((chunk_id(doc) for doc in splits), embeddings.model)
+    write_manifest(IndexManifest(version=version, embedding_model=embeddings.model, n_chunks=len(splits),
+                                 built_at=time.time(),
+                                 files={"faiss": os.path.basename(faiss_path), "bm25": os.path.basename(bm25_path)}),
+                   faiss_path)
+    return len(splits)
+
+
+def bench_retrieval(ctx: BenchContext) -> None:
+    from src.context_packer import ContextPacker
+    from src.inference import generate_rag_response
+    from src.rag import load_index
+
+    embeddings = DeterministicEmbeddings()
+    faiss_path = os.path.join("models", "faiss_index")
+    bm25_path = os.path.join("models", "bm25_index.npz")
+    shutil.rmtree(faiss_path, ignore_errors=True)
+    start = time.perf_counter()
+    n_chunks = build_kb_index(faiss_path, bm25_path, embeddings)
+    ctx.add(BenchResult("build_kb_index", "retrieval", [time.perf_counter() - start], items=n_chunks))
+
+    questions = list(QUESTIONS) * ctx.repeat
+    retrievers = {}
+    for mode in ("bm25", "vector", "hybrid"):
+        with quiet():
+            retrievers[mode], _ = load_index(embeddings, mode, faiss_path, bm25_path)
+        ctx.add(BenchResult(f"search_{mode}", "retrieval", time_calls(retrievers[mode].invoke, questions),
+                            extra={"chunks": n_chunks}))
+
+    packer = ContextPacker(log=False)
+    docs = {q: retrievers["hybrid"].invoke(q) for q in QUESTIONS}
+    ctx.add(BenchResult("context_pack", "retrieval", time_calls(lambda q: packer.pack(q, docs[q]), questions)))
+
+    llm = DeterministicChatModel()
+    with quiet():
+        samples = time_calls(lambda q: generate_rag_response(llm, retrievers["hybrid"], q), questions)
+    ctx.add(BenchResult("rag_response_fake_llm", "retrieval", samples))
+
+
+BENCHMARKS = {"pipeline": bench_pipeline, "scoring": bench_scoring, "api": bench_api,
+              "retrieval": bench_retrieval}
+
+
+# --- Corrida, guardado y comparación ---
+def git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run_suite(groups: Sequence[str] = GROUPS, rows: int = DEFAULT_ROWS, repeat: int = REPEAT,
+              workdir: Optional[str] = None, keep: bool = False) -> Dict[str, Any]:
+    """Corre los grupos pedidos en un directorio de trabajo aislado. Devuelve el reporte."""
+    created = workdir is None
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix="nexusbyte-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    os.environ.pop("OPENAI_API_KEY", None)  # La API no debe intentar cargar el RAG real
+    os.chdir(workdir)
+    try:
+        for path in (os.path.join("data", "processed"), "models", "app"):
+            os.makedirs(path, exist_ok=True)
+        write_synthetic_nhanes(workdir, rows)
+        ctx = BenchContext(workdir, rows, repeat, profiles=synthetic_profiles(rows, SEED + 20_000_000))
+        print(f"--- Benchmarks ({', '.join(groups)}; {rows} filas sintéticas; directorio {workdir}) ---")
+        if "pipeline" in groups:
+            bench_pipeline(ctx)
+        if any(g in groups for g in ("scoring", "api")):
+            ensure_model(ctx)
+        for group in groups:
+            if group != "pipeline":
+                BENCHMARKS[group](ctx)
+    finally:
+        os.chdir(previous_cwd)
+        if created and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"groups": list(groups), "rows": rows, "repeat": repeat, "seed": SEED,
+                   "single_calls": SINGLE_CALLS, "batch_rows": BATCH_ROWS},
+        "results": [r.to_dict() for r in ctx.results],
+    }
+
+
+def save_report(report: Dict[str, Any], results_dir: str = RESULTS_DIR) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    commit = (report.get("commit") or "sin-commit")[:10] + ("-dirty" if report.get("dirty") else "")
+    path = os.path.join(results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any],
+                    tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Imprime la variación de la mediana por benchmark; devuelve los que empeoraron más de 'tolerance'."""
+    before = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n--- Comparación con {str(baseline.get('commit'))[:10]} (tolerancia +{tolerance:.0%}) ---")
+    for row in current["results"]:
+        old = before.get(row["name"])
+        if old is None or not old["median_ms"]:
+            continue
+        change = row["median_ms"] / old["median_ms"] - 1.0
+        flag = ""
+        if change > tolerance:
+            flag = "  <-- REGRESIÓN"
+            regressions.append(row["name"])
+        print(f"  {row['name']:<34} {old['median_ms']:>10.3f} -> {row['median_ms']:>10.3f} ms  ({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks offline del pipeline y de la inferencia (sin red).")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Grupos separados por coma ({', '.join(GROUPS)}).")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Filas sintéticas por split.")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Repeticiones de los benchmarks por lote.")
+    parser.add_argument("--workdir", default=None, help="Directorio de trabajo (por defecto, uno temporal).")
+    parser.add_argument("--keep", action="store_true", help="No borra el directorio temporal.")
+    parser.add_argument("--output", default=None, help="Ruta del JSON (por defecto, benchmarks/<fecha>_<commit>.json).")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior para comparar.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Umbral de regresión.")
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        parser.error(f"Grupos desconocidos: {unknown}. Opciones: {', '.join(GROUPS)}")
+
+    report = run_suite(groups, rows=args.rows, repeat=args.repeat, workdir=args.workdir, keep=args.keep)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        path = args.output
+    else:
+        path = save_report(report)
+    print(f"\n✅ Resultados guardados en: {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"ERROR: {len(regressions)} benchmark(s) más lentos que la referencia: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ Sin regresiones.")
@@ -1,15 +1,28 @@
 # Contenido para: src/features.py (VERSIÓN 2 - Hipertensión)
 
-import pandas as pd
 import os
+import sys
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src.storage import read_table, read_columns, write_table
+from src.transformer import COLS_RAW, TRANSFORMER_PATH, FeatureTransformer, check_parity, load_transformer
 
 # --- Configuración ---
 DATA_DIR = "data/processed"
-INPUT_TRAIN = os.path.join(DATA_DIR, "train_with_target.csv")
-INPUT_TEST = os.path.join(DATA_DIR, "test_with_target.csv")
+INPUT_TRAIN = os.path.join(DATA_DIR, "train_with_target.parquet")
+INPUT_TEST = os.path.join(DATA_DIR, "test_with_target.parquet")
 
-OUTPUT_TRAIN = os.path.join(DATA_DIR, "train_final_features.csv")
-OUTPUT_TEST = os.path.join(DATA_DIR, "test_final_features.csv")
+OUTPUT_TRAIN = os.path.join(DATA_DIR, "train_final_features.parquet")
+OUTPUT_TEST = os.path.join(DATA_DIR, "test_final_features.parquet")
+
+# Filas (muestra fija) con las que se comprueba que transform_one (API/app)
+# coincide con el camino vectorizado antes de guardar el transformador; 0 = todas
+PARITY_ROWS = int(os.getenv("NEXUSBYTE_PARITY_ROWS", "5000"))
+PARITY_SEED = 42
 
 # 1. REGLA ANTI-FUGA: Lista de variables a ELIMINAR
 # Ya que predecimos HIPERTENSIÓN, no podemos usar ninguna
@@ -24,128 +37,140 @@ LEAKY_VARS = [
 ]
 
 # 2. VARIABLES DE ENTRADA (Features)
-# Mapeo de nombres "reales" (de tu head) a nombres genéricos
-COLS_RAW = {
-    'age': 'RIDAGEYR',
-    'sex': 'RIAGENDR',        # 1=Hombre, 2=Mujer
-    'height': 'BMXHT',      # en cm
-    'weight': 'BMXWT',      # en kg
-    'waist': 'BMXWAIST',    # Circunferencia de cintura en cm
-    'sleep_hours': 'SLD_HOURS', # Horas de sueño (¡Detectado de tu head!)
-    'is_smoker': 'SMQ020',    # 1=Sí, 2=No
-    'activity_days': 'PAQ650', # Días de actividad física moderada
-}
+# El mapeo de columnas NHANES -> 'feat_*', los códigos de faltante y las
+# medianas viven en el transformador ajustado (src/transformer.py), que
+# también usan la API y la app para servir.
+# COLS_RAW se re-exporta aquí por compatibilidad.
 
 # 3. Columnas a mantener al final
 ID_COL = 'SEQN'
 TARGET_COL = 'TARGET_HIPERTENSION' # <-- ¡Actualizado!
 
 
-def engineer_features(df):
+def engineer_features(df, transformer):
     """
-    Crea nuevas features y limpia las existentes.
+    Crea las features (ya imputadas) con el transformador ajustado
+    y mantiene el ID y el target.
     """
-    df_feat = pd.DataFrame()
-    
     # Verificar que las columnas base existan
     if ID_COL not in df.columns or TARGET_COL not in df.columns:
-        print(f"ERROR: No se encontró {ID_COL} o {TARGET_COL} en {DATA_DIR}/train_with_target.csv")
+        print(f"ERROR: No se encontró {ID_COL} o {TARGET_COL} en los datos de entrada.")
         return None
 
-    # Mantener ID y Target
-    df_feat[ID_COL] = df[ID_COL]
-    df_feat[TARGET_COL] = df[TARGET_COL]
+    df_feat = transformer.transform(df)
+    df_feat.insert(0, TARGET_COL, df[TARGET_COL])
+    df_feat.insert(0, ID_COL, df[ID_COL])
+    return df_feat
 
-    # --- Ingeniería de Features ---
-    
-    # 1. IMC (Índice de Masa Corporal)
-    if COLS_RAW['weight'] in df.columns and COLS_RAW['height'] in df.columns:
-        df_feat['feat_imc'] = df[COLS_RAW['weight']] / (df[COLS_RAW['height']] / 100) ** 2
-    
-    # 2. Relación Cintura-Altura (WHtR - Waist-to-Height Ratio)
-    if COLS_RAW['waist'] in df.columns and COLS_RAW['height'] in df.columns:
-        df_feat['feat_whtr'] = df[COLS_RAW['waist']] / df[COLS_RAW['height']]
 
-    # --- Limpieza y Renombrado ---
-    
-    # 3. Edad (ya está lista)
-    if COLS_RAW['age'] in df.columns:
-        df_feat['feat_age'] = df[COLS_RAW['age']]
-    
-    # 4. Sexo (Mapear a 0 y 1)
-    if COLS_RAW['sex'] in df.columns:
-        df_feat['feat_sex'] = df[COLS_RAW['sex']].map({1: 0, 2: 1}) # 1=Hombre -> 0, 2=Mujer -> 1
-    
-    # 5. Tabaquismo (Mapear a 0 y 1)
-    if COLS_RAW['is_smoker'] in df.columns:
-        df_feat['feat_is_smoker'] = df[COLS_RAW['is_smoker']].map({1: 1, 2: 0}) # 1=Sí -> 1, 2=No
-    else:
-        print("  Aviso: 'SMQ020' (tabaquismo) no encontrado. Se omitirá.")
-
-    # 6. Horas de sueño
-    if COLS_RAW['sleep_hours'] in df.columns:
-        df_feat['feat_sleep_hours'] = df[COLS_RAW['sleep_hours']].replace([77, 99], pd.NA)
-    else:
-        print("  Aviso: 'SLD_HOURS' (sueño) no encontrado. Se omitirá.")
-        
-    # 7. Días de actividad física
-    if COLS_RAW['activity_days'] in df.columns:
-        df_feat['feat_activity_days'] = df[COLS_RAW['activity_days']].replace([7, 9], pd.NA)
-    else:
-        print("  Aviso: 'PAQ650' (actividad) no encontrado. Se omitirá.")
+def load_stage_input(input_path):
+    """
+    Lee solo las columnas que usa esta etapa (ID, target y variables base)
+    y aplica la regla anti-fuga. Lanza FileNotFoundError si falta el archivo.
+    """
+    columns_needed = [ID_COL, TARGET_COL] + list(COLS_RAW.values())
+    available_cols = read_columns(input_path)
+    df = read_table(input_path, columns=columns_needed)
 
-    return df_feat
+    # --- Aplicar Regla Anti-Fuga ---
+    # Las variables de fuga nunca se leen (no están en columns_needed);
+    # igual se reportan y se descartan por si alguna se colara en COLS_RAW.
+    print(f"Eliminando variables de fuga (anti-leakage rule)...")
+    cols_to_drop = [col for col in LEAKY_VARS if col in available_cols]
+    print(f"  Columnas eliminadas: {cols_to_drop}")
+    return df.drop(columns=cols_to_drop, errors='ignore')
 
 
-def main():
-    print(f"--- Iniciando script: src/features.py (Target: Hipertensión) ---")
-    
+def verify_parity(transformer, df, n_rows=PARITY_ROWS):
+    """
+    Falla (RuntimeError) si transform_one da otros valores que el camino
+    vectorizado: entrenar con uno y servir con el otro daría otras predicciones.
+    """
+    sample = df if not n_rows or len(df) <= n_rows else df.sample(n=n_rows, random_state=PARITY_SEED)
+    mismatches = check_parity(transformer, sample)
+    if mismatches:
+        raise RuntimeError(f"Paridad del transformador: {mismatches} de {len(sample)} filas difieren "
+                           f"entre transform y transform_one.")
+    print(f"  Paridad transform / transform_one: OK ({len(sample)} filas).")
+
+
+def build_train_features():
+    """
+    Features del set de ENTRENAMIENTO. Aquí se ajusta el transformador
+    (mapeo + medianas de imputación de 'train') y se guarda en
+    TRANSFORMER_PATH para el set de prueba y para servir.
+    Devuelve el transformador (o None si hubo error).
+    """
     try:
-        train_df = pd.read_csv(INPUT_TRAIN)
-        test_df = pd.read_csv(INPUT_TEST)
+        train_df = load_stage_input(INPUT_TRAIN)
     except FileNotFoundError:
         print(f"ERROR: No se encontraron los archivos de entrada (ej: {INPUT_TRAIN})")
         print("Por favor, ejecuta 'python src/targets.py' primero.")
-        return
+        return None
 
-    # --- 1. Aplicar Regla Anti-Fuga ---
-    print(f"Eliminando variables de fuga (anti-leakage rule)...")
-    cols_to_drop = [col for col in LEAKY_VARS if col in train_df.columns]
-    print(f"  Columnas eliminadas: {cols_to_drop}")
-    
-    train_df = train_df.drop(columns=cols_to_drop, errors='ignore')
-    test_df = test_df.drop(columns=cols_to_drop, errors='ignore')
+    # --- Ajuste del transformador (mapeo + imputación) ---
+    print("Ajustando transformador de features (train)...")
+    transformer = FeatureTransformer().fit(train_df)
+    print(f"  Features: {list(transformer.features)}")
+    print(f"  Medianas de imputación (train): {transformer.medians}")
 
-    # --- 2. Ingeniería de Features ---
-    print("Iniciando ingeniería de features...")
-    train_feat = engineer_features(train_df)
-    test_feat = engineer_features(test_df)
-    
-    if train_feat is None or test_feat is None:
+    print("Iniciando ingeniería de features (train)...")
+    train_feat = engineer_features(train_df, transformer)
+    if train_feat is None:
         print("Hubo un error en engineer_features. Abortando.")
-        return
-        
-    print("  Features creadas: 'feat_imc', 'feat_whtr', etc.")
+        return None
+    print("  Features creadas e imputadas usando la mediana de 'train'.")
+    verify_parity(transformer, train_df)
 
-    # --- 3. Imputación (Manejo de Nulos) ---
-    feature_cols = [col for col in train_feat.columns if col.startswith('feat_')]
-    print(f"Imputando valores nulos para {len(feature_cols)} features...")
-    
-    imputer = train_feat[feature_cols].median()
-    
-    train_feat[feature_cols] = train_feat[feature_cols].fillna(imputer)
-    test_feat[feature_cols] = test_feat[feature_cols].fillna(imputer)
-    
-    print("  Imputación completada usando la mediana de 'train'.")
-    
-    # --- 4. Guardar Archivos Finales ---
-    train_feat.to_csv(OUTPUT_TRAIN, index=False)
-    test_feat.to_csv(OUTPUT_TEST, index=False)
-    
+    transformer.save(TRANSFORMER_PATH)
+    print(f"✅ Transformador guardado en: {TRANSFORMER_PATH}")
+    write_table(train_feat, OUTPUT_TRAIN, stage="features",
+                metadata={"transformer": transformer.to_dict()})
     print(f"\n✅ Archivo final de entrenamiento guardado en: {OUTPUT_TRAIN}")
     print(f"   Dimensiones: {train_feat.shape}")
+    return transformer
+
+
+def build_test_features(transformer=None):
+    """
+    Features del set de PRUEBA con el transformador ajustado en 'train'
+    (si no se pasa, se carga desde TRANSFORMER_PATH).
+    """
+    if transformer is None:
+        try:
+            transformer = load_transformer(TRANSFORMER_PATH)
+        except FileNotFoundError:
+            print(f"ERROR: No se encontró el transformador de features en {TRANSFORMER_PATH}.")
+            print("Por favor, genera primero las features de entrenamiento.")
+            return False
+
+    try:
+        test_df = load_stage_input(INPUT_TEST)
+    except FileNotFoundError:
+        print(f"ERROR: No se encontraron los archivos de entrada (ej: {INPUT_TEST})")
+        print("Por favor, ejecuta 'python src/targets.py' primero.")
+        return False
+
+    print("Iniciando ingeniería de features (test)...")
+    test_feat = engineer_features(test_df, transformer)
+    if test_feat is None:
+        print("Hubo un error en engineer_features. Abortando.")
+        return False
+
+    write_table(test_feat, OUTPUT_TEST, stage="features")
     print(f"\n✅ Archivo final de prueba guardado en: {OUTPUT_TEST}")
     print(f"   Dimensiones: {test_feat.shape}")
+    return True
+
+
+def main():
+    print(f"--- Iniciando script: src/features.py (Target: Hipertensión) ---")
+
+    transformer = build_train_features()
+    if transformer is None:
+        return
+    if not build_test_features(transformer):
+        return
     
     print("\n--- Proceso de creación de features completado ---")
 
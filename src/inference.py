@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 import joblib
 from pydantic import ValidationError
@@ -6,10 +7,13 @@ from typing import Dict, Any, Optional, Tuple, List
 
 # Dependencias de LangChain y OpenAI (usando las nuevas importaciones robustas)
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-# Importación CORREGIDA y compatible para el text splitter
-from langchain_text_splitters import CharacterTextSplitter 
+
+from src.bm25 import RETRIEVER_MODE
+from src.context_packer import ContextPacker
+from src.pred_cache import PREDICTION_CACHE, current_model_version
+from src.providers import get_chat_model, is_configured
+from src.rag import FAISS_PATH, IndexNotBuiltError, load_index, query_embeddings, read_manifest
+from src.transformer import TRANSFORMER_PATH, FeatureTransformer, load_transformer
 
 # Importación local de prompts (asumiendo que existen y tienen las variables esperadas)
 try:
@@ -32,53 +36,39 @@ except ImportError:
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY") 
 
 MODEL_PATH = "models/hypertension_model.joblib"
-RAG_DATA_PATH = "data/Dietary_TRAIN.csv" # Usamos el CSV simple para el RAG
-EMBEDDING_MODEL = "text-embedding-ada-002"
-LLM_MODEL = "gpt-3.5-turbo"
+RAG_INDEX_PATH = FAISS_PATH # Índice de data/kb construido por src/build_rag.py
 
-# --- RAG SYSTEM (In-Memory) ---
-def load_rag_system(rag_data_path: str = RAG_DATA_PATH) -> Tuple[Any, Any]:
+# --- RAG SYSTEM (índice prebuilt) ---
+def load_rag_system(index_path: str = RAG_INDEX_PATH) -> Tuple[Any, Any]:
     """
-    Carga y prepara el sistema RAG (Retrieval Augmented Generation) 
-    en memoria usando LangChain.
+    Carga el sistema RAG (Retrieval Augmented Generation) desde el índice
+    versionado que construye src/build_rag.py (el mismo que usa la API).
+    No reconstruye nada: si el índice no existe, el RAG queda deshabilitado.
     """
     
     # CRÍTICO: TRUCO FINAL para asegurar la lectura de la clave
     api_key_value = os.environ.get("OPENAI_API_KEY")
 
-    if not api_key_value:
+    if not is_configured(api_key_value):
         print("ADVERTENCIA: OPENAI_API_KEY no se pudo leer desde el entorno. El RAG fallará.")
         return None, None
     
     try:
-        # 1. Cargar datos simulados como texto
-        df_rag = pd.read_csv(rag_data_path)
-        rag_text = df_rag.to_string(index=False)
-
-        # 2. Splitter 
-        text_splitter = CharacterTextSplitter(
-            separator="\n\n",
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-        texts = text_splitter.create_documents([rag_text])
+        # 1. Retriever desde el índice prebuilt (embeddings de preguntas con el modelo del manifiesto)
+        embeddings = None
+        if RETRIEVER_MODE != "bm25":
+            embeddings = query_embeddings(read_manifest(index_path), api_key_value)
+        retriever, manifest = load_index(embeddings, RETRIEVER_MODE, index_path)
 
-        # 3. Embeddings (usando la clave leída explícitamente)
-        embeddings = OpenAIEmbeddings(openai_api_key=api_key_value, model=EMBEDDING_MODEL)
-
-        # 4. Vector Store (Chroma en memoria)
-        vectorstore = Chroma.from_documents(texts, embeddings)
-        
-        # 5. LLM (usando la clave leída explícitamente)
-        llm = ChatOpenAI(openai_api_key=api_key_value, model=LLM_MODEL, temperature=0.7)
+        # 2. LLM del proveedor configurado (src/providers.py, NEXUSBYTE_CHAT_MODEL)
+        llm = get_chat_model(temperature=0.7, api_key=api_key_value)
 
-        # 6. Retorno de Retriever y LLM
-        retriever = vectorstore.as_retriever()
-        
-        print("Sistema RAG cargado exitosamente.")
+        print(f"Sistema RAG cargado exitosamente (índice {manifest.version}).")
         return retriever, llm
 
+    except IndexNotBuiltError as e:
+        print(f"ERROR: {e}")
+        return None, None
     except Exception as e:
         # Si esto falla, es 99% la clave (fondos, validez, permisos)
         print(f"ERROR CRÍTICO FINAL AL INICIALIZAR RAG. Mensaje de LangChain/OpenAI: {e}")
@@ -95,20 +85,33 @@ def load_ml_model(model_path: str = MODEL_PATH) -> Any:
         print(f"Error al cargar el modelo ML: {e}")
         return None
 
-def get_risk_score(ml_model: Any, profile_data: Dict[str, Any], feature_cols: list) -> float:
-    """Calcula el score de riesgo de hipertensión."""
-    if ml_model is None:
+def load_feature_transformer(transformer_path: str = TRANSFORMER_PATH) -> Optional[FeatureTransformer]:
+    """Carga el transformador de features ajustado en train (perfil crudo -> feat_*)."""
+    try:
+        return load_transformer(transformer_path)
+    except Exception as e:
+        print(f"Error al cargar el transformador de features: {e}")
+        return None
+
+def get_risk_score(ml_model: Any, profile_data: Dict[str, Any],
+                   transformer: Optional[FeatureTransformer],
+                   model_version: Optional[str] = None) -> float:
+    """
+    Calcula el score de riesgo de hipertensión a partir del perfil crudo
+    ({columna NHANES: valor}, ver src/transformer.COLS_RAW).
+    El resultado se guarda en la caché compartida de predicciones, etiquetado
+    con 'model_version' (por defecto, la versión actual del artefacto en disco).
+    """
+    if ml_model is None or transformer is None:
         return -1.0 # Indica error o modelo no cargado
     
     try:
-        # Crear DataFrame con los datos del perfil y asegurar el orden de las features
-        data_for_prediction = pd.DataFrame([profile_data], columns=feature_cols)
-        data_for_prediction = data_for_prediction[feature_cols]
-
-        # Predicción (usando predict_proba)
-        risk_score = ml_model.predict_proba(data_for_prediction)[:, 1][0]
-        
-        return float(risk_score)
+        # Mismo mapeo, códigos de faltante e imputación que en el entrenamiento
+        row = transformer.transform_one(profile_data)
+        predict = lambda: ml_model.predict_proba(np.asarray([row], dtype=np.float32))[:, 1][0]
+        if PREDICTION_CACHE is None:
+            return float(predict())
+        return PREDICTION_CACHE.get_or_compute(row, model_version or current_model_version(), predict)
 
     except Exception as e:
         print(f"Error al calcular el score de riesgo: {e}")
@@ -131,7 +134,8 @@ def generate_rag_response(llm: Any, retriever: Any, user_query: str) -> str:
     try:
         # 1. Búsqueda (Retrieval)
         relevant_docs = retriever.get_relevant_documents(user_query)
-        rag_context = "\n---\n".join([doc.page_content for doc in relevant_docs])
+        # Sin duplicados, por relevancia y dentro del presupuesto de tokens
+        rag_context = ContextPacker().pack(user_query, relevant_docs).text
 
         # 2. Generación (Augmentation)
         # Usamos la user_query como el principal 'risk_drivers' en el template para darle contexto completo.
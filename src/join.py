@@ -0,0 +1,137 @@
+# Contenido para: src/join.py
+#
+# Motor de join multi-tabla por SEQN para load.merge_files.
+#
+# En vez de encadenar pd.merge(how='outer') (que copia la tabla ancha completa
+# en cada paso), se construye UN índice con la unión ordenada de todos los
+# SEQN, se reserva cada columna de salida una sola vez con su largo final y
+# cada tabla se "esparce" en sus posiciones con np.searchsorted.
+# El resultado no depende del orden de los archivos: las tablas se procesan
+# en orden de nombre (con la base primero) y las columnas compartidas (year)
+# se combinan tomando el primer valor no nulo.
+
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+KEY_COL = 'SEQN'
+SHARED_COLS = ('year',)
+
+
+@dataclass
+class TableReport:
+    """Conteos de match de una tabla contra el índice global."""
+    name: str
+    rows: int
+    keys: int          # SEQN distintos en la tabla
+    duplicates: int    # Filas con SEQN repetido (se conserva la primera)
+    coverage: float    # Fracción del índice global presente en la tabla
+    matched_base: Optional[int] = None  # SEQN que también están en la tabla base
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _table_order(names: Sequence[str], base: Optional[str]) -> List[str]:
+    ordered = sorted(names)
+    if base in ordered:
+        ordered.remove(base)
+        ordered.insert(0, base)
+    return ordered
+
+
+def _allocate(dtype, n: int):
+    """Columna vacía (todo nulo) de largo n, en un dtype que admita nulos."""
+    if isinstance(dtype, pd.core.dtypes.dtypes.BaseMaskedDtype):
+        # Int8/Int16/...: datos en cero y máscara completa (sin crear n objetos pd.NA)
+        return dtype.construct_array_type()(np.zeros(n, dtype=dtype.numpy_dtype), np.ones(n, dtype=bool))
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(np.full(n, -1, dtype=np.int8), dtype=dtype)
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return pd.array(np.full(n, None, dtype=object), dtype=dtype)
+    if dtype.kind == 'f':
+        return np.full(n, np.nan, dtype=dtype)
+    if dtype.kind in 'iub':
+        return np.full(n, np.nan, dtype=np.float64)  # Igual que un outer merge
+    return np.full(n, None, dtype=object)
+
+
+def _source(values: pd.Series):
+    """Valores a esparcir: el ExtensionArray (Int8, string...) o el array numpy."""
+    if isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+        return values.array
+    return values.to_numpy()
+
+
+def join_on_seqn(tables: Dict[str, pd.DataFrame],
+                 base: Optional[str] = None,
+                 key: str = KEY_COL,
+                 shared_cols: Sequence[str] = SHARED_COLS) -> Tuple[pd.DataFrame, List[TableReport]]:
+    """
+    Une todas las tablas por 'key' (outer join) en una sola pasada.
+    Devuelve (tabla_ancha, reporte_por_tabla).
+    """
+    order = _table_order(list(tables), base)
+
+    # 1. Índice global: unión ordenada de todos los SEQN
+    table_keys = {name: tables[name][key].to_numpy() for name in order}
+    non_empty = [k for k in table_keys.values() if len(k)]
+    index = np.unique(np.concatenate(non_empty)) if non_empty else np.array([], dtype=np.float64)
+    n = len(index)
+
+    # 2. Posiciones de cada tabla en el índice (y filas duplicadas a descartar)
+    positions = {}
+    keep_rows = {}
+    reports = []
+    base_keys = np.unique(table_keys[base]) if base in table_keys else None
+    for name in order:
+        keys = table_keys[name]
+        unique_keys, first_rows = np.unique(keys, return_index=True)
+        first_rows.sort()
+        keep_rows[name] = first_rows
+        positions[name] = np.searchsorted(index, keys[first_rows])
+        reports.append(TableReport(
+            name=name,
+            rows=len(keys),
+            keys=len(unique_keys),
+            duplicates=len(keys) - len(unique_keys),
+            coverage=(len(unique_keys) / n) if n else 0.0,
+            matched_base=(int(np.isin(unique_keys, base_keys, assume_unique=True).sum())
+                          if base_keys is not None else None),
+        ))
+
+    # 3. Reservar cada columna de salida una sola vez y esparcir los valores
+    columns = {key: index}
+    for name in order:
+        df = tables[name]
+        pos = positions[name]
+        rows = keep_rows[name]
+        for col in df.columns:
+            if col == key:
+                continue
+            values = df[col].iloc[rows] if len(rows) != len(df) else df[col]
+            if col in shared_cols:
+                if col not in columns:
+                    columns[col] = _allocate(values.dtype, n)
+                # Rellenar solo donde aún falta (la primera tabla con dato gana)
+                target = columns[col]
+                missing = np.asarray(pd.isna(target[pos]))
+                target[pos[missing]] = _source(values)[missing]
+                continue
+            out_name = col if col not in columns else f"{col}_{name}"
+            target = _allocate(values.dtype, n)
+            target[pos] = _source(values)
+            columns[out_name] = target
+
+    # Las columnas compartidas van al final, como en los CSV de origen.
+    # Si quedaron completas y enteras (p.ej. year), se devuelven como enteros.
+    shared = {col: columns.pop(col) for col in shared_cols if col in columns}
+    for col, values in shared.items():
+        if isinstance(values, np.ndarray) and values.dtype.kind == 'f' \
+                and not np.isnan(values).any() and np.array_equal(values, np.floor(values)):
+            shared[col] = values.astype(np.int64)
+    columns.update(shared)
+    wide = pd.DataFrame(columns, copy=False)
+    return wide, reports
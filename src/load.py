@@ -3,78 +3,124 @@
 import pandas as pd
 import glob
 import os
+import sys
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src.join import join_on_seqn
+from src.schema import apply_schema, memory_mb, sparsify
+from src.storage import write_table
 
 
 # Define los directorios
 # Asumimos que este script se ejecuta desde el directorio raíz (NexusByte/)
 # así: python src/load.py
 ROOT_DIR = "." 
+RAW_DIR = "data/raw"  # Datasets Parquet particionados por año (xpt_reader.py)
 OUTPUT_DIR = "data/processed"
 
 # Asegurarse de que el directorio de salida exista
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+def find_component_files(file_suffix, warn=True):
+    """
+    Devuelve {nombre_componente: ruta}. Por componente, prefiere el dataset
+    columnar de data/raw/<Componente>_<SPLIT>/ y, si no existe (p.ej. falló
+    su conversión), usa el CSV antiguo de la raíz. Con 'warn', avisa de los
+    componentes a los que les falta el dataset.
+    """
+    split_suffix = file_suffix.replace(".csv", "")
+    datasets = {
+        os.path.basename(path)[:-len(split_suffix)]: path
+        for path in glob.glob(f"{RAW_DIR}/*{split_suffix}") if os.path.isdir(path)
+    }
+    csvs = {
+        os.path.basename(path)[:-len(file_suffix)]: path
+        for path in glob.glob(f"{ROOT_DIR}/*{file_suffix}")
+    }
+    if warn and datasets and csvs:
+        for name in sorted(set(csvs) - set(datasets)):
+            print(f"  AVISO: '{name}' no tiene dataset en {RAW_DIR}; se usa el CSV {csvs[name]}.")
+    return {**csvs, **datasets}
+
+
+def read_component(path):
+    """
+    Lee un componente (dataset Parquet particionado por año o CSV)
+    con los dtypes compactos del registro de src/schema.py.
+    """
+    if os.path.isdir(path):
+        df = pd.read_parquet(path)
+        df['year'] = df['year'].astype(int)  # La partición llega como categoría
+    else:
+        df = pd.read_csv(path, low_memory=False)
+    return apply_schema(df, sparse=False)
+
+
 def merge_files(file_suffix, output_filename):
     """
-    Encuentra todos los CSV con un sufijo, los une por 'SEQN' y los guarda.
+    Encuentra todos los componentes con un sufijo, los une por 'SEQN' y los guarda.
+    Cada tabla se lee una sola vez y el join se hace en una sola pasada
+    (ver src/join.py), así que el resultado no depende del orden de los archivos.
     """
     print(f"\n--- Iniciando merge para: {output_filename} ---")
     
-    # 1. Encontrar todos los archivos CSV que coincidan
-    files_to_merge = glob.glob(f"{ROOT_DIR}/*{file_suffix}")
+    # 1. Encontrar todos los componentes que coincidan
+    component_files = find_component_files(file_suffix)
     
-    if not files_to_merge:
+    if not component_files:
         print(f"AVISO: No se encontraron archivos con el sufijo {file_suffix}")
         return
 
-    print(f"Se encontraron {len(files_to_merge)} archivos para unir.")
-    
-    # 2. Cargar el primer archivo como base
-    # (Usaremos AgeAndSex como base, ya que es el archivo demográfico)
-    base_file = f"{ROOT_DIR}/AgeAndSex{file_suffix}"
-    if not os.path.exists(base_file):
-        print(f"ERROR: No se encuentra el archivo base {base_file}.")
-        return
-        
-    base_df = pd.read_csv(base_file)
-    print(f"  Cargando base: {base_file} (Filas: {len(base_df)})")
+    print(f"Se encontraron {len(component_files)} archivos para unir.")
     
-    # Lista de archivos restantes para unir
-    files_to_merge.remove(base_file)
-
-    # 3. Iterar y unir (merge) los archivos restantes
-    for file_path in files_to_merge:
-        df_to_merge = pd.read_csv(file_path)
-        print(f"  Uniendo con: {file_path} (Filas: {len(df_to_merge)})")
-        
-        # Eliminar la columna 'year' de los archivos secundarios para evitar
-        # conflictos (year_x, year_y)
-        if 'year' in df_to_merge.columns:
-            df_to_merge = df_to_merge.drop(columns=['year'])
-
-        # Unir usando 'SEQN' (ID del participante)
-        # 'how=outer' asegura que no perdamos participantes si faltan en un archivo
-        base_df = pd.merge(base_df, df_to_merge, on='SEQN', how='outer')
-
-    # 4. Guardar el archivo final
+    # 2. Tabla base: AgeAndSex (demográfico). Si falta, se une igual y se avisa.
+    base_name = "AgeAndSex"
+    if base_name not in component_files:
+        print(f"  AVISO: No se encuentra el archivo base {base_name}{file_suffix}. "
+              "Se unirá sin tabla base (las filas salen de la unión de todos los SEQN).")
+        base_name = None
+
+    # 3. Leer cada tabla una sola vez
+    tables = {}
+    for name, file_path in sorted(component_files.items()):
+        tables[name] = read_component(file_path)
+        print(f"  Cargando: {file_path} (Filas: {len(tables[name])})")
+
+    # 4. Join de una sola pasada sobre el índice global de SEQN
+    base_df, reports = join_on_seqn(tables, base=base_name)
+
+    print("  Conteos de match por tabla:")
+    for report in reports:
+        base_info = f", en base: {report.matched_base}" if report.matched_base is not None else ""
+        print(f"    {report.name:<18} filas: {report.rows:>6}, SEQN: {report.keys:>6}, "
+              f"duplicados: {report.duplicates}, cobertura: {report.coverage:.1%}{base_info}")
+
+    # 5. Guardar el archivo final (con el reporte en los metadatos)
     final_output_path = os.path.join(OUTPUT_DIR, output_filename)
-    base_df.to_csv(final_output_path, index=False)
+    write_table(base_df, final_output_path, stage="load",
+                metadata={"join_report": [report.as_dict() for report in reports]})
     
     print(f"\n✅ Merge completado. Archivo guardado en: {final_output_path}")
     print(f"  Dimensiones finales (Filas, Columnas): {base_df.shape}")
+    print(f"  Memoria en uso: {memory_mb(base_df):.1f} MB "
+          f"({memory_mb(sparsify(base_df.copy())):.1f} MB con columnas dispersas)")
 
 if __name__ == "__main__":
     
     # Crear la base de datos de ENTRENAMIENTO
     merge_files(
         file_suffix="_TRAIN.csv",
-        output_filename="train_dataset.csv"
+        output_filename="train_dataset.parquet"
     )
     
     # Crear la base de datos de TEST
     merge_files(
         file_suffix="_TEST.csv",
-        output_filename="test_dataset.csv"
+        output_filename="test_dataset.parquet"
     )
     
     print("\n--- PROCESO DE MERGE COMPLETADO ---")
\ No newline at end of file
@@ -0,0 +1,103 @@
+# Contenido para: src/local_llm.py
+#
+# Backend local determinista de src/providers.py (NEXUSBYTE_LLM_PROVIDER=local):
+# embeddings y chat model sin red ni clave, para tests, benchmarks
+# (src/eval.py) y pruebas de carga. Se importa solo cuando se usa: arrastra
+# LangChain, que la API carga de forma diferida.
+
+import asyncio
+import hashlib
+import time
+from typing import Iterator, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.bm25 import tokenize
+from src.providers import LOCAL_CHAT_MODEL, LOCAL_EMBEDDING_DIM, LOCAL_EMBEDDING_PREFIX
+
+
+class DeterministicEmbeddings(Embeddings):
+    """
+    Embeddings por hashing de términos (tokenizador de src/bm25.py): textos
+    con palabras en común quedan cerca, igual que con un modelo real, y el
+    resultado no depende de la red ni del azar.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"{LOCAL_EMBEDDING_PREFIX}{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float64)
+        for term in tokenize(text):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+ANSWER_SENTENCES = (
+    "Reduce la sal a menos de 5 g al día y prioriza frutas y verduras.",
+    "Camina 30 minutos al menos cinco días por semana.",
+    "Intenta dormir entre 7 y 8 horas con horarios regulares.",
+    "Si fumas, buscar ayuda para dejarlo baja tu riesgo cardiovascular.",
+    "Mide tu presión en casa y anota los valores para tu médico.",
+    "Limita el alcohol y las bebidas azucaradas.",
+    "La dieta DASH incluye granos enteros, lácteos descremados y legumbres.",
+    "Técnicas de respiración de 5 minutos ayudan a manejar el estrés.",
+)
+
+
+class DeterministicChatModel(BaseChatModel):
+    """
+    Chat model local: la respuesta depende solo del prompt (hash), admite
+    streaming y puede simular la latencia del LLM (por token) para pruebas de carga.
+    """
+
+    sentences: int = 4
+    token_delay_s: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return LOCAL_CHAT_MODEL
+
+    def _answer(self, messages) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "little")
+        picks = [ANSWER_SENTENCES[(seed >> (8 * i)) % len(ANSWER_SENTENCES)] for i in range(self.sentences)]
+        return " ".join(picks)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._answer(messages)
+        if self.token_delay_s:
+            time.sleep(self.token_delay_s * len(text.split(" ")))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._answer(messages)
+        if self.token_delay_s:
+            await asyncio.sleep(self.token_delay_s * len(text.split(" ")))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for word in self._answer(messages).split(" "):
+            if self.token_delay_s:
+                time.sleep(self.token_delay_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self._answer(messages).split(" "):
+            if self.token_delay_s:
+                await asyncio.sleep(self.token_delay_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
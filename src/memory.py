@@ -0,0 +1,249 @@
+# Contenido para: src/memory.py
+#
+# Memoria de conversación con presupuesto de tokens para /chat.
+#
+# El cliente envía todo el 'history' en cada llamada; unirlo tal cual hace
+# crecer el prompt (latencia y costo) sin límite hasta chocar con la ventana
+# de contexto. Aquí:
+#   - Los turnos recientes se conservan literales, del más nuevo al más viejo,
+#     mientras entren en HISTORY_TOKEN_BUDGET.
+#   - Los turnos más viejos se pliegan en un resumen (de a lo más
+#     SUMMARY_TOKEN_BUDGET tokens). El resumen se cachea por prefijo de la
+#     conversación: en la siguiente llamada de la misma sesión solo se
+#     resumen los turnos que salieron de la ventana desde la vez anterior.
+#   - Los tokens se cuentan con tiktoken (codificación del modelo de chat).
+#     Si la codificación no se puede cargar (sin red para bajarla), se usa
+#     una aproximación de ~4 caracteres por token y se avisa una vez.
+# Los conteos por petición se exportan en /metrics.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.metrics import REGISTRY
+
+# --- Configuración ---
+TOKEN_MODEL = os.getenv("NEXUSBYTE_TOKEN_MODEL", os.getenv("NEXUSBYTE_CHAT_MODEL", "gpt-3.5-turbo"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("NEXUSBYTE_HISTORY_TOKENS", "1200"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("NEXUSBYTE_SUMMARY_TOKENS", "300"))
+SUMMARY_CACHE_SIZE = int(os.getenv("NEXUSBYTE_SUMMARY_CACHE", "1024"))
+CHARS_PER_TOKEN = 4  # Aproximación si tiktoken no está disponible
+
+SUMMARY_HEADER = "Resumen de la conversación anterior:"
+
+TOKEN_BUCKETS = (0, 50, 100, 200, 400, 800, 1200, 1600, 2400, 3200, 4800, 8000, 16000)
+
+_TOKENS = REGISTRY.histogram(
+    "nexusbyte_chat_history_tokens", "Tokens del historial por petición (recibido vs. enviado al prompt).",
+    ("stage",), buckets=TOKEN_BUCKETS)
+_SUMMARIES = REGISTRY.counter(
+    "nexusbyte_chat_summary_requests_total", "Resúmenes de historial (cacheados o nuevos).", ("result",))
+
+
+# --- Conteo de tokens ---
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(TOKEN_MODEL)
+                except Exception as e:
+                    _encoding_failed = True
+                    print(f"AVISO: tiktoken no disponible ({type(e).__name__}); se aproximan los tokens "
+                          f"con {CHARS_PER_TOKEN} caracteres por token.")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Recorta 'text' a max_tokens (el principio, o el final con keep_end)."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = max_tokens * CHARS_PER_TOKEN
+        return text[-limit:] if keep_end else text[:limit]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+
+# --- Turnos ---
+def format_turn(message: Dict[str, str]) -> str:
+    return f"{message.get('role', 'user')}: {message.get('content', '')}"
+
+
+def prefix_keys(turns: Sequence[str]) -> List[str]:
+    """Hash encadenado de cada prefijo: keys[i] identifica turns[:i + 1]."""
+    keys, current = [], b""
+    for turn in turns:
+        current = hashlib.sha256(current + turn.encode("utf-8")).digest()
+        keys.append(current.hex())
+    return keys
+
+
+@dataclass
+class MemoryResult:
+    text: str                 # Lo que va a {chat_history} en el prompt
+    input_tokens: int         # Tokens del historial completo recibido
+    history_tokens: int       # Tokens enviados (resumen + turnos recientes)
+    summary_tokens: int
+    recent_turns: int
+    folded_turns: int
+    summary: str = ""         # Resumen de los primeros 'folded_turns' turnos
+
+
+Summarizer = Callable[[str, str], Awaitable[str]]  # (resumen previo, turnos nuevos) -> resumen
+
+
+class ConversationMemory:
+    """
+    Arma el historial para el prompt dentro de 'token_budget'. 'summarize'
+    (async) condensa los turnos viejos; sin él (o si falla) se guarda un
+    extracto recortado de esos turnos.
+    """
+
+    def __init__(self, summarize: Optional[Summarizer] = None, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 summary_budget: int = SUMMARY_TOKEN_BUDGET, cache_size: int = SUMMARY_CACHE_SIZE):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_budget = min(summary_budget, token_budget)
+        self.cache_size = cache_size
+        # hash del prefijo de turnos plegados -> (n_turnos, resumen)
+        self._summaries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Caché de resúmenes por prefijo ---
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._summaries.get(key)
+            if entry is None:
+                return None
+            self._summaries.move_to_end(key)
+            return entry[1]
+
+    def _remember(self, key: str, n_turns: int, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = (n_turns, summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    def _longest_cached_prefix(self, keys: Sequence[str]) -> Tuple[int, str]:
+        # Prefijos más largos primero: el de la llamada anterior suele estar cerca del final
+        for n in range(len(keys) - 1, 0, -1):
+            summary = self._cached(keys[n - 1])
+            if summary is not None:
+                return n, summary
+        return 0, ""
+
+    async def _summary_for(self, folded: List[str]) -> str:
+        keys = prefix_keys(folded)
+        summary = self._cached(keys[-1])
+        if summary is not None:
+            _SUMMARIES.labels(result="cached").inc()
+            return summary
+
+        start, previous = self._longest_cached_prefix(keys)
+        new_turns = "\n".join(folded[start:])
+        summary = None
+        if self.summarize is not None:
+            try:
+                summary = await self.summarize(previous, new_turns)
+                _SUMMARIES.labels(result="llm").inc()
+            except Exception as e:
+                print(f"AVISO: no se pudo resumir el historial: {e}")
+        if summary is None:
+            # Sin resumidor: extracto con lo más reciente de los turnos plegados
+            summary = "\n".join(filter(None, [previous, new_turns]))
+            _SUMMARIES.labels(result="extract").inc()
+        summary = truncate_tokens(summary.strip(), self.summary_budget, keep_end=self.summarize is None)
+        self._remember(keys[-1], len(folded), summary)
+        return summary
+
+    # --- API pública ---
+    async def build(self, history: Sequence[Dict[str, str]], summary: str = "",
+                    summary_turns: int = 0) -> MemoryResult:
+        """
+        Historial para el prompt. 'summary' / 'summary_turns' (p.ej. guardados
+        en la sesión, src/sessions.py) resumen los primeros turnos de 'history':
+        se reutilizan aunque esta instancia no los haya calculado.
+        """
+        turns = [format_turn(m) for m in history]
+        if summary and 0 < summary_turns <= len(turns):
+            self._remember(prefix_keys(turns[:summary_turns])[-1], summary_turns, summary)
+        costs = [count_tokens(t) + 1 for t in turns]  # +1 por el salto de línea
+        input_tokens = sum(costs)
+        _TOKENS.labels(stage="input").observe(input_tokens)
+
+        if input_tokens <= self.token_budget:
+            text = "\n".join(turns)
+            _TOKENS.labels(stage="prompt").observe(input_tokens)
+            return MemoryResult(text, input_tokens, input_tokens, 0, len(turns), 0)
+
+        # Turnos recientes literales, dejando lugar para el resumen
+        available = self.token_budget - self.summary_budget - count_tokens(SUMMARY_HEADER) - 1
+        recent: List[str] = []
+        used = 0
+        for turn, cost in zip(reversed(turns), reversed(costs)):
+            if used + cost > available:
+                break
+            recent.append(turn)
+            used += cost
+        if not recent and turns:
+            # El último turno por sí solo excede el presupuesto: se conserva su final
+            recent.append(truncate_tokens(turns[-1], max(available - 1, 1), keep_end=True))
+            used = count_tokens(recent[0]) + 1
+        recent.reverse()
+
+        folded = turns[:len(turns) - len(recent)]
+        summary = await self._summary_for(folded) if folded else ""  # Reemplaza al recibido
+        parts = [f"{SUMMARY_HEADER} {summary}"] if summary else []
+        text = "\n".join(parts + recent)
+        summary_tokens = count_tokens(summary) if summary else 0
+        history_tokens = count_tokens(text)
+        _TOKENS.labels(stage="prompt").observe(history_tokens)
+        return MemoryResult(text, input_tokens, history_tokens, summary_tokens, len(recent), len(folded), summary)
+
+
+SUMMARY_PROMPT = """Resume en español, en pocas frases, la conversación entre un usuario y NexusByte
+(coach de salud). Conserva los datos personales que el usuario haya dado, sus objetivos y los
+consejos ya entregados. No agregues información nueva.
+
+Resumen previo:
+{previous}
+
+Turnos nuevos:
+{turns}
+
+Resumen actualizado:"""
+
+
+def make_llm_summarizer(llm) -> Summarizer:
+    """Resumidor con el mismo LLM del coach (prompt -> llm -> texto)."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    chain = PromptTemplate.from_template(SUMMARY_PROMPT) | llm | StrOutputParser()
+
+    async def summarize(previous: str, turns: str) -> str:
+        return await chain.ainvoke({"previous": previous or "(ninguno)", "turns": turns})
+
+    return summarize
@@ -0,0 +1,422 @@
+# Contenido para: src/metrics.py
+#
+# Métricas en memoria (contadores, gauges e histogramas) con exportación en
+# el formato de texto de Prometheus, para el endpoint /metrics de la API.
+# Sin dependencias externas: cada métrica guarda sus valores por combinación
+# de etiquetas y se protege con un lock (la API usa hilos y asyncio).
+#
+# Al final, la instrumentación de la API: latencia por etapa (features,
+# modelo, embeddings, búsqueda, armado del prompt, LLM), peticiones, errores
+# y tokens por endpoint. En la ruta caliente, registrar una etapa cuesta un
+# perf_counter() y una búsqueda binaria (~1 µs).
+
+import contextvars
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Buckets por defecto (segundos), pensados para latencias de la API
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    body = ",".join(f'{k}="{escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()  # Se exporta aunque valga 0
+
+    def labels(self, *values, **kwargs):
+        """Hijo de la métrica para una combinación de etiquetas."""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}")
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} tiene etiquetas {self.labelnames}; usa .labels(...)")
+        return self.labels()
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Valor que solo crece (peticiones, errores, tokens...)."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    @property
+    def value(self) -> float:
+        return self._default().value
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """El valor se lee de 'function' al exportar (p.ej. largo de una cola)."""
+        self.function = function
+
+    def get(self) -> float:
+        return float(self.function()) if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (profundidad de cola, elementos en caché...)."""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default().set_function(function)
+
+    def get(self) -> float:
+        return self._default().get()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # El último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)  # Primer bucket con value <= límite
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "Timer":
+        """with hist.time(): ... -> observa los segundos transcurridos."""
+        return Timer(self)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return {"buckets": list(self.buckets) + [math.inf], "cumulative": cumulative,
+                "sum": total, "count": count}
+
+    def quantile(self, q: float) -> float:
+        """Cuantil aproximado (límite superior del bucket que lo contiene)."""
+        snap = self.snapshot()
+        if not snap["count"]:
+            return math.nan
+        target = q * snap["count"]
+        for bound, cum in zip(snap["buckets"], snap["cumulative"]):
+            if cum >= target:
+                return bound
+        return math.inf
+
+
+class Timer:
+    """Context manager que observa la duración del bloque en un histograma."""
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    """Distribución de valores en buckets acumulados (latencias, tamaños de lote...)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> "Timer":
+        return self._default().time()
+
+    def snapshot(self) -> Dict[str, object]:
+        return self._default().snapshot()
+
+    def _render_child(self, values, child):
+        snap = child.snapshot()
+        lines = []
+        for bound, cum in zip(snap["buckets"], snap["cumulative"]):
+            labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cum}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(snap['sum'])}")
+        lines.append(f"{self.name}_count{labels} {snap['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas por nombre; pedir dos veces la misma devuelve la misma."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La métrica '{name}' ya existe con otro tipo.")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (text/plain 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro global del proceso
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Instrumentación de la API ---
+# Etapas de una petición; /chat lento se puede atribuir a una de ellas.
+STAGES = ("feature_prep", "model_scoring", "embedding", "retrieval", "prompt_build",
+          "llm_first_token", "llm_total")
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "nexusbyte_stage_seconds", "Latencia por etapa (" + ", ".join(STAGES) + ").", ("stage",),
+    buckets=STAGE_BUCKETS)
+REQUESTS = REGISTRY.counter(
+    "nexusbyte_http_requests_total", "Peticiones por endpoint y código de estado.", ("endpoint", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "nexusbyte_http_request_seconds", "Latencia total por endpoint (hasta el último byte).", ("endpoint",),
+    buckets=STAGE_BUCKETS)
+ERRORS = REGISTRY.counter(
+    "nexusbyte_errors_total", "Errores por endpoint (http = 5xx, exception, stream = falla a mitad del stream).",
+    ("endpoint", "kind"))
+LLM_TOKENS = REGISTRY.counter(
+    "nexusbyte_llm_tokens_total", "Tokens enviados al LLM y generados, por endpoint.", ("endpoint", "kind"))
+
+# Hijos resueltos de antemano: sin lock ni armado de etiquetas en la ruta caliente
+_STAGE_CHILDREN = {name: STAGE_SECONDS.labels(stage=name) for name in STAGES}
+
+# Endpoint (plantilla de la ruta, p.ej. /sessions/{session_id}) de la petición en curso
+_CURRENT_SCOPE: contextvars.ContextVar = contextvars.ContextVar("nexusbyte_request_scope", default=None)
+
+
+def stage(name: str) -> Timer:
+    """with stage("retrieval"): ... -> observa la duración en nexusbyte_stage_seconds."""
+    return Timer(_STAGE_CHILDREN[name])
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    _STAGE_CHILDREN[name].observe(seconds)
+
+
+UNMATCHED_ENDPOINT = "unmatched"
+
+
+def _endpoint(scope) -> str:
+    # Solo plantillas de rutas registradas: la ruta cruda (404 de scanners) haría crecer las series sin límite
+    return getattr(scope.get("route"), "path", None) or UNMATCHED_ENDPOINT
+
+
+def current_endpoint() -> str:
+    scope = _CURRENT_SCOPE.get()
+    return _endpoint(scope) if scope is not None else "none"
+
+
+def record_error(kind: str) -> None:
+    ERRORS.labels(endpoint=current_endpoint(), kind=kind).inc()
+
+
+def record_llm_tokens(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    endpoint = current_endpoint()
+    if prompt_tokens:
+        LLM_TOKENS.labels(endpoint=endpoint, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(endpoint=endpoint, kind="completion").inc(completion_tokens)
+
+
+class LLMCall:
+    """
+    Tiempos de una llamada al chain RAG. El paso 'prompt listo' (entre el
+    prompt y el LLM) marca el inicio del LLM, así que llm_first_token y
+    llm_total no incluyen la búsqueda ni el armado del contexto.
+    """
+    __slots__ = ("started", "llm_started", "first_token")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.llm_started: Optional[float] = None
+        self.first_token: Optional[float] = None
+
+    def prompt_ready(self, prompt_tokens: int) -> None:
+        self.llm_started = time.perf_counter()
+        record_llm_tokens(prompt_tokens=prompt_tokens)
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            observe_stage("llm_first_token", self.first_token - (self.llm_started or self.started))
+
+    def finish(self, completion_tokens: int) -> None:
+        observe_stage("llm_total", time.perf_counter() - (self.llm_started or self.started))
+        record_llm_tokens(completion_tokens=completion_tokens)
+
+
+# Llamada en curso (un objeto mutable: los pasos del chain que corren en
+# otras tareas o hilos ven la misma instancia aunque copien el contexto)
+_CURRENT_LLM_CALL: contextvars.ContextVar = contextvars.ContextVar("nexusbyte_llm_call", default=None)
+
+
+def start_llm_call() -> LLMCall:
+    call = LLMCall()
+    _CURRENT_LLM_CALL.set(call)
+    return call
+
+
+def current_llm_call() -> Optional[LLMCall]:
+    return _CURRENT_LLM_CALL.get()
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI: peticiones, latencia y errores por endpoint (plantilla
+    de la ruta, no la URL: /sessions/abc y /sessions/xyz son la misma serie).
+    También deja la petición en curso a mano de record_error / record_llm_tokens.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _CURRENT_SCOPE.set(scope)
+        start = time.perf_counter()
+        status = [500 if scope["type"] == "http" else 101]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        error_kind = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            error_kind = "exception"
+            raise
+        finally:
+            endpoint = _endpoint(scope)
+            REQUESTS.labels(endpoint=endpoint, status=status[0]).inc()
+            if scope["type"] == "http":
+                REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+                if error_kind is None and status[0] >= 500:
+                    error_kind = "http"
+            if error_kind is not None:
+                ERRORS.labels(endpoint=endpoint, kind=error_kind).inc()
+            _CURRENT_SCOPE.reset(token)
@@ -0,0 +1,170 @@
+# Contenido para: src/microbatch.py
+#
+# Micro-batching (opcional) para el tráfico concurrente de /predict.
+#
+# Cada petición deja su fila de features en una cola asyncio y espera un
+# Future. Un worker toma la primera fila, junta las que lleguen dentro de
+# la ventana (WINDOW_MS) hasta MAX_BATCH, puntúa todo el lote con UNA
+# llamada vectorizada (en un hilo) y resuelve el Future de cada petición.
+# Si la cola está llena (QUEUE_DEPTH), la petición se rechaza de inmediato.
+# Si el worker termina (error inesperado o stop()), las peticiones que
+# esperaban en su cola o en su lote fallan con WorkerStoppedError: ningún
+# Future queda colgado.
+#
+# Se activa con NEXUSBYTE_MICROBATCH=1; se exportan histogramas del tamaño
+# de lote y de la espera en cola (src/metrics.py -> /metrics).
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from src.metrics import REGISTRY, MetricsRegistry
+
+# --- Configuración ---
+ENABLED = os.getenv("NEXUSBYTE_MICROBATCH", "0") == "1"
+WINDOW_MS = float(os.getenv("NEXUSBYTE_MICROBATCH_WINDOW_MS", "2"))
+MAX_BATCH = int(os.getenv("NEXUSBYTE_MICROBATCH_MAX_BATCH", "64"))
+QUEUE_DEPTH = int(os.getenv("NEXUSBYTE_MICROBATCH_QUEUE_DEPTH", "1024"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+QUEUE_WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class QueueFullError(RuntimeError):
+    """La cola del micro-batcher está llena (la API responde 503)."""
+
+
+class WorkerStoppedError(RuntimeError):
+    """El worker terminó antes de puntuar la fila (la API responde 503)."""
+
+
+@dataclass
+class _Pending:
+    row: Sequence[float]
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class MicroBatcher:
+    """
+    Junta filas que llegan dentro de 'window_ms' (hasta 'max_batch') y las
+    puntúa con 'score_batch(X) -> scores'. El worker se inicia solo en el
+    primer submit, dentro del event loop que atiende las peticiones.
+    """
+
+    def __init__(self, score_batch: Callable[[np.ndarray], np.ndarray],
+                 window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH,
+                 queue_depth: int = QUEUE_DEPTH, registry: MetricsRegistry = REGISTRY):
+        self.score_batch = score_batch
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.queue_depth = queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: List[_Pending] = []  # Lote que el worker está puntuando
+
+        self.batch_size = registry.histogram(
+            "nexusbyte_microbatch_batch_size", "Filas por lote puntuado por el micro-batcher.",
+            buckets=BATCH_SIZE_BUCKETS)
+        self.queue_wait = registry.histogram(
+            "nexusbyte_microbatch_queue_wait_seconds", "Espera en cola antes de puntuar (segundos).",
+            buckets=QUEUE_WAIT_BUCKETS)
+        self.rejected = registry.counter(
+            "nexusbyte_microbatch_rejected_total", "Peticiones rechazadas por cola llena.")
+        registry.gauge("nexusbyte_microbatch_queue_depth", "Filas esperando en la cola.") \
+            .set_function(lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    def _ensure_started(self) -> None:
+        if self._worker is None or self._worker.done():
+            if self._worker is not None:
+                self._fail_pending()  # Por si el worker se canceló antes de arrancar
+            self._queue = asyncio.Queue(maxsize=self.queue_depth)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _fail_pending(self, cause: Optional[BaseException] = None) -> None:
+        """Resuelve con error los Futures del lote en curso y de la cola del worker."""
+        pending = self._inflight
+        self._inflight = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for item in pending:
+            if not item.future.done():
+                error = WorkerStoppedError("El worker del micro-batcher terminó antes de puntuar la fila.")
+                error.__cause__ = cause
+                item.future.set_exception(error)
+
+    async def submit(self, row: Sequence[float]) -> float:
+        """Encola una fila y espera su score. Lanza QueueFullError si no hay lugar."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_Pending(row, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected.inc()
+            raise QueueFullError(f"Cola de predicción llena ({self.queue_depth}).")
+        return await future
+
+    async def _collect(self) -> List[_Pending]:
+        batch = self._inflight = [await self._queue.get()]  # A la vista de _fail_pending
+        deadline = time.perf_counter() + self.window_s
+        while len(batch) < self.max_batch:
+            # Primero lo que ya está en la cola, sin esperar
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        try:
+            await self._serve()
+        except BaseException as e:  # Incluye la cancelación (stop())
+            self._fail_pending(e)
+            raise
+
+    async def _serve(self) -> None:
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            for item in batch:
+                self.queue_wait.observe(started - item.enqueued_at)
+            self.batch_size.observe(len(batch))
+
+            try:
+                X = np.asarray([item.row for item in batch], dtype=np.float32)
+                scores = np.asarray(await run_in_threadpool(self.score_batch, X), dtype=np.float64).reshape(-1)
+                if len(scores) != len(batch):
+                    raise ValueError(f"score_batch devolvió {len(scores)} scores para {len(batch)} filas.")
+            except Exception as e:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                self._inflight = []
+                continue
+            for item, score in zip(batch, scores.tolist()):
+                if not item.future.done():  # El cliente pudo haberse desconectado
+                    item.future.set_result(score)
+            self._inflight = []
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass  # Si el worker ya había muerto, sus peticiones ya recibieron el error
+            self._fail_pending()
+            self._worker = None
@@ -1,75 +1,139 @@
 # Contenido para: src/model.py
+#
+# Uso (desde la raíz del proyecto):
+#   python src/model.py                      # entrena con los parámetros por defecto
+#   python src/model.py --tune               # busca hiperparámetros (src/tuning.py) y guarda el mejor
+#   python src/model.py --tune --workers 4 --candidates 81
 
+import argparse
 import pandas as pd
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import roc_auc_score, average_precision_score, classification_report
 import os
+import sys
 import joblib # Se usará para guardar el modelo
+from typing import Any, Dict, Optional, Tuple
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src.storage import read_table, read_columns
 
 # --- Configuración ---
 DATA_DIR = "data/processed"
 MODEL_DIR = "models"
-INPUT_TRAIN = os.path.join(DATA_DIR, "train_final_features.csv")
+INPUT_TRAIN = os.path.join(DATA_DIR, "train_final_features.parquet")
 
 TARGET_COL = "TARGET_HIPERTENSION"
+VALIDATION_SIZE = 0.2  # 20% de los datos de entrenamiento para validar el modelo
+SEED = 42              # Para resultados reproducibles
+
+# Hiperparámetros del modelo por defecto (--tune guarda en cambio el mejor booster de la búsqueda)
+DEFAULT_PARAMS = {"n_estimators": 100}
 
 # Asegurarse de que el directorio de modelos exista
 os.makedirs(MODEL_DIR, exist_ok=True)
 MODEL_PATH = os.path.join(MODEL_DIR, "hypertension_model.joblib")
 
-def train_model():
-    print(f"--- Iniciando script: src/model.py ---")
-    
-    # 1. Cargar datos
+
+def load_training_data() -> Optional[Tuple[pd.DataFrame, pd.Series]]:
+    """Features ('feat_...') y target del set de entrenamiento; None (con el error impreso) si faltan."""
+    # Solo se leen las features ('feat_...') y el target
     try:
-        df_train = pd.read_csv(INPUT_TRAIN)
+        columns = [col for col in read_columns(INPUT_TRAIN) if col.startswith('feat_') or col == TARGET_COL]
+        df_train = read_table(INPUT_TRAIN, columns=columns)
     except FileNotFoundError:
         print(f"ERROR: No se encontró el archivo {INPUT_TRAIN}")
         print("Asegúrate de haber corrido src/features.py primero.")
-        return
+        return None
 
     print(f"Datos cargados. Dimensiones: {df_train.shape}")
-    
-    # 2. Separar Features (X) y Target (y)
+
+    # Separar Features (X) y Target (y)
     feature_cols = [col for col in df_train.columns if col.startswith('feat_')]
-    
+
     if not feature_cols:
         print("ERROR: No se encontraron 'features' (columnas 'feat_...').")
-        return
-        
+        return None
+
     X = df_train[feature_cols]
-    y = df_train[TARGET_COL]
-    
+    y = df_train[TARGET_COL].astype(int)  # Int8 (nullable) en disco
+
     print(f"Separando {len(feature_cols)} features y el target '{TARGET_COL}'.")
-    
-    # 3. Dividir en set de Entrenamiento y Validación
-    # Usaremos el 20% de los datos de entrenamiento para validar el modelo
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, 
-        test_size=0.2,    # 20% para validación
-        random_state=42,  # Para resultados reproducibles
+    return X, y
+
+
+def split_train_val(X: pd.DataFrame, y: pd.Series):
+    """Partición fija entrenamiento/validación (la misma para train_model y la búsqueda)."""
+    return train_test_split(
+        X, y,
+        test_size=VALIDATION_SIZE,
+        random_state=SEED,
         stratify=y        # Asegura que la proporción de 0s y 1s sea igual en ambos sets
     )
-    
+
+
+def scale_pos_weight(y_train: pd.Series) -> float:
+    # Crucial porque los datos están desbalanceados (~69% son 0 y ~31% son 1)
+    return (y_train == 0).sum() / (y_train == 1).sum()
+
+
+def evaluate_and_save(model: xgb.XGBClassifier, X_val: pd.DataFrame, y_val: pd.Series) -> Dict[str, float]:
+    """Métricas en el set de validación y guardado en MODEL_PATH; devuelve las métricas."""
+    print("\n--- Evaluación del Modelo (en set de validación) ---")
+    preds = model.predict(X_val)
+    proba_preds = model.predict_proba(X_val)[:, 1] # Probabilidades para la clase 1
+
+    # Métricas del PDF
+    auroc = roc_auc_score(y_val, proba_preds)
+    auprc = average_precision_score(y_val, proba_preds)
+
+    print(f"  AUROC (Area Under ROC Curve): {auroc:.4f}")
+    print(f"  AUPRC (Area Under PR Curve):  {auprc:.4f}")
+
+    print("\nReporte de Clasificación:")
+    print(classification_report(y_val, preds, target_names=['No Hipertenso (0)', 'Hipertenso (1)']))
+
+    joblib.dump(model, MODEL_PATH)
+    print(f"\n✅ Modelo guardado exitosamente en: {MODEL_PATH}")
+    return {"auroc": auroc, "auprc": auprc}
+
+
+def train_model(params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, float]]:
+    """
+    Entrena y guarda el modelo. 'params' reemplaza a DEFAULT_PARAMS; el resto
+    de la configuración no cambia. Devuelve las métricas de validación.
+    """
+    print(f"--- Iniciando script: src/model.py ---")
+
+    # 1. Cargar datos
+    data = load_training_data()
+    if data is None:
+        return None
+    X, y = data
+
+    # 2. Dividir en set de Entrenamiento y Validación
+    X_train, X_val, y_train, y_val = split_train_val(X, y)
+
     print(f"  Datos de entrenamiento: {X_train.shape}")
     print(f"  Datos de validación: {X_val.shape}")
-    
-    # 4. Entrenar el modelo (XGBoost)
+
+    # 3. Entrenar el modelo (XGBoost)
     print("\nIniciando entrenamiento de XGBoost...")
-    
-    # El 'scale_pos_weight' es crucial porque tus datos están desbalanceados
-    # (vimos que ~69% eran 0 y ~31% eran 1)
-    scale_pos_weight = (y_train == 0).sum() / (y_train == 1).sum()
-    
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    print(f"  Hiperparámetros: {params}")
+
     model = xgb.XGBClassifier(
         objective='binary:logistic',
         eval_metric='logloss',
-        scale_pos_weight=scale_pos_weight,
+        scale_pos_weight=scale_pos_weight(y_train),
         use_label_encoder=False,
-        n_estimators=100,
         early_stopping_rounds=10, # Parar si no mejora en 10 rondas
-        random_state=42
+        random_state=SEED,
+        **params
     )
 
     model.fit(
@@ -77,29 +141,25 @@ def train_model():
         eval_set=[(X_val, y_val)], # Evaluar contra el set de validación
         verbose=False # Puedes ponerlo en True si quieres ver el progreso
     )
-    
+
     print("✅ Entrenamiento completado.")
-    
-    # 5. Evaluar el modelo
-    print("\n--- Evaluación del Modelo (en set de validación) ---")
-    preds = model.predict(X_val)
-    proba_preds = model.predict_proba(X_val)[:, 1] # Probabilidades para la clase 1
 
-    # Métricas del PDF
-    auroc = roc_auc_score(y_val, proba_preds)
-    auprc = average_precision_score(y_val, proba_preds)
-    
-    print(f"  AUROC (Area Under ROC Curve): {auroc:.4f}")
-    print(f"  AUPRC (Area Under PR Curve):  {auprc:.4f}")
-    
-    print("\nReporte de Clasificación:")
-    print(classification_report(y_val, preds, target_names=['No Hipertenso (0)', 'Hipertenso (1)']))
-    
-    # 6. Guardar el modelo
-    joblib.dump(model, MODEL_PATH)
-    print(f"\n✅ Modelo guardado exitosamente en: {MODEL_PATH}")
-    
+    # 4. Evaluar y 5. guardar el modelo
+    metrics = evaluate_and_save(model, X_val, y_val)
+
     print("\n--- Proceso de entrenamiento completado ---")
+    return metrics
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Entrena el modelo de riesgo de hipertensión.")
+    parser.add_argument("--tune", action="store_true",
+                        help="Busca hiperparámetros con successive halving antes de entrenar.")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para --tune.")
+    parser.add_argument("--candidates", type=int, default=None, help="Configuraciones iniciales para --tune.")
+    args = parser.parse_args()
+
+    if args.tune:
+        from src.tuning import tune
+        tune(workers=args.workers, n_candidates=args.candidates)
+    else:
+        train_model()
@@ -0,0 +1,289 @@
+# Contenido para: src/pipeline.py
+#
+# Runner incremental del pipeline: load -> targets -> features -> model.
+#
+# - Cada etapa declara sus entradas, salidas y el código del que depende.
+#   Antes de correrla se calcula un hash de contenido (entradas + código +
+#   argumentos); si coincide con el de la última ejecución y las salidas
+#   existen, la etapa se salta.
+# - Las ramas TRAIN y TEST son independientes hasta 'features', así que se
+#   ejecutan en procesos paralelos (un proceso nuevo por etapa).
+# - Al final se imprime el tiempo de pared y el pico de memoria de cada etapa.
+#
+# Uso (desde la raíz del proyecto):
+#   python src/pipeline.py            # corre solo lo que cambió
+#   python src/pipeline.py --force    # corre todo
+#   python src/pipeline.py --dry-run  # muestra qué se correría
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src import features, load, model, targets
+
+# --- Configuración ---
+STATE_PATH = os.path.join("data", "processed", ".pipeline_state.json")
+MAX_WORKERS = int(os.getenv("NEXUSBYTE_PIPELINE_WORKERS", "2"))
+HASH_CHUNK = 1 << 20
+
+SRC_DIR = os.path.join(PROJECT_ROOT, "src")
+# Código que usan todas las etapas al leer/escribir: E/S, registro de dtypes y columnas a guardar
+SHARED_CODE = (
+    os.path.join(SRC_DIR, "storage.py"),
+    os.path.join(SRC_DIR, "schema.py"),
+    os.path.join(PROJECT_ROOT, "urls_and_columns.py"),
+)
+
+
+@dataclass
+class Stage:
+    """Una etapa del pipeline: qué función correr y de qué depende."""
+    name: str
+    module: str
+    func: str
+    outputs: Tuple[str, ...]
+    inputs: Union[Tuple[str, ...], Callable[[], Sequence[str]]] = ()
+    code: Tuple[str, ...] = ()
+    args: Tuple = ()
+    deps: Tuple[str, ...] = ()
+
+    def input_paths(self) -> List[str]:
+        return list(self.inputs() if callable(self.inputs) else self.inputs)
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # "ejecutada", "al día", "pendiente", "falló", "bloqueada"
+    wall_s: float = 0.0
+    peak_mb: Optional[float] = None
+    error: Optional[str] = None
+    digest: Optional[str] = None
+
+
+def _component_inputs(file_suffix: str) -> Callable[[], List[str]]:
+    return lambda: sorted(load.find_component_files(file_suffix, warn=False).values())
+
+
+def build_stages() -> List[Stage]:
+    """Grafo de etapas. Las rutas salen de las constantes de cada módulo."""
+    code = lambda *names: tuple(os.path.join(SRC_DIR, n) for n in names) + SHARED_CODE
+    train_dataset = os.path.join(load.OUTPUT_DIR, "train_dataset.parquet")
+    test_dataset = os.path.join(load.OUTPUT_DIR, "test_dataset.parquet")
+    return [
+        Stage("load_train", "src.load", "merge_files",
+              args=("_TRAIN.csv", "train_dataset.parquet"),
+              inputs=_component_inputs("_TRAIN.csv"), outputs=(train_dataset,),
+              code=code("load.py", "join.py")),
+        Stage("load_test", "src.load", "merge_files",
+              args=("_TEST.csv", "test_dataset.parquet"),
+              inputs=_component_inputs("_TEST.csv"), outputs=(test_dataset,),
+              code=code("load.py", "join.py")),
+        Stage("targets_train", "src.targets", "process_train", deps=("load_train",),
+              inputs=(targets.INPUT_TRAIN,), outputs=(targets.OUTPUT_TRAIN,),
+              code=code("targets.py")),
+        Stage("targets_test", "src.targets", "process_test", deps=("load_test",),
+              inputs=(targets.INPUT_TEST,), outputs=(targets.OUTPUT_TEST,),
+              code=code("targets.py")),
+        Stage("features_train", "src.features", "build_train_features", deps=("targets_train",),
+              inputs=(features.INPUT_TRAIN,), outputs=(features.OUTPUT_TRAIN, features.TRANSFORMER_PATH),
+              code=code("features.py", "transformer.py")),
+        # El test usa el transformador ajustado en train (medianas incluidas)
+        Stage("features_test", "src.features", "build_test_features",
+              deps=("targets_test", "features_train"),
+              inputs=(features.INPUT_TEST, features.TRANSFORMER_PATH), outputs=(features.OUTPUT_TEST,),
+              code=code("features.py", "transformer.py")),
+        Stage("model", "src.model", "train_model", deps=("features_train",),
+              inputs=(model.INPUT_TRAIN,), outputs=(model.MODEL_PATH,),
+              code=code("model.py")),
+    ]
+
+
+# --- Hash de contenido ---
+def _hash_file(path: str, digest) -> None:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+
+
+def _hash_path(path: str, digest) -> None:
+    digest.update(path.encode("utf-8"))
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+                _hash_file(file_path, digest)
+    elif os.path.exists(path):
+        _hash_file(path, digest)
+    else:
+        digest.update(b"<missing>")
+
+
+def stage_digest(stage: Stage) -> str:
+    """Hash de las entradas, el código y los argumentos de la etapa."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([stage.module, stage.func, list(stage.args)]).encode("utf-8"))
+    for path in stage.code:
+        _hash_path(path, digest)
+    for path in stage.input_paths():
+        _hash_path(path, digest)
+    return digest.hexdigest()
+
+
+# --- Estado persistido ---
+def load_state(path: str = STATE_PATH) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state: Dict[str, dict], path: str = STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(stage: Stage, digest: str, state: Dict[str, dict]) -> bool:
+    previous = state.get(stage.name)
+    return (previous is not None and previous.get("digest") == digest
+            and all(os.path.exists(p) for p in stage.outputs))
+
+
+# --- Ejecución en proceso hijo ---
+def _peak_memory_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso actual (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB; macOS, bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _execute_stage(module_name: str, func_name: str, args: Tuple) -> Dict:
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    getattr(module, func_name)(*args)
+    return {"wall_s": time.perf_counter() - start, "peak_mb": _peak_memory_mb()}
+
+
+def _outputs_written(stage: Stage, since: float) -> bool:
+    # 1 s de holgura para sistemas de archivos con mtime de baja resolución
+    return all(os.path.exists(p) and os.path.getmtime(p) >= since - 1.0 for p in stage.outputs)
+
+
+def run_pipeline(force: bool = False, max_workers: int = MAX_WORKERS,
+                 dry_run: bool = False, stages: Optional[List[Stage]] = None) -> List[StageResult]:
+    """
+    Corre el grafo de etapas. Las etapas listas (dependencias terminadas) se
+    ejecutan en paralelo, cada una en un proceso nuevo para medir su memoria.
+    """
+    stages = stages or build_stages()
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state()
+    results: Dict[str, StageResult] = {}
+    pending = [stage.name for stage in stages]
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) as executor:
+        while pending or running:
+            # 1. Lanzar (o saltar) las etapas cuyas dependencias terminaron
+            for name in list(pending):
+                stage = by_name[name]
+                dep_results = [results.get(dep) for dep in stage.deps]
+                if any(r is None for r in dep_results):
+                    continue
+                pending.remove(name)
+
+                if any(r.status in ("falló", "bloqueada") for r in dep_results):
+                    results[name] = StageResult(name, "bloqueada")
+                    continue
+                if dry_run and any(r.status == "pendiente" for r in dep_results):
+                    results[name] = StageResult(name, "pendiente")
+                    continue
+
+                digest = stage_digest(stage)
+                if not force and is_up_to_date(stage, digest, state):
+                    results[name] = StageResult(name, "al día", digest=digest)
+                    continue
+                if dry_run:
+                    results[name] = StageResult(name, "pendiente", digest=digest)
+                    continue
+
+                print(f"\n>>> Ejecutando etapa: {name}")
+                started_at = time.time()
+                future = executor.submit(_execute_stage, stage.module, stage.func, stage.args)
+                running[future] = (name, digest, started_at)
+
+            if not running:
+                continue
+
+            # 2. Esperar a que termine al menos una etapa
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name, digest, started_at = running.pop(future)
+                stage = by_name[name]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    results[name] = StageResult(name, "falló", error=str(e))
+                    continue
+
+                if not _outputs_written(stage, started_at):
+                    results[name] = StageResult(name, "falló", wall_s=info["wall_s"], peak_mb=info["peak_mb"],
+                                                error="La etapa no escribió sus salidas.")
+                    continue
+
+                results[name] = StageResult(name, "ejecutada", wall_s=info["wall_s"],
+                                            peak_mb=info["peak_mb"], digest=digest)
+                state[name] = {"digest": digest, "wall_s": info["wall_s"], "peak_mb": info["peak_mb"],
+                               "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                save_state(state)
+
+    return [results[stage.name] for stage in stages]
+
+
+def print_summary(results: List[StageResult]) -> None:
+    print("\n--- Resumen del pipeline ---")
+    print(f"  {'Etapa':<16} {'Estado':<10} {'Tiempo (s)':>10} {'Pico mem (MB)':>14}")
+    total = 0.0
+    for r in results:
+        peak = f"{r.peak_mb:.0f}" if r.peak_mb is not None else "-"
+        wall = f"{r.wall_s:.2f}" if r.status == "ejecutada" or r.wall_s else "-"
+        print(f"  {r.name:<16} {r.status:<10} {wall:>10} {peak:>14}")
+        if r.error:
+            print(f"      ERROR: {r.error}")
+        total += r.wall_s
+    print(f"  Tiempo total de etapas ejecutadas: {total:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline incremental load -> targets -> features -> model.")
+    parser.add_argument("--force", action="store_true", help="Ignora el estado y corre todas las etapas.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Procesos en paralelo.")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra qué etapas se correrían.")
+    args = parser.parse_args()
+
+    wall_start = time.perf_counter()
+    results = run_pipeline(force=args.force, max_workers=args.workers, dry_run=args.dry_run)
+    print_summary(results)
+    print(f"  Tiempo de pared total: {time.perf_counter() - wall_start:.2f} s")
@@ -0,0 +1,154 @@
+# Contenido para: src/pred_cache.py
+#
+# Caché de resultados de predicción (LRU + TTL) delante del modelo.
+#
+# El tráfico real repite mucho: Streamlit re-ejecuta todo el script con cada
+# cambio de widget y los sliders solo toman unos pocos valores. La clave es
+# el vector de features canonicalizado (redondeado a float32, la precisión
+# con la que XGBoost compara los umbrales, así que no cambia el resultado;
+# NaN -> None para que la tupla sea comparable) más la versión del modelo.
+#
+# La versión sale del artefacto en disco (mtime + tamaño). Cuando cambia,
+# las entradas de la versión anterior se descartan; VersionWatcher limita
+# los stat() a uno cada VERSION_CHECK_S segundos.
+#
+# La usan api/main.py (/predict) y src/inference.get_risk_score (app).
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from src.metrics import REGISTRY, MetricsRegistry
+
+# --- Configuración ---
+MODEL_PATH = os.path.join("models", "hypertension_model.joblib")
+ENABLED = os.getenv("NEXUSBYTE_PRED_CACHE", "1") == "1"
+MAX_ENTRIES = int(os.getenv("NEXUSBYTE_PRED_CACHE_SIZE", "4096"))
+TTL_S = float(os.getenv("NEXUSBYTE_PRED_CACHE_TTL_S", "3600"))
+VERSION_CHECK_S = float(os.getenv("NEXUSBYTE_MODEL_VERSION_CHECK_S", "2"))
+
+Key = Tuple[str, Tuple[Optional[float], ...]]
+
+
+def artifact_version(path: str = MODEL_PATH) -> str:
+    """Versión de un artefacto en disco: 'mtime_ns-tamaño' ('missing' si no existe)."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class VersionWatcher:
+    """
+    version_fn(path) (por defecto artifact_version), consultando el disco
+    como mucho cada 'interval_s' segundos.
+    """
+
+    def __init__(self, path: str = MODEL_PATH, interval_s: float = VERSION_CHECK_S,
+                 version_fn: Callable[[str], str] = artifact_version):
+        self.path = path
+        self.interval_s = interval_s
+        self.version_fn = version_fn
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if self._version is None or now - self._checked_at >= self.interval_s:
+                self._version = self.version_fn(self.path)
+                self._checked_at = now
+            return self._version
+
+
+def canonical_vector(row: Sequence[float]) -> Tuple[Optional[float], ...]:
+    """Vector redondeado a float32, con NaN -> None y -0.0 -> 0.0."""
+    return tuple(None if v != v else v + 0.0 for v in array("f", row).tolist())
+
+
+class PredictionCache:
+    """LRU con expiración por entrada, etiquetada por versión de modelo."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_s: float = TTL_S,
+                 registry: MetricsRegistry = REGISTRY):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Key, Tuple[float, float]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+        self._requests = registry.counter(
+            "nexusbyte_pred_cache_requests_total", "Consultas a la caché de predicciones.", ("result",))
+        self._invalidations = registry.counter(
+            "nexusbyte_pred_cache_invalidations_total", "Vaciados por cambio de versión del modelo.")
+        registry.gauge("nexusbyte_pred_cache_entries", "Entradas en la caché de predicciones.") \
+            .set_function(lambda: len(self._entries))
+
+    def _check_version(self, version: str) -> None:
+        # Con el lock tomado: una versión nueva invalida todo lo anterior
+        if version != self._version:
+            if self._entries:
+                self._entries.clear()
+                self._invalidations.inc()
+            self._version = version
+
+    def get(self, row: Sequence[float], version: str) -> Optional[float]:
+        key = (version, canonical_vector(row))
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = "hit"
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                result = "expired" if entry is not None else "miss"
+        self._requests.labels(result=result).inc()
+        return entry[0] if result == "hit" else None
+
+    def put(self, row: Sequence[float], version: str, score: float) -> None:
+        key = (version, canonical_vector(row))
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (score, time.monotonic() + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, row: Sequence[float], version: str, compute: Callable[[], float]) -> float:
+        """Score desde la caché o, si no está, compute() y se guarda."""
+        score = self.get(row, version)
+        if score is None:
+            score = float(compute())
+            self.put(row, version, score)
+        return score
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0, "version": self._version}
+
+
+# Instancias compartidas del proceso (API o app)
+PREDICTION_CACHE = PredictionCache() if ENABLED else None
+MODEL_WATCHER = VersionWatcher(MODEL_PATH)
+
+
+def current_model_version() -> str:
+    """Versión actual del artefacto del modelo (stat con límite de frecuencia)."""
+    return MODEL_WATCHER.current()
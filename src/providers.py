@@ -0,0 +1,316 @@
+# Contenido para: src/providers.py
+#
+# Capa única de proveedores de LLM y embeddings (API, app, build_rag, inference).
+#
+# Antes cada módulo creaba su ChatOpenAI/OpenAIEmbeddings con el modelo fijo
+# en el código y su propio cliente HTTP: sin pool compartido, sin límite de
+# concurrencia y con la política de reintentos por defecto del SDK. Aquí:
+#   - Modelos por entorno: NEXUSBYTE_CHAT_MODEL, NEXUSBYTE_EMBEDDING_MODEL.
+#   - Un cliente httpx por proceso (sync y async) con pool de conexiones
+#     keep-alive, compartido por todos los modelos.
+#   - Un semáforo de concurrencia (NEXUSBYTE_LLM_CONCURRENCY) sobre las
+#     peticiones en vuelo; en streaming se libera al cerrar la respuesta.
+#   - Reintentos con backoff exponencial y jitter completo ante 429/5xx y
+#     errores de red (respeta Retry-After). El SDK no reintenta por su cuenta.
+#   - Backend local determinista (NEXUSBYTE_LLM_PROVIDER=local, src/local_llm.py):
+#     sin red ni clave, para tests, benchmarks (src/eval.py) y pruebas de carga.
+# LangChain se importa recién al pedir un modelo: importar este módulo (la API
+# lo hace al arrancar) no debe deshacer la carga diferida de src/readiness.py.
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from src.metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+# --- Configuración ---
+PROVIDER = os.getenv("NEXUSBYTE_LLM_PROVIDER", "openai")  # openai | local
+CHAT_MODEL = os.getenv("NEXUSBYTE_CHAT_MODEL", "gpt-3.5-turbo")
+EMBEDDING_MODEL = os.getenv("NEXUSBYTE_EMBEDDING_MODEL", "text-embedding-ada-002")
+MAX_CONCURRENCY = int(os.getenv("NEXUSBYTE_LLM_CONCURRENCY", "8"))
+MAX_CONNECTIONS = int(os.getenv("NEXUSBYTE_LLM_POOL", "20"))
+TIMEOUT_S = float(os.getenv("NEXUSBYTE_LLM_TIMEOUT_S", "60"))
+MAX_RETRIES = int(os.getenv("NEXUSBYTE_LLM_RETRIES", "3"))
+RETRY_BASE_S = float(os.getenv("NEXUSBYTE_LLM_RETRY_BASE_S", "0.5"))
+RETRY_MAX_S = float(os.getenv("NEXUSBYTE_LLM_RETRY_MAX_S", "20"))
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+LOCAL_EMBEDDING_DIM = 256
+LOCAL_EMBEDDING_PREFIX = "deterministic-hash-"
+LOCAL_CHAT_MODEL = "nexusbyte-deterministic"
+
+_REQUESTS = REGISTRY.counter(
+    "nexusbyte_provider_requests_total", "Peticiones HTTP al proveedor de LLM/embeddings.", ("result",))
+_RETRIES = REGISTRY.counter(
+    "nexusbyte_provider_retries_total", "Reintentos al proveedor (status HTTP o error de red).", ("reason",))
+_WAIT_SECONDS = REGISTRY.histogram(
+    "nexusbyte_provider_semaphore_wait_seconds", "Espera por el semáforo de concurrencia.")
+_IN_FLIGHT = REGISTRY.gauge("nexusbyte_provider_in_flight", "Peticiones al proveedor en vuelo.")
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_IN_FLIGHT.set_function(lambda: _in_flight)
+
+
+def _track_in_flight(delta: int) -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+
+
+# --- Reintentos ---
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = MAX_RETRIES
+    base_s: float = RETRY_BASE_S
+    max_s: float = RETRY_MAX_S
+    statuses: tuple = RETRY_STATUS
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Backoff exponencial con jitter completo; Retry-After (segundos) manda si viene."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_s)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_s, self.base_s * (2 ** attempt)))
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Cuerpo de la respuesta que libera el semáforo al cerrarse (streaming incluido)."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class PooledTransport(httpx.BaseTransport):
+    """Transporte sync: pool de conexiones + semáforo entre hilos + reintentos."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, retry: RetryPolicy = RetryPolicy()):
+        self._inner = httpx.HTTPTransport(limits=_limits())
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.retry = retry
+
+    def _release(self) -> None:
+        _track_in_flight(-1)
+        self._semaphore.release()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            self._semaphore.acquire()
+            _WAIT_SECONDS.observe(time.perf_counter() - start)
+            _track_in_flight(1)
+            try:
+                response = self._inner.handle_request(request)
+            except httpx.TransportError as e:
+                self._release()
+                if attempt >= self.retry.max_retries:
+                    _REQUESTS.labels(result="error").inc()
+                    raise
+                _RETRIES.labels(reason=type(e).__name__).inc()
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            if response.status_code in self.retry.statuses and attempt < self.retry.max_retries:
+                retry_after = response.headers.get("retry-after")
+                response.close()
+                self._release()
+                _RETRIES.labels(reason=str(response.status_code)).inc()
+                time.sleep(self.retry.delay(attempt, retry_after))
+                attempt += 1
+                continue
+            _REQUESTS.labels(result="ok" if response.status_code < 400 else str(response.status_code)).inc()
+            if response.is_stream_consumed:
+                self._release()  # Cuerpo ya leído por el transporte: no hay stream que cerrar
+            else:
+                response.stream = _ReleasingStream(response.stream, self._release)
+            return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class AsyncPooledTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte async: igual que PooledTransport, con un pool y un semáforo por
+    event loop (las conexiones y los asyncio.Semaphore no se comparten entre loops).
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, retry: RetryPolicy = RetryPolicy()):
+        self.max_concurrency = max_concurrency
+        self.retry = retry
+        self._per_loop: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _for_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._per_loop.get(loop)
+            if state is None:
+                state = self._per_loop[loop] = (httpx.AsyncHTTPTransport(limits=_limits()),
+                                                asyncio.Semaphore(self.max_concurrency))
+            return state
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        inner, semaphore = self._for_loop()
+
+        def release():
+            _track_in_flight(-1)
+            semaphore.release()
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            await semaphore.acquire()
+            _WAIT_SECONDS.observe(time.perf_counter() - start)
+            _track_in_flight(1)
+            try:
+                response = await inner.handle_async_request(request)
+            except httpx.TransportError as e:
+                release()
+                if attempt >= self.retry.max_retries:
+                    _REQUESTS.labels(result="error").inc()
+                    raise
+                _RETRIES.labels(reason=type(e).__name__).inc()
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                release()  # Cancelación: no dejar el semáforo tomado
+                raise
+            if response.status_code in self.retry.statuses and attempt < self.retry.max_retries:
+                retry_after = response.headers.get("retry-after")
+                await response.aclose()
+                release()
+                _RETRIES.labels(reason=str(response.status_code)).inc()
+                await asyncio.sleep(self.retry.delay(attempt, retry_after))
+                attempt += 1
+                continue
+            _REQUESTS.labels(result="ok" if response.status_code < 400 else str(response.status_code)).inc()
+            if response.is_stream_consumed:
+                release()
+            else:
+                response.stream = _AsyncReleasingStream(response.stream, release)
+            return response
+
+    async def aclose(self) -> None:
+        with self._lock:
+            transports = [inner for inner, _ in self._per_loop.values()]
+            self._per_loop.clear()
+        for inner in transports:
+            await inner.aclose()
+
+
+# --- Clientes compartidos del proceso ---
+_clients_lock = threading.Lock()
+_clients = {"pid": None, "sync": None, "async": None}
+
+
+def http_clients():
+    """(httpx.Client, httpx.AsyncClient) del proceso; se recrean tras un fork."""
+    with _clients_lock:
+        if _clients["pid"] != os.getpid():
+            timeout = httpx.Timeout(TIMEOUT_S, connect=10.0)
+            _clients["sync"] = httpx.Client(transport=PooledTransport(), timeout=timeout)
+            _clients["async"] = httpx.AsyncClient(transport=AsyncPooledTransport(), timeout=timeout)
+            _clients["pid"] = os.getpid()
+        return _clients["sync"], _clients["async"]
+
+
+# --- Fábricas ---
+PROVIDERS = ("openai", "local")
+
+
+def _provider(provider: Optional[str]) -> str:
+    provider = provider or PROVIDER
+    if provider not in PROVIDERS:
+        raise ValueError(f"NEXUSBYTE_LLM_PROVIDER inválido: '{provider}'. Opciones: {', '.join(PROVIDERS)}")
+    return provider
+
+
+def is_configured(api_key: Optional[str], provider: Optional[str] = None) -> bool:
+    """El backend local no necesita clave; OpenAI sí."""
+    return _provider(provider) == "local" or bool(api_key)
+
+
+def get_chat_model(temperature: float = 0.1, api_key: Optional[str] = None, model: Optional[str] = None,
+                   provider: Optional[str] = None) -> "BaseChatModel":
+    """Chat model del proveedor configurado, con los clientes HTTP compartidos del proceso."""
+    if _provider(provider) == "local":
+        from src.local_llm import DeterministicChatModel
+        return DeterministicChatModel()
+    from langchain_openai import ChatOpenAI
+    sync_client, async_client = http_clients()
+    return ChatOpenAI(model=model or CHAT_MODEL, temperature=temperature, openai_api_key=api_key,
+                      http_client=sync_client, http_async_client=async_client, max_retries=0)
+
+
+def get_embeddings(model: Optional[str] = None, api_key: Optional[str] = None,
+                   provider: Optional[str] = None) -> "Embeddings":
+    """
+    Embeddings del proveedor configurado. Un nombre de modelo local (p.ej. el
+    del manifiesto de un índice construido con el backend local) siempre usa
+    el backend local, para que las preguntas se embeban igual que el índice.
+    """
+    local = _provider(provider) == "local"
+    model = model or (f"{LOCAL_EMBEDDING_PREFIX}{LOCAL_EMBEDDING_DIM}" if local else EMBEDDING_MODEL)
+    if model.startswith(LOCAL_EMBEDDING_PREFIX):
+        from src.local_llm import DeterministicEmbeddings
+        return DeterministicEmbeddings(int(model[len(LOCAL_EMBEDDING_PREFIX):]))
+    if local:
+        raise ValueError(f"El backend local no tiene el modelo de embeddings '{model}'. "
+                         "Reconstruye el índice con NEXUSBYTE_LLM_PROVIDER=local.")
+    from langchain_openai import OpenAIEmbeddings
+    sync_client, async_client = http_clients()
+    return OpenAIEmbeddings(model=model, openai_api_key=api_key, http_client=sync_client,
+                            http_async_client=async_client, max_retries=0)
@@ -0,0 +1,123 @@
+# Contenido para: src/rag.py
+#
+# Índice de recuperación compartido (API y app Streamlit).
+#
+# src/build_rag.py construye el índice offline (FAISS + BM25 sobre data/kb) y
+# deja un manifiesto (models/faiss_index/manifest.json) con la versión del
+# contenido, el modelo de embeddings y los archivos. Aquí solo se carga:
+# nunca se embebe la KB en tiempo de ejecución. Si falta el índice o el
+# manifiesto, se falla con un mensaje claro (correr build_rag.py) en vez de
+# reconstruir en la petición.
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+# --- Configuración ---
+# src.bm25 / src.embedding_cache (LangChain) se importan al cargar: leer el
+# manifiesto (p.ej. la versión para la caché de respuestas) no los necesita.
+FAISS_PATH = os.path.join("models", "faiss_index")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_SCHEMA = 1
+
+
+class IndexNotBuiltError(FileNotFoundError):
+    """El índice (o su manifiesto) no existe: hay que correr src/build_rag.py."""
+
+
+@dataclass
+class IndexManifest:
+    version: str                 # Hash de los ids de chunk + modelo de embeddings
+    embedding_model: str
+    n_chunks: int
+    built_at: float
+    files: Dict[str, str] = field(default_factory=dict)  # {"faiss": ..., "bm25": ...}
+    schema: int = MANIFEST_SCHEMA
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def index_version(chunk_ids: Iterable[str], embedding_model: str) -> str:
+    """Versión del contenido: no cambia si se reconstruye con los mismos chunks y modelo."""
+    digest = hashlib.sha256(embedding_model.encode("utf-8"))
+    for cid in sorted(chunk_ids):
+        digest.update(cid.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def manifest_path(faiss_path: str = FAISS_PATH) -> str:
+    return os.path.join(faiss_path, MANIFEST_NAME)
+
+
+def write_manifest(manifest: IndexManifest, faiss_path: str = FAISS_PATH) -> str:
+    """Escribe el manifiesto de forma atómica (tmp + replace)."""
+    path = manifest_path(faiss_path)
+    os.makedirs(faiss_path, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest.to_dict(), f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def read_manifest(faiss_path: str = FAISS_PATH) -> IndexManifest:
+    path = manifest_path(faiss_path)
+    if not os.path.exists(path):
+        raise IndexNotBuiltError(
+            f"Índice RAG no encontrado ({path}). Ejecuta 'python src/build_rag.py' antes de iniciar.")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("schema") != MANIFEST_SCHEMA:
+        raise IndexNotBuiltError(f"Manifiesto con esquema {data.get('schema')} (se espera {MANIFEST_SCHEMA}). "
+                                 "Reconstruye con src/build_rag.py.")
+    return IndexManifest(**data)
+
+
+def current_index_version(faiss_path: str = FAISS_PATH) -> Optional[str]:
+    """Versión del índice en disco (None si no está construido)."""
+    try:
+        return read_manifest(faiss_path).version
+    except (IndexNotBuiltError, OSError, ValueError):
+        return None
+
+
+def query_embeddings(manifest: IndexManifest, api_key: Optional[str]):
+    """Embeddings de preguntas con el modelo del índice y LRU en memoria (src/embedding_cache.py)."""
+    from src.embedding_cache import CachedEmbeddings
+    from src.providers import get_embeddings
+    return CachedEmbeddings(get_embeddings(manifest.embedding_model, api_key))
+
+
+def load_index(embeddings=None, mode: Optional[str] = None, faiss_path: str = FAISS_PATH,
+               bm25_path: Optional[str] = None, k: Optional[int] = None) -> Tuple[Any, IndexManifest]:
+    """
+    Carga el retriever desde el índice prebuilt. 'embeddings' (para las
+    preguntas) debe usar el mismo modelo que el manifiesto; no hace falta en
+    modo 'bm25'. Por defecto, modo/ruta/k de src/bm25.py. Devuelve (retriever, manifiesto).
+    """
+    from src import bm25
+    from src.embedding_cache import embedding_model_name
+    mode = mode or bm25.RETRIEVER_MODE
+    start = time.perf_counter()
+    manifest = read_manifest(faiss_path)
+
+    vectorstore = None
+    if mode != "bm25":
+        if embeddings is None:
+            raise ValueError(f"El modo '{mode}' necesita embeddings para las preguntas.")
+        model = embedding_model_name(getattr(embeddings, "inner", embeddings))
+        if model != manifest.embedding_model:
+            raise ValueError(f"Embeddings '{model}' no coinciden con los del índice "
+                             f"('{manifest.embedding_model}'). Reconstruye con src/build_rag.py.")
+        from langchain_community.vectorstores import FAISS
+        vectorstore = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+
+    retriever = bm25.make_retriever(mode, vectorstore, bm25_path or bm25.BM25_PATH, k=k or bm25.TOP_K)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"✅ Índice RAG {manifest.version} cargado ({mode}, {manifest.n_chunks} chunks) en {elapsed_ms:.1f} ms")
+    return retriever, manifest
@@ -0,0 +1,269 @@
+# Contenido para: src/rag_cache.py
+#
+# Caché de respuestas del coach RAG (delante de rag_chain).
+#
+# /coach arma su pregunta solo con 'prediction' y un risk_score de dos
+# decimales, y /chat recibe una y otra vez las mismas preguntas tipo FAQ.
+# Dos niveles:
+#   1. Exacto:    hash de (versión KB, pregunta normalizada, historial normalizado)
+#   2. Semántico: solo sin historial; similitud coseno entre el embedding de
+#                 la pregunta y los de preguntas ya respondidas (>= SIM_THRESHOLD)
+#                 con el mismo 'scope' (p.ej. "chat" o "coach:<predicción>"):
+#                 preguntas casi iguales con distinto nivel de riesgo no se mezclan
+# Además, las peticiones idénticas que llegan a la vez se agrupan
+# (single-flight, también en streaming): solo la primera llama al LLM y las
+# demás esperan su resultado. Si la primera se cancela (cliente desconectado),
+# las que esperaban calculan por su cuenta en vez de fallar.
+#
+# Las entradas expiran (TTL), se desalojan por LRU y llevan la versión de la
+# base de conocimiento (manifiesto del índice): reconstruir el índice con
+# otro contenido invalida las respuestas viejas.
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.metrics import REGISTRY, MetricsRegistry
+from src.pred_cache import VersionWatcher
+from src.rag import current_index_version
+
+# --- Configuración ---
+FAISS_PATH = os.path.join("models", "faiss_index")
+ENABLED = os.getenv("NEXUSBYTE_RAG_CACHE", "1") == "1"
+MAX_ENTRIES = int(os.getenv("NEXUSBYTE_RAG_CACHE_SIZE", "1024"))
+TTL_S = float(os.getenv("NEXUSBYTE_RAG_CACHE_TTL_S", str(24 * 3600)))
+SIM_THRESHOLD = float(os.getenv("NEXUSBYTE_RAG_CACHE_SIM", "0.95"))
+SEMANTIC_ENABLED = os.getenv("NEXUSBYTE_RAG_CACHE_SEMANTIC", "1") == "1"
+
+def kb_version(faiss_path: str = FAISS_PATH) -> str:
+    """Versión de la base de conocimiento: la del manifiesto del índice (src/rag.py)."""
+    return current_index_version(faiss_path) or "missing"
+
+
+KB_WATCHER = VersionWatcher(FAISS_PATH, version_fn=kb_version)
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza para el nivel exacto: NFKC, minúsculas, espacios y signos de los extremos."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ¿?¡!.,;:")
+
+
+class LeaderCancelled(Exception):
+    """La petición líder de un single-flight se canceló antes de responder."""
+
+
+@dataclass
+class _Entry:
+    answer: str
+    expires_at: float
+    question: str
+    vector: Optional[np.ndarray] = None  # Embedding normalizado (solo sin historial)
+    scope: str = ""                      # Solo se compara semánticamente dentro del mismo scope
+
+
+class RAGResponseCache:
+    """
+    Caché de respuestas con nivel exacto + semántico y single-flight.
+    'embed' es una función async texto -> vector (p.ej. embeddings.aembed_query);
+    sin ella, solo funciona el nivel exacto.
+    """
+
+    def __init__(self, embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                 max_entries: int = MAX_ENTRIES, ttl_s: float = TTL_S,
+                 sim_threshold: float = SIM_THRESHOLD, registry: MetricsRegistry = REGISTRY):
+        self.embed = embed if SEMANTIC_ENABLED else None
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.sim_threshold = sim_threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._version: Optional[str] = None
+
+        self._requests = registry.counter(
+            "nexusbyte_rag_cache_requests_total", "Consultas a la caché de respuestas RAG.", ("result",))
+        self._invalidations = registry.counter(
+            "nexusbyte_rag_cache_invalidations_total", "Vaciados por cambio de versión de la KB.")
+        registry.gauge("nexusbyte_rag_cache_entries", "Respuestas en la caché RAG.") \
+            .set_function(lambda: len(self._entries))
+
+    # --- Claves y versión ---
+    @staticmethod
+    def make_key(version: str, question: str, history: str = "", scope: str = "") -> str:
+        payload = json.dumps([version, scope, normalize_text(question), normalize_text(history)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            if self._entries:
+                self._entries.clear()
+                self._invalidations.inc()
+            self._version = version
+
+    # --- Niveles de búsqueda ---
+    def _lookup_exact(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.answer
+
+    def _lookup_semantic(self, vector: np.ndarray, now: float, scope: str = "") -> Optional[str]:
+        best_key, best_sim = None, self.sim_threshold
+        for key, entry in self._entries.items():
+            if entry.vector is None or entry.expires_at < now or entry.scope != scope:
+                continue
+            sim = float(np.dot(vector, entry.vector))
+            if sim >= best_sim:
+                best_key, best_sim = key, sim
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key].answer
+
+    async def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        try:
+            # Texto tal cual: es el mismo embedding que pide el retriever (LRU de embedding_cache)
+            vector = np.asarray(await self.embed(question), dtype=np.float32)
+        except Exception as e:
+            print(f"AVISO: no se pudo calcular el embedding para la caché RAG: {e}")
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _store(self, key: str, question: str, answer: str, vector: Optional[np.ndarray],
+               scope: str = "") -> None:
+        self._entries[key] = _Entry(answer, time.monotonic() + self.ttl_s, question, vector, scope)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # --- API pública ---
+    async def lookup(self, question: str, history: str, version: str,
+                     scope: str = "") -> Tuple[str, Optional[str], Optional[np.ndarray]]:
+        """
+        Busca sin calcular. Devuelve (clave, respuesta o None, vector).
+        El vector se devuelve para poder guardarlo después sin recalcularlo.
+        """
+        self._check_version(version)
+        key = self.make_key(version, question, history, scope)
+        now = time.monotonic()
+        answer = self._lookup_exact(key, now)
+        if answer is not None:
+            self._requests.labels(result="exact").inc()
+            return key, answer, None
+        vector = None
+        if not history.strip():  # Las preguntas de seguimiento dependen del historial
+            vector = await self._embed(question)
+            if vector is not None:
+                answer = self._lookup_semantic(vector, time.monotonic(), scope)
+                if answer is not None:
+                    self._requests.labels(result="semantic").inc()
+                    # La próxima vez, la misma pregunta acierta en el nivel exacto
+                    self._store(key, question, answer, None, scope)
+                    return key, answer, vector
+        return key, None, vector
+
+    def record_miss(self) -> None:
+        """Para quien usa lookup()/store() directamente (streaming)."""
+        self._requests.labels(result="miss").inc()
+
+    def store(self, key: str, question: str, answer: str, vector: Optional[np.ndarray] = None,
+              scope: str = "") -> None:
+        if answer:
+            self._store(key, question, answer, vector, scope)
+
+    # --- Single-flight ---
+    async def wait_in_flight(self, key: str) -> Optional[str]:
+        """
+        Si otra petición idéntica ya está llamando al LLM, espera su respuesta.
+        None si no hay ninguna en curso (o si la que había se canceló sin
+        responder): entonces quien llama debe calcular con start_flight().
+        Un error del LLM en la petición líder se propaga a las que esperan.
+        """
+        while True:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                return None
+            self._requests.labels(result="coalesced").inc()
+            try:
+                return await asyncio.shield(pending)
+            except LeaderCancelled:
+                continue  # Se vuelve a intentar: otra que esperaba puede haber tomado la posta
+
+    def start_flight(self, key: str) -> asyncio.Future:
+        """Registra la petición como líder para 'key' (sin await entre wait_in_flight y esto)."""
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return future
+
+    def finish_flight(self, key: str, future: asyncio.Future, answer: Optional[str] = None,
+                      error: Optional[BaseException] = None) -> None:
+        """
+        Entrega 'answer' (o 'error') a las peticiones que esperan. Sin ninguno
+        de los dos, el líder se canceló: las que esperan calculan por su cuenta.
+        """
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if future.done():
+            return
+        if answer is not None:
+            future.set_result(answer)
+        else:
+            future.set_exception(error or LeaderCancelled("La petición que calculaba la respuesta se canceló."))
+            future.exception()  # Marcada como leída si nadie más esperaba
+
+    async def get_or_compute(self, question: str, history: str, version: str,
+                             compute: Callable[[], Awaitable[str]], scope: str = "") -> Tuple[str, str]:
+        """
+        Respuesta desde la caché o compute(). Devuelve (respuesta, origen) con
+        origen en {"exact", "semantic", "coalesced", "miss"}.
+        """
+        key, answer, vector = await self.lookup(question, history, version, scope)
+        if answer is not None:
+            return answer, "semantic" if vector is not None else "exact"
+
+        # Single-flight: otra petición idéntica ya está llamando al LLM
+        answer = await self.wait_in_flight(key)
+        if answer is not None:
+            return answer, "coalesced"
+
+        self.record_miss()
+        future = self.start_flight(key)
+        try:
+            answer = await compute()
+        except asyncio.CancelledError:
+            self.finish_flight(key, future)
+            raise
+        except Exception as e:
+            self.finish_flight(key, future, error=e)
+            raise
+        self.store(key, question, answer, vector, scope)
+        self.finish_flight(key, future, answer)
+        return answer, "miss"
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "in_flight": len(self._in_flight), "version": self._version}
+
+
+def current_kb_version() -> str:
+    """Versión actual del índice FAISS (stat con límite de frecuencia)."""
+    return KB_WATCHER.current()
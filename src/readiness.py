@@ -0,0 +1,155 @@
+# Contenido para: src/readiness.py
+#
+# Estado de carga de los componentes de la API (modelo ML, RAG, ...).
+#
+# Cada componente tiene un cargador y, opcionalmente, un calentamiento
+# (una predicción o búsqueda sintética para que la primera petición real no
+# pague imports perezosos, conexiones ni cachés frías). Se cargan en un hilo
+# de fondo al iniciar el worker; si algo los pide antes (scripts, tests sin
+# lifespan), se cargan en el momento.
+#
+# /healthz: el proceso responde (liveness).
+# /readyz:  todos los componentes están listos y calentados (readiness);
+#           un componente 'disabled' (p.ej. RAG sin OPENAI_API_KEY) no bloquea.
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from src.metrics import REGISTRY, MetricsRegistry
+
+# Estados posibles
+PENDING, LOADING, WARMING, READY, DISABLED, FAILED = "pending", "loading", "warming", "ready", "disabled", "failed"
+
+
+class ComponentDisabled(Exception):
+    """El cargador decide no activar el componente (falta configuración opcional)."""
+
+
+class ComponentUnavailable(RuntimeError):
+    """El componente todavía se está cargando o falló (la API responde 503/500)."""
+
+    def __init__(self, component: "Component"):
+        self.component = component
+        detail = f": {component.error}" if component.error else ""
+        super().__init__(f"Componente '{component.name}' no disponible ({component.state}){detail}")
+
+
+@dataclass
+class Component:
+    name: str
+    load: Callable[[], None]
+    warm: Optional[Callable[[], None]] = None
+    state: str = PENDING
+    error: Optional[str] = None
+    warm_error: Optional[str] = None
+    load_ms: Optional[float] = None
+    warm_ms: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "error": self.error, "warm_error": self.warm_error,
+                "load_ms": self.load_ms, "warm_ms": self.warm_ms}
+
+
+class Components:
+    """Componentes en orden de carga, con su estado y tiempos."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self._components: Dict[str, Component] = {}
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = time.perf_counter()
+        self.ready_ms: Optional[float] = None
+        self._ready_gauge = registry.gauge(
+            "nexusbyte_component_ready", "1 si el componente está listo (o deshabilitado).", ("component",))
+        self._load_seconds = registry.gauge(
+            "nexusbyte_component_load_seconds", "Tiempo de carga + calentamiento del componente.", ("component",))
+
+    def add(self, name: str, load: Callable[[], None], warm: Optional[Callable[[], None]] = None) -> Component:
+        component = self._components[name] = Component(name, load, warm)
+        self._ready_gauge.labels(component=name).set(0)
+        return component
+
+    def __getitem__(self, name: str) -> Component:
+        return self._components[name]
+
+    # --- Carga ---
+    def _run(self, component: Component) -> None:
+        # Con el lock tomado: una sola carga por componente
+        component.state, component.error = LOADING, None
+        start = time.perf_counter()
+        try:
+            component.load()
+        except ComponentDisabled as e:
+            component.state, component.error = DISABLED, str(e)
+            print(f"AVISO: componente '{component.name}' deshabilitado: {e}")
+        except Exception as e:
+            component.state, component.error = FAILED, f"{type(e).__name__}: {e}"
+            print(f"ERROR al cargar '{component.name}': {e}")
+        component.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        if component.state != LOADING:
+            self._publish(component)
+            return
+
+        if component.warm is not None:
+            component.state = WARMING
+            start = time.perf_counter()
+            try:
+                component.warm()
+            except Exception as e:
+                # Un calentamiento fallido no impide atender: la primera petición pagará el costo
+                component.warm_error = f"{type(e).__name__}: {e}"
+                print(f"AVISO: calentamiento de '{component.name}' falló: {e}")
+            component.warm_ms = round((time.perf_counter() - start) * 1000, 1)
+        component.state = READY
+        warm = f", calentamiento {component.warm_ms} ms" if component.warm_ms is not None else ""
+        print(f"✅ '{component.name}' listo (carga {component.load_ms} ms{warm})")
+        self._publish(component)
+
+    def _publish(self, component: Component) -> None:
+        self._ready_gauge.labels(component=component.name).set(1 if component.state in (READY, DISABLED) else 0)
+        self._load_seconds.labels(component=component.name).set(((component.load_ms or 0) + (component.warm_ms or 0)) / 1000)
+
+    def load(self, name: str) -> Component:
+        with self._lock:
+            component = self._components[name]
+            if component.state == PENDING:
+                self._run(component)
+            return component
+
+    def load_all(self) -> None:
+        for name in list(self._components):
+            self.load(name)
+        self.ready_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        states = ", ".join(f"{c.name}={c.state}" for c in self._components.values())
+        print(f"✅ Inicio completo en {self.ready_ms} ms desde el import ({states})")
+
+    def start_background(self) -> threading.Thread:
+        """Carga todo en un hilo de fondo (no bloquea el arranque del servidor)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load_all, name="nexusbyte-startup", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # --- Consulta ---
+    def require(self, name: str) -> None:
+        """
+        Falla con ComponentUnavailable si el componente no está listo. Si nadie
+        lo cargó todavía (sin hilo de fondo), lo carga aquí mismo.
+        """
+        component = self._components[name]
+        if component.state == PENDING and self._thread is None:
+            component = self.load(name)
+        if component.state != READY:
+            raise ComponentUnavailable(component)
+
+    def is_ready(self) -> bool:
+        return all(c.state in (READY, DISABLED) for c in self._components.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "startup_ms": self.ready_ms,
+            "components": {name: c.to_dict() for name, c in self._components.items()},
+        }
@@ -0,0 +1,196 @@
+# Contenido para: src/schema.py
+#
+# Registro de esquema (dtypes compactos) para las columnas NHANES.
+#
+# Sin esto, todo termina en float64 después de los outer merges, incluso
+# respuestas codificadas como SMQ020 (1/2/7/9) o RIAGENDR (1/2). Aquí cada
+# componente de urls_and_columns.COLUMNS_TO_SAVE tiene un tipo por columna:
+#   - CODE   (Int8):   respuestas codificadas (1=Sí, 2=No, 7/9, 77/99...)
+#   - CODE16 (Int16):  edades, minutos y conteos con códigos 777/999, 7777/9999
+#   - CODE32 (Int32):  conteos con códigos de 6 dígitos (777777/999999)
+#   - MEASURE (float32): mediciones continuas (peso, talla, presión...)
+#   - TEXT / CATEGORY: columnas de texto (UPC, marca de cigarrillos)
+# Los enteros son "nullable" (pd.NA), así que no hace falta pasar a float.
+# Además, las columnas casi vacías (p.ej. gran parte de Dietary y TabacoUse)
+# se guardan en memoria como SparseDtype.
+
+import warnings
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from urls_and_columns import COLUMNS_TO_SAVE
+
+CODE = "Int8"
+CODE16 = "Int16"
+CODE32 = "Int32"
+MEASURE = "float32"
+TEXT = "string"
+CATEGORY = "category"
+
+# Columnas con menos de este porcentaje de valores no nulos se guardan dispersas
+SPARSE_DENSITY = 0.10
+SPARSE_DTYPE = pd.SparseDtype("float32", np.nan)
+
+# Tipo por defecto de cada componente (la mayoría de sus columnas)
+COMPONENT_DEFAULTS = {
+    "BPX": MEASURE,
+    "BMX": MEASURE,
+    "DEMO": CODE,
+    "PAQ": CODE,
+    "SLQ": CODE,
+    "DBQ": CODE,
+    "BPQ": CODE,
+    "SMQ": CODE,
+}
+
+# Excepciones al tipo por defecto
+COMPONENT_OVERRIDES = {
+    "BMX": {
+        # Estado del examen y comentarios (códigos), el resto son mediciones
+        "BMDSTATS": CODE, "BMIWT": CODE, "BMIRECUM": CODE, "BMIHEAD": CODE,
+        "BMIHT": CODE, "BMILEG": CODE, "BMIARML": CODE, "BMIARMC": CODE, "BMIWAIST": CODE,
+    },
+    "DEMO": {"RIDAGEMN": CODE16, "SDMVSTRA": CODE16, "INDFMPIR": MEASURE},
+    "PAQ": {"PAD615": CODE16, "PAD645": CODE16, "PAD660": CODE16},
+    "SLQ": {"SLD012": MEASURE},
+    "DBQ": {
+        "DBD030": CODE32, "DBD050": CODE32, "DBD381": CODE16, "DBD411": CODE16,
+        "DBD895": CODE16, "DBD900": CODE16, "DBD905": CODE16, "DBD910": CODE16,
+    },
+    "BPQ": {"BPD035": CODE16},
+    "SMQ": {
+        "SMD030": CODE16, "SMQ050Q": CODE32, "SMD057": CODE16, "SMD650": CODE16,
+        "SMD630": CODE16, "SMDUPCA": TEXT, "SMD100BR": CATEGORY,
+        "SMD100TR": MEASURE, "SMD100NI": MEASURE, "SMD100CO": MEASURE,
+    },
+}
+
+# Columnas que no vienen de COLUMNS_TO_SAVE sino del pipeline
+PIPELINE_COLUMNS = {
+    "SEQN": "int32",
+    "year": "int16",
+    "SLD_HOURS": MEASURE,  # SLD010H/SLD012 unificadas en xpt_reader.py
+    "TARGET_HIPERTENSION": CODE,
+}
+
+# Las features del modelo son continuas (o 0/1 imputadas con la mediana)
+FEATURE_PREFIX = "feat_"
+FEATURE_DTYPE = "float32"
+
+
+def _build_registry() -> Dict[str, Dict[str, str]]:
+    registry = {}
+    for component, columns in COLUMNS_TO_SAVE.items():
+        default = COMPONENT_DEFAULTS[component]
+        overrides = COMPONENT_OVERRIDES.get(component, {})
+        registry[component] = {
+            col: PIPELINE_COLUMNS.get(col, overrides.get(col, default)) for col in columns
+        }
+    return registry
+
+
+# {componente: {columna: dtype}} y su versión plana {columna: dtype}
+SCHEMA_REGISTRY = _build_registry()
+COLUMN_DTYPES = {col: dtype for cols in SCHEMA_REGISTRY.values() for col, dtype in cols.items()}
+COLUMN_DTYPES.update(PIPELINE_COLUMNS)
+
+
+def dtype_for(column: str) -> Optional[str]:
+    """Dtype compacto de una columna (None si no está registrada)."""
+    if column in COLUMN_DTYPES:
+        return COLUMN_DTYPES[column]
+    if column.startswith(FEATURE_PREFIX):
+        return FEATURE_DTYPE
+    return None
+
+
+def _float_to_nullable_int(series: pd.Series, dtype: str) -> pd.Series:
+    """float con NaN -> Int8/16/32 directo con numpy (datos + máscara)."""
+    np_dtype = pd.api.types.pandas_dtype(dtype).numpy_dtype
+    values = series.to_numpy()
+    mask = np.isnan(values)
+    filled = np.where(mask, 0, values)
+    limits = np.iinfo(np_dtype)
+    if len(filled) and ((filled != np.trunc(filled)).any()
+                        or filled.min() < limits.min or filled.max() > limits.max):
+        raise ValueError(f"'{series.name}' tiene valores que no caben en {dtype}")
+    array = pd.arrays.IntegerArray(filled.astype(np_dtype), mask)
+    return pd.Series(array, index=series.index, name=series.name)
+
+
+def _cast(series: pd.Series, dtype: str) -> pd.Series:
+    """
+    Convierte una columna a su dtype compacto. Si los datos no caben
+    (decimales en una columna entera, valores fuera de rango), cae a float32.
+    """
+    if isinstance(series.dtype, pd.SparseDtype):
+        series = series.sparse.to_dense()
+    if str(series.dtype) == dtype:
+        return series
+    try:
+        if dtype in (CODE, CODE16, CODE32):
+            if series.dtype.kind == 'f':
+                return _float_to_nullable_int(series, dtype)
+            values = pd.to_numeric(series, errors="raise")
+            return values.astype(dtype)
+        if dtype == TEXT:
+            # Los códigos UPC tienen ceros a la izquierda: nunca pasar por número
+            return series.astype(TEXT)
+        return series.astype(dtype)
+    except (TypeError, ValueError, OverflowError):
+        warnings.warn(f"La columna '{series.name}' no cabe en {dtype}; se usa {MEASURE}.")
+        return pd.to_numeric(series, errors="coerce").astype(MEASURE)
+
+
+def apply_schema(df: pd.DataFrame, sparse: bool = True,
+                 sparse_density: float = SPARSE_DENSITY) -> pd.DataFrame:
+    """
+    Aplica los dtypes del registro a las columnas conocidas y, si 'sparse',
+    guarda como SparseDtype las columnas numéricas casi vacías.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        dtype = dtype_for(col)
+        if dtype is not None:
+            series = _cast(series, dtype)
+        columns[col] = series
+
+    out = pd.DataFrame(columns, index=df.index, copy=False)
+    if sparse:
+        out = sparsify(out, sparse_density)
+    return out
+
+
+def sparsify(df: pd.DataFrame, sparse_density: float = SPARSE_DENSITY) -> pd.DataFrame:
+    """Convierte a SparseDtype las columnas numéricas con pocos valores no nulos."""
+    if len(df) == 0:
+        return df
+    protected = set(PIPELINE_COLUMNS)
+    for col in df.columns:
+        series = df[col]
+        if col in protected or col.startswith(FEATURE_PREFIX):
+            continue
+        if isinstance(series.dtype, pd.SparseDtype) or not pd.api.types.is_numeric_dtype(series):
+            continue
+        if series.notna().mean() < sparse_density:
+            df[col] = series.astype("float32").astype(SPARSE_DTYPE)
+    return df
+
+
+def densify(df: pd.DataFrame) -> pd.DataFrame:
+    """Vuelve densas las columnas dispersas (Parquet no guarda SparseDtype)."""
+    sparse_cols = [col for col in df.columns if isinstance(df[col].dtype, pd.SparseDtype)]
+    if not sparse_cols:
+        return df
+    df = df.copy(deep=False)
+    for col in sparse_cols:
+        df[col] = df[col].sparse.to_dense()
+    return df
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    """Memoria usada por el DataFrame (incluye strings) en MB."""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
@@ -0,0 +1,257 @@
+# Contenido para: src/sessions.py
+#
+# Sesiones de chat del lado del servidor.
+#
+# Con 'session_id', el cliente solo envía el mensaje nuevo: el historial, el
+# resumen acumulado de los turnos viejos (src/memory.py) y los contadores de
+# tokens de la sesión viven aquí.
+#   - MemorySessionStore: LRU en memoria con expiración (TTL) por inactividad.
+#   - SQLiteSessionStore: persistente y compartido entre workers/procesos
+#     (la conversación puede seguir en otro worker o tras un reinicio).
+# Los turnos se registran con update(): leer, modificar y escribir de forma
+# atómica (lock en memoria; en SQLite, control optimista por 'version' con
+# reintento), para que dos peticiones simultáneas de la misma sesión no se
+# pisen el historial.
+# Se elige con NEXUSBYTE_SESSION_BACKEND=memory|sqlite.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from src.metrics import REGISTRY
+
+# --- Configuración ---
+BACKEND = os.getenv("NEXUSBYTE_SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_DB = os.getenv("NEXUSBYTE_SESSION_DB", os.path.join("data", "sessions.sqlite"))
+MAX_SESSIONS = int(os.getenv("NEXUSBYTE_SESSION_MAX", "10000"))
+TTL_S = float(os.getenv("NEXUSBYTE_SESSION_TTL_S", str(24 * 3600)))
+MAX_MESSAGES = int(os.getenv("NEXUSBYTE_SESSION_MAX_MESSAGES", "200"))
+UPDATE_RETRIES = int(os.getenv("NEXUSBYTE_SESSION_UPDATE_RETRIES", "20"))  # Conflictos seguidos tolerados
+
+_EVENTS = REGISTRY.counter(
+    "nexusbyte_sessions_events_total", "Eventos del store de sesiones.", ("event",))
+
+
+@dataclass
+class Session:
+    session_id: str
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    summary: str = ""             # Resumen de los primeros 'summary_turns' mensajes
+    summary_turns: int = 0
+    tokens_in: int = 0            # Tokens de las preguntas del usuario
+    tokens_out: int = 0           # Tokens de las respuestas
+    prompt_history_tokens: int = 0  # Tokens de historial enviados al LLM (acumulado)
+    turns: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def add_turn(self, question: str, answer: str, tokens_in: int, tokens_out: int,
+                 history_tokens: int = 0) -> None:
+        self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": answer})
+        if len(self.messages) > MAX_MESSAGES:
+            # Lo más viejo ya está en el resumen; se descarta y se corrige el índice
+            dropped = len(self.messages) - MAX_MESSAGES
+            self.messages = self.messages[dropped:]
+            self.summary_turns = max(self.summary_turns - dropped, 0)
+            if self.summary_turns == 0:
+                self.summary = ""
+        self.tokens_in += tokens_in
+        self.tokens_out += tokens_out
+        self.prompt_history_tokens += history_tokens
+        self.turns += 1
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Session":
+        return cls(**data)
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class MemorySessionStore:
+    """LRU en memoria; una sesión sin actividad por 'ttl_s' segundos expira."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_s: float = TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        REGISTRY.gauge("nexusbyte_sessions_active", "Sesiones en el store en memoria.") \
+            .set_function(lambda: len(self._sessions))
+
+    def create(self) -> Session:
+        session = Session(new_session_id())
+        self.save(session)
+        _EVENTS.labels(event="created").inc()
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl_s:
+                del self._sessions[session_id]
+                _EVENTS.labels(event="expired").inc()
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session: Session) -> None:
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                _EVENTS.labels(event="evicted").inc()
+
+    def update(self, session_id: str, mutate: Callable[[Session], None]) -> Optional[Session]:
+        """Aplica 'mutate' a la sesión con el lock tomado; None si no existe o expiró."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or time.time() - session.updated_at > self.ttl_s:
+                return None
+            mutate(session)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+class SQLiteSessionStore:
+    """
+    Sesiones en SQLite (JSON por sesión); las expiradas se purgan al escribir.
+    Cada escritura incrementa 'version': update() solo escribe si nadie más
+    (otro hilo, worker o proceso) lo hizo desde su lectura; si no, relee y reintenta.
+    """
+
+    def __init__(self, path: str = SESSION_DB, ttl_s: float = TTL_S, max_sessions: int = MAX_SESSIONS):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0)")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "version" not in columns:  # Base creada antes del control de concurrencia
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._conn.commit()
+        self._writes = 0
+
+    def create(self) -> Session:
+        session = Session(new_session_id())
+        self.save(session)
+        _EVENTS.labels(event="created").inc()
+        return session
+
+    def _read(self, session_id: str):
+        """(sesión, versión) o None si no existe o expiró."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at, version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_s:
+            self.delete(session_id)
+            _EVENTS.labels(event="expired").inc()
+            return None
+        return Session.from_dict(json.loads(row[0])), row[2]
+
+    def get(self, session_id: str) -> Optional[Session]:
+        found = self._read(session_id)
+        return found[0] if found is not None else None
+
+    def _after_write(self) -> None:
+        # Con el lock tomado
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._purge()
+        self._conn.commit()
+
+    def save(self, session: Session) -> None:
+        """Escritura incondicional (p.ej. al crear); para registrar turnos, update()."""
+        data = json.dumps(session.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, "
+                "updated_at = excluded.updated_at, version = version + 1",
+                (session.session_id, data, session.updated_at))
+            self._after_write()
+
+    def update(self, session_id: str, mutate: Callable[[Session], None]) -> Optional[Session]:
+        """
+        Lee la sesión, le aplica 'mutate' y la escribe solo si su versión no
+        cambió entretanto; si cambió, vuelve a leer y a aplicar 'mutate'
+        (que por eso debe poder repetirse sobre una copia fresca).
+        None si la sesión no existe o expiró.
+        """
+        for _ in range(UPDATE_RETRIES):
+            found = self._read(session_id)
+            if found is None:
+                return None
+            session, version = found
+            mutate(session)
+            data = json.dumps(session.to_dict(), ensure_ascii=False)
+            with self._lock:
+                written = self._conn.execute(
+                    "UPDATE sessions SET data = ?, updated_at = ?, version = version + 1 "
+                    "WHERE session_id = ? AND version = ?",
+                    (data, session.updated_at, session_id, version)).rowcount
+                if written:
+                    self._after_write()
+                    return session
+                self._conn.commit()  # Cierra la transacción implícita del UPDATE fallido
+            _EVENTS.labels(event="conflict").inc()
+        raise RuntimeError(f"Sesión '{session_id}': {UPDATE_RETRIES} conflictos seguidos al guardar el turno.")
+
+    def _purge(self) -> None:
+        # Con el lock tomado: expiradas por TTL y, si sobran, las menos recientes
+        cutoff = time.time() - self.ttl_s
+        expired = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        evicted = self._conn.execute(
+            "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions "
+            "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)).rowcount
+        if expired:
+            _EVENTS.labels(event="expired").inc(expired)
+        if evicted:
+            _EVENTS.labels(event="evicted").inc(evicted)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def make_session_store(backend: str = BACKEND):
+    """Store según NEXUSBYTE_SESSION_BACKEND."""
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"NEXUSBYTE_SESSION_BACKEND inválido: '{backend}'. Opciones: memory, sqlite")
@@ -0,0 +1,108 @@
+# Contenido para: src/storage.py
+#
+# Capa de almacenamiento del pipeline (load -> targets -> features -> model).
+# Los archivos intermedios se guardan en Parquet (tipado, comprimido y con
+# metadatos de esquema), y cada etapa puede leer solo las columnas que usa.
+# La exportación a CSV sigue disponible para quien la quiera.
+# Todo lo que entra y sale pasa por el registro de dtypes de src/schema.py.
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.schema import apply_schema, densify
+
+# --- Configuración ---
+PARQUET_EXT = ".parquet"
+COMPRESSION = "zstd"
+METADATA_KEY = b"nexusbyte"
+
+# Exportar también CSV junto a cada Parquet (NEXUSBYTE_EXPORT_CSV=1)
+EXPORT_CSV = os.getenv("NEXUSBYTE_EXPORT_CSV", "0") == "1"
+
+
+def _csv_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".csv"
+
+
+def write_table(df: pd.DataFrame, path: str, stage: Optional[str] = None,
+                metadata: Optional[Dict[str, Any]] = None,
+                export_csv: Optional[bool] = None) -> str:
+    """
+    Guarda un DataFrame en Parquet con metadatos de esquema.
+    Si 'export_csv' (o NEXUSBYTE_EXPORT_CSV=1), escribe además un CSV al lado.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Dtypes compactos en disco; las columnas dispersas se guardan densas
+    df = densify(apply_schema(df, sparse=False))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Sin marcas de tiempo: el mismo contenido produce el mismo archivo,
+    # y así el runner del pipeline (src/pipeline.py) puede detectar "sin cambios".
+    info = {
+        "stage": stage,
+        "rows": len(df),
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+    }
+    if metadata:
+        info.update(metadata)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[METADATA_KEY] = json.dumps(info).encode("utf-8")
+    table = table.replace_schema_metadata(schema_metadata)
+
+    # Escritura atómica: un lector nunca ve un archivo a medio escribir
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+
+    if EXPORT_CSV if export_csv is None else export_csv:
+        df.to_csv(_csv_path(path), index=False)
+    return path
+
+
+def read_table(path: str, columns: Optional[Sequence[str]] = None,
+               sparse: bool = True) -> pd.DataFrame:
+    """
+    Lee un archivo del pipeline. Si no existe el Parquet pero sí un CSV con el
+    mismo nombre (datos antiguos), se lee el CSV. 'columns' limita la lectura
+    a esas columnas (las que no existan se ignoran). El resultado usa los
+    dtypes compactos del registro y, si 'sparse', las columnas casi vacías
+    quedan como SparseDtype.
+    """
+    if os.path.exists(path):
+        if columns is not None:
+            available = set(pq.read_schema(path).names)
+            columns = [col for col in columns if col in available]
+        df = pd.read_parquet(path, columns=columns)
+    elif os.path.exists(_csv_path(path)):
+        csv_path = _csv_path(path)
+        if columns is not None:
+            wanted = set(columns)
+            df = pd.read_csv(csv_path, usecols=lambda col: col in wanted, low_memory=False)
+        else:
+            df = pd.read_csv(csv_path, low_memory=False)
+    else:
+        raise FileNotFoundError(path)
+
+    return apply_schema(df, sparse=sparse)
+
+
+def read_columns(path: str) -> List[str]:
+    """Nombres de columnas del archivo sin leer los datos."""
+    if os.path.exists(path):
+        return pq.read_schema(path).names
+    csv_path = _csv_path(path)
+    if os.path.exists(csv_path):
+        return list(pd.read_csv(csv_path, nrows=0).columns)
+    raise FileNotFoundError(path)
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """Metadatos guardados por write_table (etapa, filas, dtypes...)."""
+    schema_metadata = pq.read_schema(path).metadata or {}
+    raw = schema_metadata.get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
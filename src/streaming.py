@@ -0,0 +1,116 @@
+# Contenido para: src/streaming.py
+#
+# Streaming de respuestas del RAG chain hacia el cliente.
+#
+# El chain (retriever | prompt | llm | StrOutputParser) se consume con su
+# interfaz async (astream), así que cada token del LLM se reenvía apenas
+# llega y el worker no queda bloqueado durante la generación:
+#   - Server-Sent Events (POST /chat/stream, /coach/stream)
+#   - WebSocket (/ws/chat): mensajes JSON {"type": "token" | "done" | "error"}
+# El evento final incluye el texto completo y los tiempos (primer token y total);
+# los del LLM solo (sin búsqueda ni contexto) van a /metrics (src/metrics.py).
+
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from src.memory import count_tokens
+from src.metrics import record_error, start_llm_call
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Cabeceras para que proxies (nginx) no acumulen el stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Un evento SSE con datos JSON (una sola línea 'data:')."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_chain(chain, inputs: Dict[str, Any], cache=None, kb_version: Optional[str] = None,
+                       on_done: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+                       scope: str = "") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Recorre chain.astream(inputs) y entrega mensajes
+    {"type": "token", "data": ...}, y al final {"type": "done", ...}
+    (o {"type": "error", ...} si el chain falla a mitad de camino).
+    Con 'cache' (src/rag_cache.py), un acierto se envía como un solo token
+    y una respuesta nueva se guarda al terminar; una petición idéntica que
+    llega mientras otra genera espera esa respuesta (single-flight). 'on_done(respuesta)' se
+    llama antes del evento final (p.ej. guardar el turno en la sesión) y
+    puede devolver campos extra para ese evento. 'scope' separa las
+    respuestas cacheadas por endpoint/nivel de riesgo (src/rag_cache.py).
+    """
+    start = time.perf_counter()
+    first_token_ms = None
+    parts = []
+    key = vector = flight = None
+    if cache is not None:
+        key, answer, vector = await cache.lookup(inputs["question"], inputs.get("history", ""), kb_version, scope)
+        if answer is not None:
+            origin = "semantic" if vector is not None else "exact"
+        else:
+            # Single-flight: si otra petición idéntica ya está generando, se espera su respuesta completa
+            try:
+                answer = await cache.wait_in_flight(key)
+            except Exception as e:
+                record_error("stream")
+                yield {"type": "error", "detail": f"Error en el RAG chain: {e}"}
+                return
+            origin = "coalesced"
+        if answer is not None:
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield {"type": "token", "data": answer}
+            done = {"type": "done", "coach_message": answer, "cache": origin,
+                    "time_to_first_token_ms": elapsed_ms, "total_ms": elapsed_ms}
+            done.update((on_done(answer) or {}) if on_done is not None else {})
+            yield done
+            return
+        cache.record_miss()
+        flight = cache.start_flight(key)
+    llm_call = start_llm_call()
+    try:
+        try:
+            async for chunk in chain.astream(inputs):
+                if not chunk:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                    llm_call.token()
+                parts.append(chunk)
+                yield {"type": "token", "data": chunk}
+        except Exception as e:
+            # La respuesta HTTP ya salió con 200: el error se cuenta aquí
+            record_error("stream")
+            if flight is not None:
+                cache.finish_flight(key, flight, error=e)
+            yield {"type": "error", "detail": f"Error en el RAG chain: {e}"}
+            return
+        answer = "".join(parts)
+        llm_call.finish(count_tokens(answer))
+        if cache is not None:
+            cache.store(key, inputs["question"], answer, vector, scope)
+            cache.finish_flight(key, flight, answer)
+    finally:
+        if flight is not None and not flight.done():
+            # Cliente desconectado a mitad del stream: las peticiones que esperaban calculan por su cuenta
+            cache.finish_flight(key, flight)
+    done = {
+        "type": "done",
+        "coach_message": answer,
+        "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    done.update((on_done(answer) or {}) if on_done is not None else {})
+    yield done
+
+
+async def sse_stream(chain, inputs: Dict[str, Any], cache=None, kb_version: Optional[str] = None,
+                     on_done: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+                     scope: str = "", **extra) -> AsyncIterator[str]:
+    """stream_chain en formato SSE; 'extra' se agrega al evento 'done'."""
+    async for message in stream_chain(chain, inputs, cache, kb_version, on_done, scope):
+        kind = message.pop("type")
+        if kind == "done":
+            message.update(extra)
+        yield sse_event(kind, message)
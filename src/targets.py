@@ -1,16 +1,23 @@
 # Contenido para: src/targets.py (VERSIÓN 3 - Final)
 
-import pandas as pd
 import numpy as np
 import os
+import sys
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src.storage import read_table, write_table
 
 # --- Configuración ---
 DATA_DIR = "data/processed"
-INPUT_TRAIN = os.path.join(DATA_DIR, "train_dataset.csv")
-INPUT_TEST = os.path.join(DATA_DIR, "test_dataset.csv")
+INPUT_TRAIN = os.path.join(DATA_DIR, "train_dataset.parquet")
+INPUT_TEST = os.path.join(DATA_DIR, "test_dataset.parquet")
 
-OUTPUT_TRAIN = os.path.join(DATA_DIR, "train_with_target.csv")
-OUTPUT_TEST = os.path.join(DATA_DIR, "test_with_target.csv")
+OUTPUT_TRAIN = os.path.join(DATA_DIR, "train_with_target.parquet")
+OUTPUT_TEST = os.path.join(DATA_DIR, "test_with_target.parquet")
 
 # Variables de laboratorio (SOLO EXISTEN EN TRAIN)
 SYSTOLIC_VAR = 'BPXSY2'
@@ -52,30 +59,34 @@ def create_target_variable(df, target_name):
     
     return df
 
-def main():
-    print(f"--- Iniciando script: src/targets.py (Target: Hipertensión) ---")
-    
-    # --- Procesar datos de ENTRENAMIENTO ---
+def process_train():
+    """Crea el target del set de ENTRENAMIENTO. Devuelve True si se guardó."""
     print(f"\nProcesando {INPUT_TRAIN}...")
     try:
-        train_df = pd.read_csv(INPUT_TRAIN)
+        train_df = read_table(INPUT_TRAIN)
         train_df_with_target = create_target_variable(train_df, TARGET_NAME)
         
-        if train_df_with_target is not None:
-            train_df_with_target.to_csv(OUTPUT_TRAIN, index=False)
-            print(f"✅ Archivo de entrenamiento guardado en: {OUTPUT_TRAIN}")
-            print(f"   Distribución del target: \n{train_df_with_target[TARGET_NAME].value_counts(normalize=True)}")
+        if train_df_with_target is None:
+            return False
+
+        write_table(train_df_with_target, OUTPUT_TRAIN, stage="targets")
+        print(f"✅ Archivo de entrenamiento guardado en: {OUTPUT_TRAIN}")
+        print(f"   Distribución del target: \n{train_df_with_target[TARGET_NAME].value_counts(normalize=True)}")
+        return True
             
     except FileNotFoundError:
         print(f"ERROR: No se encontró el archivo {INPUT_TRAIN}")
-        return
+        return False
 
-    # --- Procesar datos de PRUEBA ---
-    # Esto es un set de prueba ciego. No podemos calcular el target.
-    # Solo crearemos la columna 'TARGET_HIPERTENSION' como un placeholder (NaN).
+
+def process_test():
+    """
+    Procesa el set de PRUEBA. Es un set de prueba ciego: no podemos calcular el
+    target, solo crearemos la columna 'TARGET_HIPERTENSION' como placeholder (NaN).
+    """
     print(f"\nProcesando {INPUT_TEST} (Set de prueba ciego)...")
     try:
-        test_df = pd.read_csv(INPUT_TEST)
+        test_df = read_table(INPUT_TEST)
         
         # Verificar si las columnas BPX existen (no deberían)
         if SYSTOLIC_VAR in test_df.columns:
@@ -88,12 +99,28 @@ def main():
             print(f"  Creando columna '{TARGET_NAME}' con valores nulos (NaN).")
             test_df[TARGET_NAME] = np.nan
             test_df_with_target = test_df
+
+        if test_df_with_target is None:
+            return False
         
-        test_df_with_target.to_csv(OUTPUT_TEST, index=False)
+        write_table(test_df_with_target, OUTPUT_TEST, stage="targets")
         print(f"✅ Archivo de prueba (ciego) guardado en: {OUTPUT_TEST}")
+        return True
 
     except FileNotFoundError:
         print(f"ERROR: No se encontró el archivo {INPUT_TEST}")
+        return False
+
+
+def main():
+    print(f"--- Iniciando script: src/targets.py (Target: Hipertensión) ---")
+    
+    # --- Procesar datos de ENTRENAMIENTO ---
+    if not process_train():
+        return
+
+    # --- Procesar datos de PRUEBA ---
+    if not process_test():
         return
         
     print("\n--- Proceso de creación de targets completado ---")
@@ -0,0 +1,252 @@
+# Contenido para: src/transformer.py
+#
+# Transformador de features "ajustado" (fitted), compartido por el
+# entrenamiento (src/features.py) y la inferencia (api/main.py, app/app.py).
+#
+# Guarda en un solo artefacto (models/feature_transformer.json):
+#   - el mapeo de columnas NHANES crudas -> features 'feat_*'
+#   - el manejo de códigos de faltante (77/99 en sueño, 7/9 en actividad)
+#   - las medianas de imputación calculadas en 'train'
+#
+# Tiene dos caminos que producen exactamente los mismos valores:
+#   - transform(df):        vectorizado (numpy) para datasets completos
+#   - transform_one(dict):  una sola fila, sin pandas, para servir en la API
+# Ambos calculan en float64 con el mismo orden de operaciones y redondean
+# el resultado (y las entradas) a float32, igual que el registro de dtypes.
+
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --- Configuración ---
+TRANSFORMER_PATH = os.path.join("models", "feature_transformer.json")
+ARTIFACT_VERSION = 1
+
+# Mapeo de nombres genéricos a columnas NHANES
+COLS_RAW = {
+    'age': 'RIDAGEYR',
+    'sex': 'RIAGENDR',        # 1=Hombre, 2=Mujer
+    'height': 'BMXHT',      # en cm
+    'weight': 'BMXWT',      # en kg
+    'waist': 'BMXWAIST',    # Circunferencia de cintura en cm
+    'sleep_hours': 'SLD_HOURS', # Horas de sueño (SLD010H/SLD012 unificadas)
+    'is_smoker': 'SMQ020',    # 1=Sí, 2=No
+    'activity_days': 'PAQ650', # Actividad física (códigos 7/9 = faltante)
+}
+
+# Features en el orden en que las espera el modelo, con las columnas crudas que usan
+FEATURE_INPUTS = {
+    'feat_imc': ('weight', 'height'),
+    'feat_whtr': ('waist', 'height'),
+    'feat_age': ('age',),
+    'feat_sex': ('sex',),
+    'feat_is_smoker': ('is_smoker',),
+    'feat_sleep_hours': ('sleep_hours',),
+    'feat_activity_days': ('activity_days',),
+}
+FEATURE_NAMES = tuple(FEATURE_INPUTS)
+
+# Recodificaciones y códigos "No sabe / Se negó" que pasan a faltante
+SEX_CODES = {1: 0.0, 2: 1.0}      # 1=Hombre -> 0, 2=Mujer -> 1
+SMOKER_CODES = {1: 1.0, 2: 0.0}   # 1=Sí -> 1, 2=No -> 0
+SLEEP_MISSING = (77, 99)
+ACTIVITY_MISSING = (7, 9)
+
+NAN = float("nan")
+
+
+def _f32(value: Any) -> float:
+    """Redondea un escalar a float32 (None o no numérico -> NaN)."""
+    if value is None:
+        return NAN
+    try:
+        return float(np.float32(value))
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    """Columna cruda como float64 (tras pasar por float32); NaN si no existe."""
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    values = pd.to_numeric(df[name], errors="coerce")
+    return values.to_numpy(dtype=np.float32, na_value=np.nan).astype(np.float64)
+
+
+def _recode(values: np.ndarray, codes: Mapping[int, float]) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    for code, mapped in codes.items():
+        out[values == code] = mapped
+    return out
+
+
+def _recode_one(value: float, codes: Mapping[int, float]) -> float:
+    for code, mapped in codes.items():
+        if value == code:
+            return mapped
+    return NAN
+
+
+def _ratio(num: np.ndarray, height: np.ndarray, squared: bool) -> np.ndarray:
+    # Altura en cero o negativa = dato inválido (evita inf en vez de NaN)
+    valid = height > 0
+    out = np.full(len(num), np.nan)
+    if squared:
+        h = height[valid] / 100
+        out[valid] = num[valid] / (h * h)
+    else:
+        out[valid] = num[valid] / height[valid]
+    return out
+
+
+def _ratio_one(num: float, height: float, squared: bool) -> float:
+    if not height > 0:
+        return NAN
+    if squared:
+        h = height / 100
+        return num / (h * h)
+    return num / height
+
+
+@dataclass
+class FeatureTransformer:
+    """
+    Columnas crudas NHANES -> features del modelo, con imputación por mediana.
+    'features' son las features que se pudieron calcular al ajustar
+    (las que no tenían sus columnas crudas se omiten, como antes).
+    """
+    features: Tuple[str, ...] = FEATURE_NAMES
+    medians: Dict[str, float] = field(default_factory=dict)
+    cols_raw: Dict[str, str] = field(default_factory=lambda: dict(COLS_RAW))
+    version: int = ARTIFACT_VERSION
+
+    # --- Camino vectorizado (entrenamiento / lotes) ---
+    def raw_features(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Features sin imputar, en float64 (antes del redondeo a float32)."""
+        col = lambda key: _column(df, self.cols_raw[key])
+        height = col('height')
+        out = {
+            'feat_imc': _ratio(col('weight'), height, squared=True),
+            'feat_whtr': _ratio(col('waist'), height, squared=False),
+            'feat_age': col('age'),
+            'feat_sex': _recode(col('sex'), SEX_CODES),
+            'feat_is_smoker': _recode(col('is_smoker'), SMOKER_CODES),
+        }
+        sleep = col('sleep_hours')
+        sleep[np.isin(sleep, SLEEP_MISSING)] = np.nan
+        out['feat_sleep_hours'] = sleep
+        activity = col('activity_days')
+        activity[np.isin(activity, ACTIVITY_MISSING)] = np.nan
+        out['feat_activity_days'] = activity
+        return {name: out[name] for name in self.features}
+
+    def fit(self, df: pd.DataFrame) -> "FeatureTransformer":
+        """Elige las features calculables y guarda sus medianas (de 'train')."""
+        available = [
+            name for name, keys in FEATURE_INPUTS.items()
+            if all(self.cols_raw[key] in df.columns for key in keys)
+        ]
+        for name in FEATURE_NAMES:
+            if name not in available:
+                missing = [self.cols_raw[k] for k in FEATURE_INPUTS[name] if self.cols_raw[k] not in df.columns]
+                print(f"  Aviso: {missing} no encontrado. Se omitirá '{name}'.")
+        self.features = tuple(available)
+
+        raw = self.raw_features(df)
+        self.medians = {}
+        for name, values in raw.items():
+            values = values.astype(np.float32)
+            median = np.nanmedian(values) if not np.isnan(values).all() else np.nan
+            self.medians[name] = _f32(median)
+        return self
+
+    def transform_array(self, df: pd.DataFrame) -> np.ndarray:
+        """Matriz (filas x features) en float32, imputada y en el orden del modelo."""
+        raw = self.raw_features(df)
+        out = np.empty((len(df), len(self.features)), dtype=np.float32)
+        for j, name in enumerate(self.features):
+            values = raw[name].astype(np.float32)
+            values[np.isnan(values)] = self.medians.get(name, NAN)
+            out[:, j] = values
+        return out
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Igual que transform_array, pero como DataFrame con el índice de 'df'."""
+        return pd.DataFrame(self.transform_array(df), columns=list(self.features), index=df.index)
+
+    # --- Camino de una fila (API / app), sin pandas ---
+    def transform_one(self, profile: Mapping[str, Any]) -> List[float]:
+        """
+        Una fila cruda {columna NHANES: valor} -> lista de features (float32)
+        en el orden del modelo. Las columnas ausentes o None se imputan.
+        """
+        get = lambda key: _f32(profile.get(self.cols_raw[key]))
+        height = get('height')
+        sleep = get('sleep_hours')
+        activity = get('activity_days')
+        values = {
+            'feat_imc': _ratio_one(get('weight'), height, squared=True),
+            'feat_whtr': _ratio_one(get('waist'), height, squared=False),
+            'feat_age': get('age'),
+            'feat_sex': _recode_one(get('sex'), SEX_CODES),
+            'feat_is_smoker': _recode_one(get('is_smoker'), SMOKER_CODES),
+            'feat_sleep_hours': NAN if sleep in SLEEP_MISSING else sleep,
+            'feat_activity_days': NAN if activity in ACTIVITY_MISSING else activity,
+        }
+        row = []
+        for name in self.features:
+            value = _f32(values[name])
+            row.append(self.medians.get(name, NAN) if math.isnan(value) else value)
+        return row
+
+    # --- Persistencia ---
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "features": list(self.features),
+            "medians": self.medians,
+            "cols_raw": self.cols_raw,
+            "missing_codes": {"sleep_hours": list(SLEEP_MISSING), "activity_days": list(ACTIVITY_MISSING)},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "FeatureTransformer":
+        if data.get("version") != ARTIFACT_VERSION:
+            raise ValueError(f"Versión de transformador no soportada: {data.get('version')}")
+        return cls(features=tuple(data["features"]), medians=dict(data["medians"]),
+                   cols_raw=dict(data["cols_raw"]), version=data["version"])
+
+    def save(self, path: str = TRANSFORMER_PATH) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        return path
+
+
+def load_transformer(path: str = TRANSFORMER_PATH) -> FeatureTransformer:
+    """Carga el transformador ajustado. Lanza FileNotFoundError si no existe."""
+    with open(path, "r", encoding="utf-8") as f:
+        return FeatureTransformer.from_dict(json.load(f))
+
+
+def check_parity(transformer: FeatureTransformer, df: pd.DataFrame) -> int:
+    """
+    Compara el camino vectorizado con transform_one fila por fila.
+    Devuelve el número de filas que difieren (debería ser 0).
+    """
+    batch = transformer.transform_array(df)
+    raw_cols = [c for c in transformer.cols_raw.values() if c in df.columns]
+    records = df[raw_cols].astype(object).where(df[raw_cols].notna(), None).to_dict("records")
+    mismatches = 0
+    for i, record in enumerate(records):
+        one = np.asarray(transformer.transform_one(record), dtype=np.float32)
+        if not np.array_equal(one, batch[i], equal_nan=True):
+            mismatches += 1
+    return mismatches
@@ -0,0 +1,345 @@
+# Contenido para: src/tuning.py
+#
+# Búsqueda de hiperparámetros del modelo (python src/model.py --tune).
+#
+# Successive halving: se prueban N configuraciones (muestra del espacio
+# SEARCH_SPACE) con pocas rondas de boosting; solo la mejor 1/ETA de cada
+# ronda sigue a la siguiente, con ETA veces más rondas. Las sobrevivientes
+# continúan desde su booster anterior (no se reentrena lo ya entrenado).
+#   - Las pruebas de cada ronda corren en paralelo en un ProcessPoolExecutor.
+#   - La matriz de entrenamiento/validación vive en un bloque de memoria
+#     compartida (multiprocessing.shared_memory): cada worker la lee una vez
+#     al iniciar, sin copiarla por pickle en cada tarea.
+#   - Se usa la misma partición entrenamiento/validación que train_model.
+# Al final: tabla de posiciones (models/tuning_leaderboard.json), tiempo de
+# pared frente al estimado de entrenar las mismas configuraciones con el
+# presupuesto completo (lo que ahorra el halving, no el muestreo), y se
+# guarda el booster ganador tal como se puntuó (cortado en su mejor ronda):
+# reentrenarlo no lo reproduce, porque al continuar un booster en cada ronda
+# de halving el submuestreo sigue otra secuencia aleatoria.
+
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+# Permite ejecutar el script como 'python src/xxx.py' desde la raíz
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from src.model import MODEL_DIR, SEED, evaluate_and_save, load_training_data, scale_pos_weight, split_train_val
+
+# --- Configuración ---
+WORKERS = int(os.getenv("NEXUSBYTE_TUNE_WORKERS", str(os.cpu_count() or 1)))
+N_CANDIDATES = int(os.getenv("NEXUSBYTE_TUNE_CANDIDATES", "27"))
+ETA = 3             # Se queda 1/ETA de las configuraciones por ronda; las rondas de boosting se multiplican por ETA
+MIN_ROUNDS = 25     # Rondas de boosting en la primera ronda de halving
+MAX_ROUNDS = 400    # Presupuesto de la última ronda (y de cada prueba sin halving)
+METRIC = "auroc"    # auroc | auprc
+EVAL_METRIC = {"auroc": "auc", "auprc": "aucpr"}  # Nombre de la métrica en XGBoost
+LEADERBOARD_PATH = os.path.join(MODEL_DIR, "tuning_leaderboard.json")
+LEADERBOARD_TOP = 10
+SCORE_TOLERANCE = 1e-6  # Diferencia tolerada entre el modelo guardado y su puntaje en la búsqueda
+
+# Profundidad, tasa de aprendizaje, submuestreo y regularización
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 6, 8],
+    "learning_rate": [0.03, 0.1, 0.3],
+    "subsample": [0.6, 0.8, 1.0],
+    "min_child_weight": [1, 5],
+    "reg_lambda": [0.1, 1.0, 10.0],
+}
+
+
+@dataclass(frozen=True)
+class SharedMatrix:
+    """Descriptor del bloque compartido: [X_train; X_val] (float32) seguido de y."""
+    name: str
+    n_train: int
+    n_val: int
+    n_features: int
+
+    @property
+    def n_rows(self) -> int:
+        return self.n_train + self.n_val
+
+    def views(self, buf) -> Tuple[np.ndarray, np.ndarray]:
+        X = np.ndarray((self.n_rows, self.n_features), dtype=np.float32, buffer=buf)
+        y = np.ndarray((self.n_rows,), dtype=np.float32, buffer=buf, offset=X.nbytes)
+        return X, y
+
+    @property
+    def nbytes(self) -> int:
+        return self.n_rows * (self.n_features + 1) * np.dtype(np.float32).itemsize
+
+
+@dataclass
+class Trial:
+    trial_id: int
+    params: Dict[str, Any]
+    rounds: int = 0                 # Rondas entrenadas (presupuesto de la última ronda alcanzada)
+    best_rounds: int = 0            # Rondas con el mejor puntaje de validación
+    rung: int = -1
+    auroc: float = float("nan")
+    auprc: float = float("nan")
+    fit_s: float = 0.0              # Tiempo de entrenamiento acumulado (todas sus rondas)
+    history: List[Dict[str, float]] = field(default_factory=list)
+
+    @property
+    def score(self) -> float:
+        return self.auroc if METRIC == "auroc" else self.auprc
+
+
+# --- Worker ---
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(spec: SharedMatrix, base_params: Dict[str, Any]) -> None:
+    """Se conecta al bloque compartido y arma las DMatrix una sola vez por proceso."""
+    shm = shared_memory.SharedMemory(name=spec.name)  # El padre lo crea y lo libera (unlink)
+    X, y = spec.views(shm.buf)
+    X.flags.writeable = False
+    y.flags.writeable = False
+    train = slice(0, spec.n_train)
+    val = slice(spec.n_train, spec.n_rows)
+    dtrain = xgb.QuantileDMatrix(X[train], label=y[train])
+    _worker.update(
+        shm=shm,
+        dtrain=dtrain,
+        dval=xgb.QuantileDMatrix(X[val], label=y[val], ref=dtrain),
+        y_val=np.array(y[val]),
+        base_params=base_params,
+    )
+
+
+def _run_trial(params: Dict[str, Any], rounds: int, booster_raw: Optional[bytearray],
+               done_rounds: int, best: Optional[Tuple[float, int]]) -> Dict[str, Any]:
+    """
+    Entrena hasta 'rounds' rondas en total, continuando desde 'booster_raw' si
+    viene. La prueba vale lo que su mejor ronda hasta ahora ('best' trae la de
+    las rondas anteriores), como con early stopping.
+    """
+    start = time.perf_counter()
+    previous = None
+    if booster_raw is not None:
+        previous = xgb.Booster()
+        previous.load_model(booster_raw)
+    evals_result: Dict[str, Dict[str, List[float]]] = {}
+    booster = xgb.train({**_worker["base_params"], **params}, _worker["dtrain"],
+                        num_boost_round=rounds - done_rounds, xgb_model=previous,
+                        evals=[(_worker["dval"], "val")], evals_result=evals_result, verbose_eval=False)
+    fit_s = time.perf_counter() - start
+
+    curve = evals_result["val"][EVAL_METRIC[METRIC]]
+    i = int(np.argmax(curve))
+    best_score, best_rounds = best or (-np.inf, 0)
+    if curve[i] > best_score:
+        best_score, best_rounds = float(curve[i]), done_rounds + i + 1
+    proba = booster.predict(_worker["dval"], iteration_range=(0, best_rounds))
+    return {
+        "auroc": float(roc_auc_score(_worker["y_val"], proba)),
+        "auprc": float(average_precision_score(_worker["y_val"], proba)),
+        "best": (best_score, best_rounds),
+        "fit_s": fit_s,
+        "booster": booster.save_raw("ubj"),
+    }
+
+
+# --- Búsqueda ---
+def sample_candidates(n: int, seed: int = SEED) -> List[Dict[str, Any]]:
+    """n configuraciones distintas del grid SEARCH_SPACE (todas si n >= tamaño del grid)."""
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if n >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, n)
+
+
+def grid_size() -> int:
+    return math.prod(len(values) for values in SEARCH_SPACE.values())
+
+
+def rung_budgets(n_candidates: int, eta: int = ETA, min_rounds: int = MIN_ROUNDS,
+                 max_rounds: int = MAX_ROUNDS) -> List[int]:
+    """Rondas de boosting por ronda de halving; la última siempre llega a max_rounds."""
+    n_rungs = 1
+    while n_candidates > eta ** n_rungs and min_rounds * eta ** n_rungs < max_rounds:
+        n_rungs += 1
+    budgets = [min(min_rounds * eta ** i, max_rounds) for i in range(n_rungs)]
+    budgets[-1] = max_rounds
+    return budgets
+
+
+def _share(X_train, X_val, y_train, y_val) -> Tuple[shared_memory.SharedMemory, SharedMatrix]:
+    spec_shape = dict(n_train=len(X_train), n_val=len(X_val), n_features=X_train.shape[1])
+    nbytes = SharedMatrix("", **spec_shape).nbytes
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    spec = SharedMatrix(shm.name, **spec_shape)
+    X, y = spec.views(shm.buf)
+    X[:spec.n_train] = X_train.to_numpy(dtype=np.float32, na_value=np.nan)
+    X[spec.n_train:] = X_val.to_numpy(dtype=np.float32, na_value=np.nan)
+    y[:spec.n_train] = y_train.to_numpy(dtype=np.float32)
+    y[spec.n_train:] = y_val.to_numpy(dtype=np.float32)
+    del X, y  # Sin vistas vivas el bloque se puede cerrar
+    return shm, spec
+
+
+def successive_halving(X_train, X_val, y_train, y_val, workers: int = WORKERS,
+                       n_candidates: int = N_CANDIDATES) -> Dict[str, Any]:
+    """Corre la búsqueda y devuelve las pruebas (mejor primero), los boosters de la última ronda y los tiempos."""
+    candidates = sample_candidates(n_candidates)
+    budgets = rung_budgets(len(candidates))
+    workers = max(1, min(workers, len(candidates)))
+    base_params = {
+        "objective": "binary:logistic",
+        "eval_metric": EVAL_METRIC[METRIC],
+        "scale_pos_weight": scale_pos_weight(y_train),
+        "seed": SEED,
+        "nthread": max(1, (os.cpu_count() or 1) // workers),
+        "verbosity": 0,
+    }
+    trials = [Trial(i, params) for i, params in enumerate(candidates)]
+    boosters: Dict[int, bytearray] = {}
+    bests: Dict[int, Tuple[float, int]] = {}
+
+    print(f"Successive halving: {len(trials)} configuraciones, rondas de boosting {budgets}, "
+          f"{workers} workers, métrica {METRIC}.")
+    shm, spec = _share(X_train, X_val, y_train, y_val)
+    print(f"  Matriz compartida: {spec.n_rows} filas x {spec.n_features} features "
+          f"({spec.nbytes / 1e6:.1f} MB, un solo bloque para todos los workers)")
+    wall_start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(spec, base_params)) as executor:
+            alive = trials
+            for rung, rounds in enumerate(budgets):
+                rung_start = time.perf_counter()
+                futures = [executor.submit(_run_trial, t.params, rounds, boosters.get(t.trial_id), t.rounds,
+                                           bests.get(t.trial_id))
+                           for t in alive]
+                for trial, future in zip(alive, futures):
+                    result = future.result()
+                    boosters[trial.trial_id] = result.pop("booster")
+                    bests[trial.trial_id] = result["best"]
+                    trial.history.append({"rung": rung, "rounds": rounds, "fit_s": result["fit_s"],
+                                          "auroc": result["auroc"], "auprc": result["auprc"]})
+                    trial.rounds, trial.rung = rounds, rung
+                    trial.best_rounds = result["best"][1]
+                    trial.auroc, trial.auprc = result["auroc"], result["auprc"]
+                    trial.fit_s += result["fit_s"]
+                alive.sort(key=lambda t: t.score, reverse=True)
+                best = alive[0]
+                print(f"  Ronda {rung}: {len(alive):>3} configuraciones x {rounds:>4} rondas "
+                      f"en {time.perf_counter() - rung_start:6.2f} s | mejor {METRIC} {best.score:.4f}")
+                keep = max(1, len(alive) // ETA)
+                for trial in alive[keep:]:
+                    boosters.pop(trial.trial_id, None)
+                alive = alive[:keep]
+    finally:
+        shm.close()
+        shm.unlink()
+    wall_s = time.perf_counter() - wall_start
+
+    # Referencia justa: las mismas configuraciones, todas con el presupuesto completo y los
+    # mismos workers (sin halving). Es una estimación, no una medición: usa el tiempo por ronda
+    # de boosting medido en la primera ronda (todas las configuraciones), igual para ambos lados.
+    first = [t.history[0] for t in trials]
+    s_per_round = sum(h["fit_s"] for h in first) / sum(h["rounds"] for h in first)
+    full_budget_rounds = len(trials) * budgets[-1]
+    halving_rounds = sum(t.rounds for t in trials)
+
+    trials.sort(key=lambda t: (t.rung, t.score), reverse=True)
+    return {
+        "trials": trials,
+        "boosters": boosters,  # Solo quedan los de las sobrevivientes de la última ronda
+        "budgets": budgets,
+        "workers": workers,
+        "wall_s": wall_s,
+        "halving_rounds": halving_rounds,
+        "halving_wall_s_estimate": halving_rounds * s_per_round / workers,
+        "n_candidates": len(trials),
+        "grid_size": grid_size(),
+        "full_budget_rounds": full_budget_rounds,
+        "full_budget_wall_s_estimate": full_budget_rounds * s_per_round / workers,
+    }
+
+
+def print_leaderboard(result: Dict[str, Any], top: int = LEADERBOARD_TOP) -> None:
+    print(f"\n--- Tabla de posiciones (top {top}, ordenada por ronda alcanzada y {METRIC}) ---")
+    keys = list(SEARCH_SPACE)
+    header = "".join(f"{k:>17}" for k in keys)
+    print(f"  {'#':>3} {'Rondas':>6} {'Mejor':>6} {'AUROC':>7} {'AUPRC':>7} {'Fit (s)':>8}{header}")
+    for rank, t in enumerate(result["trials"][:top], start=1):
+        values = "".join(f"{t.params[k]:>17}" for k in keys)
+        print(f"  {rank:>3} {t.rounds:>6} {t.best_rounds:>6} {t.auroc:>7.4f} {t.auprc:>7.4f} {t.fit_s:>8.2f}{values}")
+
+    n, budget = result["n_candidates"], result["budgets"][-1]
+    print(f"\n  Successive halving: {n} de {result['grid_size']} configuraciones del espacio, "
+          f"{result['halving_rounds']} rondas de boosting, {result['wall_s']:.2f} s de pared medidos "
+          f"(~{result['halving_wall_s_estimate']:.2f} s estimados).")
+    print(f"  Sin halving (las mismas {n} configuraciones x {budget} rondas, {result['workers']} workers): "
+          f"{result['full_budget_rounds']} rondas, ~{result['full_budget_wall_s_estimate']:.2f} s estimados.")
+    print(f"  Ahorro estimado del halving: "
+          f"{result['full_budget_wall_s_estimate'] - result['halving_wall_s_estimate']:.2f} s "
+          f"({result['full_budget_rounds'] / max(result['halving_rounds'], 1):.1f}x menos rondas; "
+          f"estimación con el tiempo por ronda de la primera ronda, no una medición).")
+
+
+def save_leaderboard(result: Dict[str, Any], path: str = LEADERBOARD_PATH) -> str:
+    report = {key: value for key, value in result.items() if key not in ("trials", "boosters")}
+    report.update(metric=METRIC, eta=ETA, search_space=SEARCH_SPACE,
+                  created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  trials=[asdict(t) for t in result["trials"]])
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=float)
+    return path
+
+
+def final_model(booster_raw: bytearray, best_rounds: int, X_train, y_train) -> xgb.XGBClassifier:
+    """
+    El booster de la búsqueda cortado en 'best_rounds', como XGBClassifier
+    (lo que carga la API). fit() con 0 rondas nuevas solo arma el estimador.
+    """
+    booster = xgb.Booster()
+    booster.load_model(booster_raw)
+    booster = booster[:best_rounds]
+    booster.feature_names = list(X_train.columns)
+    model = xgb.XGBClassifier(objective="binary:logistic", n_estimators=0, random_state=SEED)
+    model.fit(X_train, y_train, xgb_model=booster)
+    return model
+
+
+def tune(workers: Optional[int] = None, n_candidates: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Búsqueda completa: halving, tabla de posiciones y el booster ganador guardado en MODEL_PATH."""
+    print("--- Búsqueda de hiperparámetros (successive halving) ---")
+    data = load_training_data()
+    if data is None:
+        return None
+    X_train, X_val, y_train, y_val = split_train_val(*data)
+
+    result = successive_halving(X_train, X_val, y_train, y_val,
+                                workers=workers or WORKERS, n_candidates=n_candidates or N_CANDIDATES)
+    print_leaderboard(result)
+    print(f"\n✅ Tabla de posiciones guardada en: {save_leaderboard(result)}")
+
+    best = result["trials"][0]
+    print(f"\nMejor configuración: {best.params} ({best.best_rounds} rondas, {METRIC} {best.score:.4f})")
+    model = final_model(result["boosters"][best.trial_id], best.best_rounds, X_train, y_train)
+    metrics = evaluate_and_save(model, X_val, y_val)
+    if abs(metrics[METRIC] - best.score) > SCORE_TOLERANCE:
+        raise RuntimeError(f"El modelo guardado tiene {METRIC} {metrics[METRIC]:.6f}, "
+                           f"distinto del {best.score:.6f} de la tabla de posiciones.")
+    return result
@@ -0,0 +1,41 @@
+# Contenido para: tests/test_api_predict.py
+
+import asyncio
+
+import api.main as main
+from src.pred_cache import PredictionCache
+
+
+class FakeModel:
+    feature_names = ("feat_imc", "feat_whtr")
+    calls = 0
+
+    def predict_proba_one(self, row):
+        self.calls += 1
+        return 0.7
+
+
+class FakeTransformer:
+    def transform_one(self, profile):
+        return [28.5, 0.55]
+
+
+def test_cache_hits_do_not_renew_the_entry_and_are_audited_as_cached(monkeypatch):
+    cache, model, logged = PredictionCache(ttl_s=60), FakeModel(), []
+    monkeypatch.setattr(main, "PREDICTION_CACHE", cache)
+    monkeypatch.setattr(main, "compiled_model", model)
+    monkeypatch.setattr(main, "feature_transformer", FakeTransformer())
+    monkeypatch.setattr(main, "predict_batcher", None)
+    monkeypatch.setattr(main, "ml_model_version", "v1")
+    monkeypatch.setattr(main, "require_components", lambda *names: None)
+    monkeypatch.setattr(main, "refresh_ml_model", lambda: None)
+    monkeypatch.setattr(main.audit, "log_prediction", lambda features, *args, **extra: logged.append((features, extra)))
+
+    first = asyncio.run(main.predict_hypertension(main.ProfileInput()))
+    (expires_at,) = [entry[1] for entry in cache._entries.values()]
+    second = asyncio.run(main.predict_hypertension(main.ProfileInput()))
+
+    assert first == second and model.calls == 1
+    assert [entry[1] for entry in cache._entries.values()] == [expires_at]  # El acierto no renovó el TTL
+    assert [extra["cached"] for _, extra in logged] == [0, 1]
+    assert logged[0][0] == {"feat_imc": 28.5, "feat_whtr": 0.55}
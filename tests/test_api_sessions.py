@@ -0,0 +1,21 @@
+# Contenido para: tests/test_api_sessions.py
+
+from types import SimpleNamespace
+
+import api.main as main
+from src.sessions import MemorySessionStore
+
+
+def test_record_turn_reports_a_session_that_disappeared(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(main, "session_store", store)
+    monkeypatch.setattr(main.audit, "log_chat", lambda *args, **kwargs: True)
+    memory = SimpleNamespace(folded_turns=0, summary="", history_tokens=0)
+
+    session = store.create()
+    assert main.record_turn(session, "hola", "qué tal", memory) == {"session_id": session.session_id}
+    assert store.get(session.session_id).turns == 1
+
+    store.delete(session.session_id)  # Borrada mientras se generaba la respuesta
+    result = main.record_turn(session, "hola", "qué tal", memory)
+    assert result["session_id"] is None and "no se guardó" in result["session_error"]
@@ -0,0 +1,47 @@
+# Contenido para: tests/test_audit.py
+
+import asyncio
+import time
+
+from src.audit import AuditWriter
+
+
+def test_block_policy_does_not_stall_the_event_loop(tmp_path):
+    writer = AuditWriter(str(tmp_path / "logs.jsonl"), queue_size=1, policy="block", block_timeout_s=0.5)
+    writer._ensure_started = lambda: None  # Sin hilo escritor: la cola queda llena
+    writer.write({"n": 0})
+
+    async def run():
+        start = time.perf_counter()
+        accepted = writer.write({"n": 1})
+        return accepted, time.perf_counter() - start
+
+    accepted, elapsed = asyncio.run(run())
+    assert accepted
+    assert elapsed < 0.1
+
+
+def test_writer_survives_non_os_errors(tmp_path):
+    path = tmp_path / "results.csv"
+    path.write_bytes(b"\xff\xfe encabezado ilegible\n")  # _read_header -> UnicodeDecodeError
+    writer = AuditWriter(str(path), kind="csv")
+    writer.write({"risk_score": 0.5})
+    writer.flush()
+    assert writer._thread.is_alive()
+
+    path.write_text("risk_score\n", encoding="utf-8")
+    writer.write({"risk_score": 0.7})
+    writer.flush()
+    writer.close()
+    assert path.read_text(encoding="utf-8").splitlines() == ["risk_score", "0.7"]
+
+
+def test_csv_columns_outside_the_header_are_reported(tmp_path, capsys):
+    path = tmp_path / "results.csv"
+    path.write_text("feat_imc,feat_age,risk_score\n", encoding="utf-8")
+    writer = AuditWriter(str(path), kind="csv")
+    writer.write({"feat_imc": 28.5, "feat_is_smoker": 1.0, "risk_score": 0.4})
+    writer.flush()
+    writer.close()
+    assert path.read_text(encoding="utf-8").splitlines()[1] == "28.5,,0.4"  # Cada valor en su columna
+    assert "feat_is_smoker" in capsys.readouterr().out
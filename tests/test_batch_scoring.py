@@ -0,0 +1,59 @@
+# Contenido para: tests/test_batch_scoring.py
+
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from src import batch_scoring
+
+
+async def body_stream(data: bytes, part: int = 1024):
+    for start in range(0, len(data), part):
+        yield data[start:start + part]
+
+
+def test_ndjson_frames_are_read_off_the_loop_and_the_spool_is_closed(monkeypatch):
+    monkeypatch.setattr(batch_scoring, "SPOOL_BYTES", 64)  # Fuerza el volcado a disco
+    data = b"".join(json.dumps({"id": i, "age": 40 + i}).encode() + b"\n" for i in range(50))
+    readers = []
+
+    def tracking_frames(source):
+        for frame in batch_scoring.ndjson_frames(source, chunk_rows=20):
+            readers.append(threading.get_ident())
+            yield frame
+
+    async def run():
+        spool = await batch_scoring.spool_body(body_stream(data))
+        frames = batch_scoring.as_async(tracking_frames(spool), close=spool.close)
+        lines = [line async for chunk in batch_scoring.stream_scores(
+            frames, lambda df: np.full(len(df), 0.7), "application/x-ndjson") for line in chunk.splitlines()]
+        return spool, lines, threading.get_ident()
+
+    spool, lines, loop_thread = asyncio.run(run())
+    assert spool.closed
+    assert readers and loop_thread not in readers
+    assert len(lines) == 51 and json.loads(lines[-1])["summary"]["rows"] == 50
+
+
+def test_spool_is_closed_when_the_upload_fails():
+    spools = []
+    real = batch_scoring.tempfile.SpooledTemporaryFile
+
+    def recording(*args, **kwargs):
+        spools.append(real(*args, **kwargs))
+        return spools[-1]
+
+    async def broken():
+        yield b'{"age": 40}\n'
+        raise ConnectionError("cliente desconectado")
+
+    batch_scoring.tempfile.SpooledTemporaryFile = recording
+    try:
+        with pytest.raises(ConnectionError):
+            asyncio.run(batch_scoring.spool_body(broken()))
+    finally:
+        batch_scoring.tempfile.SpooledTemporaryFile = real
+    assert spools[0].closed
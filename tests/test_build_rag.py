@@ -0,0 +1,39 @@
+# Contenido para: tests/test_build_rag.py
+
+import pytest
+
+from src import build_rag, providers
+from src.rag import read_manifest
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    kb_dir = tmp_path / "kb"
+    kb_dir.mkdir()
+    (kb_dir / "diabetes.txt").write_text("La diabetes tipo 2 se asocia al sobrepeso.", encoding="utf-8")
+    faiss_dir = tmp_path / "faiss_index"
+    monkeypatch.setattr(build_rag, "KB_DIR", str(kb_dir))
+    monkeypatch.setattr(build_rag, "FAISS_PATH", str(faiss_dir))
+    monkeypatch.setattr(build_rag, "BM25_PATH", str(tmp_path / "bm25_index.npz"))
+    monkeypatch.setattr(providers, "PROVIDER", "openai")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    return faiss_dir
+
+
+def test_build_without_api_key_removes_the_stale_faiss_index(kb):
+    kb.mkdir()
+    (kb / "index.faiss").write_bytes(b"viejo")
+    (kb / "index.pkl").write_bytes(b"viejo")
+
+    build_rag.build_vector_store()
+
+    manifest = read_manifest(str(kb))
+    assert manifest.embedding_model == ""
+    assert "faiss" not in manifest.files
+    assert not (kb / "index.faiss").exists()
+    assert not (kb / "index.pkl").exists()
+
+
+def test_update_faiss_index_rejects_empty_splits(tmp_path):
+    with pytest.raises(ValueError):
+        build_rag.update_faiss_index([], embeddings=None, faiss_path=str(tmp_path))
@@ -0,0 +1,50 @@
+# Contenido para: tests/test_compiled_model.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+from src.compiled_model import compile_model
+
+FEATURES = ["feat_imc", "feat_whtr", "feat_is_smoker", "feat_sleep_hours", "feat_activity_days"]
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(2000, len(FEATURES))), columns=FEATURES).astype(np.float32)
+    X.iloc[::9, 1] = np.nan
+    y = ((X["feat_imc"] + 0.5 * X["feat_is_smoker"] + rng.normal(scale=0.5, size=len(X))) > 0).astype(int)
+    return xgb.XGBClassifier(n_estimators=30, max_depth=4, random_state=42).fit(X, y), X
+
+
+def test_compiled_matches_booster_predict(model):
+    clf, X = model
+    compiled = compile_model(clf)
+    expected = clf.get_booster().predict(xgb.DMatrix(X))
+    single = np.array([compiled.predict_proba_one(row) for row in X.to_numpy().tolist()])
+    assert np.abs(single - expected).max() <= 1e-6
+    assert np.abs(compiled.predict_proba(X.to_numpy()) - expected).max() <= 1e-6
+
+
+def test_row_from_features_uses_model_names_and_float32(model):
+    clf, X = model
+    compiled = compile_model(clf)
+    assert compiled.feature_names == tuple(FEATURES)
+    values = {name: float(X.iloc[3][name]) + 1e-9 for name in reversed(FEATURES)}  # Otro orden, float64
+    row = compiled.row_from_features(values)
+    assert row == [float(np.float32(values[name])) for name in FEATURES]
+    expected = clf.get_booster().predict(xgb.DMatrix(pd.DataFrame([row], columns=FEATURES)))[0]
+    assert abs(compiled.predict_proba_one(row) - expected) <= 1e-6
+
+
+def test_mismatched_features_are_rejected(model):
+    compiled = compile_model(model[0])
+    full = {name: 1.0 for name in FEATURES}
+    with pytest.raises(ValueError, match="feat_age"):
+        compiled.row_from_features({**full, "feat_age": 45})
+    with pytest.raises(ValueError, match="feat_imc"):
+        compiled.row_from_features({**full, "feat_imc": None})
+    with pytest.raises(ValueError):
+        compiled.predict_proba_one([1.0] * 7)  # Fila con las 7 features de FeaturesInput
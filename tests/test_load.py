@@ -0,0 +1,16 @@
+# Contenido para: tests/test_load.py
+
+from src import load
+
+
+def test_component_without_dataset_falls_back_to_its_csv(tmp_path, monkeypatch, capsys):
+    raw = tmp_path / "raw"
+    (raw / "AgeAndSex_TRAIN").mkdir(parents=True)
+    (tmp_path / "AgeAndSex_TRAIN.csv").write_text("SEQN\n1\n")
+    (tmp_path / "Sleep_TRAIN.csv").write_text("SEQN\n1\n")  # Su conversión a data/raw falló
+    monkeypatch.setattr(load, "RAW_DIR", str(raw))
+    monkeypatch.setattr(load, "ROOT_DIR", str(tmp_path))
+
+    files = load.find_component_files("_TRAIN.csv")
+    assert files == {"AgeAndSex": str(raw / "AgeAndSex_TRAIN"), "Sleep": str(tmp_path / "Sleep_TRAIN.csv")}
+    assert "'Sleep' no tiene dataset" in capsys.readouterr().out
@@ -0,0 +1,24 @@
+# Contenido para: tests/test_metrics.py
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.metrics import REGISTRY, RequestMetricsMiddleware
+
+
+def test_unmatched_paths_share_one_endpoint_label():
+    app = FastAPI()
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"item_id": item_id}
+
+    with TestClient(app) as client:
+        for path in ("/nope/1", "/nope/2", "/items/1", "/items/2"):
+            client.get(path)
+
+    series = [line for line in REGISTRY.render().splitlines() if line.startswith("nexusbyte_http_requests_total")]
+    assert not any("/nope" in line for line in series)
+    assert any('endpoint="unmatched"' in line and 'status="404"' in line for line in series)
+    assert any('endpoint="/items/{item_id}"' in line for line in series)
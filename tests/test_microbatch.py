@@ -0,0 +1,71 @@
+# Contenido para: tests/test_microbatch.py
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src.metrics import MetricsRegistry
+from src.microbatch import MicroBatcher, WorkerStoppedError
+
+
+def make_batcher(score_batch):
+    return MicroBatcher(score_batch, window_ms=1, registry=MetricsRegistry())
+
+
+def test_dead_worker_fails_its_pending_requests_and_restarts():
+    batcher = make_batcher(lambda X: X[:, 0] * 2)
+    observe = batcher.batch_size.observe
+    crashes = [RuntimeError("fallo inesperado")]
+
+    def crash_once(value):
+        if crashes:
+            raise crashes.pop()
+        observe(value)
+
+    batcher.batch_size.observe = crash_once
+
+    async def run():
+        first = await asyncio.wait_for(
+            asyncio.gather(batcher.submit([1.0]), batcher.submit([2.0]), return_exceptions=True), 1)
+        second = await asyncio.wait_for(batcher.submit([3.0]), 1)  # Worker nuevo
+        await batcher.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert all(isinstance(e, WorkerStoppedError) for e in first)
+    assert second == 6.0
+
+
+def test_stop_fails_the_batch_being_scored():
+    release = threading.Event()
+
+    def slow_score(X):
+        release.wait(1)
+        return np.zeros(len(X))
+
+    batcher = make_batcher(slow_score)
+
+    async def run():
+        pending = asyncio.ensure_future(batcher.submit([1.0]))
+        await asyncio.sleep(0.05)  # El worker ya tomó la fila y está puntuando
+        await batcher.stop()
+        release.set()
+        return await asyncio.wait_for(pending, 1)
+
+    with pytest.raises(WorkerStoppedError):
+        asyncio.run(run())
+
+
+def test_short_score_batch_fails_instead_of_hanging():
+    batcher = make_batcher(lambda X: np.zeros(len(X) - 1))
+
+    async def run():
+        try:
+            return await asyncio.wait_for(batcher.submit([1.0]), 1)
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,20 @@
+# Contenido para: tests/test_pipeline.py
+
+import dataclasses
+
+from src import pipeline
+
+
+def test_every_stage_hashes_the_shared_schema_code():
+    for stage in pipeline.build_stages():
+        names = {path.rsplit("/", 1)[-1] for path in stage.code}
+        assert {"storage.py", "schema.py", "urls_and_columns.py"} <= names, stage.name
+
+
+def test_schema_change_invalidates_the_stage(tmp_path):
+    schema = tmp_path / "schema.py"
+    schema.write_text("DTYPES = {'RIDAGEYR': 'float32'}\n")
+    stage = dataclasses.replace(pipeline.build_stages()[0], inputs=(), code=(str(schema),))
+    before = pipeline.stage_digest(stage)
+    schema.write_text("DTYPES = {'RIDAGEYR': 'float64'}\n")
+    assert pipeline.stage_digest(stage) != before
@@ -0,0 +1,21 @@
+# Contenido para: tests/test_providers.py
+
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_api_import_does_not_load_langchain():
+    code = ("import sys; import api.main; "
+            "loaded = [m for m in ('langchain_core', 'langchain_openai', 'src.local_llm') if m in sys.modules]; "
+            "print(loaded); sys.exit(1 if loaded else 0)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_local_backend_loads_on_demand():
+    from src.providers import get_chat_model, get_embeddings
+    assert get_chat_model(provider="local").invoke("¿Cómo bajo la presión?").content
+    assert len(get_embeddings(provider="local").embed_query("sal")) == 256
@@ -0,0 +1,92 @@
+# Contenido para: tests/test_rag_cache.py
+
+import asyncio
+
+from src.metrics import MetricsRegistry
+from src.rag_cache import RAGResponseCache
+
+VERSION = "kb-test"
+ALTO = ("Mi riesgo de hipertensión es alto (score: 0.81). ¿Qué consejos de salud (nutrición, ejercicio, "
+        "estrés) me puedes dar basándote en tu conocimiento?")
+BAJO = ALTO.replace("alto (score: 0.81)", "bajo (score: 0.18)")
+
+
+async def same_vector(text):
+    # Peor caso: embeddings que no distinguen "alto" de "bajo" (similitud 1.0)
+    return [1.0, 0.0, 0.0]
+
+
+def make_cache():
+    return RAGResponseCache(embed=same_vector, registry=MetricsRegistry())
+
+
+def test_semantic_tier_does_not_cross_coach_risk_levels():
+    cache = make_cache()
+
+    async def run():
+        async def plan_alto():
+            return "plan para riesgo alto"
+
+        async def plan_bajo():
+            return "plan para riesgo bajo"
+
+        await cache.get_or_compute(ALTO, "", VERSION, plan_alto, scope="coach:1")
+        return await cache.get_or_compute(BAJO, "", VERSION, plan_bajo, scope="coach:0")
+
+    answer, origin = asyncio.run(run())
+    assert answer == "plan para riesgo bajo"
+    assert origin == "miss"
+
+
+def test_semantic_tier_does_not_cross_chat_and_coach():
+    cache = make_cache()
+
+    async def run():
+        key, _, vector = await cache.lookup(ALTO, "", VERSION, scope="coach:1")
+        cache.store(key, ALTO, "plan para riesgo alto", vector, scope="coach:1")
+        return await cache.lookup("¿Qué consejos de salud me puedes dar?", "", VERSION, scope="chat")
+
+    _, answer, _ = asyncio.run(run())
+    assert answer is None
+
+
+def test_semantic_tier_hits_within_scope():
+    cache = make_cache()
+
+    async def run():
+        key, _, vector = await cache.lookup("¿Qué es la dieta DASH?", "", VERSION, scope="chat")
+        cache.store(key, "¿Qué es la dieta DASH?", "respuesta DASH", vector, scope="chat")
+        return await cache.lookup("Explícame la dieta DASH", "", VERSION, scope="chat")
+
+    _, answer, vector = asyncio.run(run())
+    assert answer == "respuesta DASH"
+    assert vector is not None
+
+
+def test_waiters_recompute_when_leader_is_cancelled():
+    cache = make_cache()
+    calls = []
+
+    async def run():
+        started = asyncio.Event()
+
+        async def slow():
+            calls.append("leader")
+            started.set()
+            await asyncio.sleep(10)
+            return "nunca"
+
+        async def fast():
+            calls.append("waiter")
+            return "respuesta del que esperaba"
+
+        leader = asyncio.create_task(cache.get_or_compute("¿Qué es la dieta DASH?", "", VERSION, slow, scope="chat"))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("¿Qué es la dieta DASH?", "", VERSION, fast, scope="chat"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter
+
+    answer, origin = asyncio.run(run())
+    assert (answer, origin) == ("respuesta del que esperaba", "miss")
+    assert calls == ["leader", "waiter"]
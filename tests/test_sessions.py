@@ -0,0 +1,66 @@
+# Contenido para: tests/test_sessions.py
+
+import sqlite3
+import threading
+
+from src.sessions import MemorySessionStore, SQLiteSessionStore
+
+
+def add_turn(n: int):
+    return lambda session: session.add_turn(f"pregunta {n}", f"respuesta {n}", 1, 1)
+
+
+def test_sqlite_concurrent_turns_are_not_lost(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    workers = [SQLiteSessionStore(path) for _ in range(4)]  # Como varios procesos sobre el mismo archivo
+    session_id = workers[0].create().session_id
+
+    def run(store, start):
+        for n in range(start, start + 25):
+            store.update(session_id, add_turn(n))
+
+    threads = [threading.Thread(target=run, args=(store, i * 25)) for i, store in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session = workers[0].get(session_id)
+    assert session.turns == 100
+    questions = {m["content"] for m in session.messages if m["role"] == "user"}
+    assert questions == {f"pregunta {n}" for n in range(100)}
+    for store in workers:
+        store.close()
+
+
+def test_sqlite_update_retries_after_a_concurrent_write(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store, other = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    session_id = store.create().session_id
+    calls = []
+
+    def slow_turn(session):
+        calls.append(session.turns)
+        if len(calls) == 1:  # Otro worker guarda su turno entre la lectura y la escritura
+            other.update(session_id, add_turn(0))
+        session.add_turn("pregunta 1", "respuesta 1", 1, 1)
+
+    store.update(session_id, slow_turn)
+    assert calls == [0, 1]
+    assert [m["content"] for m in store.get(session_id).messages if m["role"] == "user"] == \
+        ["pregunta 0", "pregunta 1"]
+
+
+def test_sqlite_migrates_tables_without_version(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    store = SQLiteSessionStore(path)
+    session_id = store.create().session_id
+    assert store.update(session_id, add_turn(0)).turns == 1
+
+
+def test_memory_update_missing_session():
+    assert MemorySessionStore().update("no-existe", add_turn(0)) is None
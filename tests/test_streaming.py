@@ -0,0 +1,58 @@
+# Contenido para: tests/test_streaming.py
+
+import asyncio
+
+from src.metrics import MetricsRegistry
+from src.rag_cache import RAGResponseCache
+from src.streaming import stream_chain
+
+
+class SlowChain:
+    """Chain falso: cuenta las llamadas y genera tres tokens con pausas."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def astream(self, inputs):
+        self.calls += 1
+        for token in ("Camina ", "30 ", "minutos."):
+            await asyncio.sleep(0.01)
+            yield token
+
+
+async def collect(chain, cache, inputs):
+    return [m async for m in stream_chain(chain, inputs, cache, "kb-test", scope="chat")]
+
+
+def test_concurrent_identical_streams_share_one_llm_call():
+    chain = SlowChain()
+    cache = RAGResponseCache(registry=MetricsRegistry())
+    inputs = {"question": "¿Cuánto debo caminar?", "history": ""}
+
+    async def run():
+        return await asyncio.gather(*[collect(chain, cache, inputs) for _ in range(3)])
+
+    results = asyncio.run(run())
+    assert chain.calls == 1
+    dones = [messages[-1] for messages in results]
+    assert all(d["type"] == "done" and d["coach_message"] == "Camina 30 minutos." for d in dones)
+    assert sorted(d.get("cache", "miss") for d in dones) == ["coalesced", "coalesced", "miss"]
+
+
+def test_waiting_stream_recomputes_when_leader_disconnects():
+    chain = SlowChain()
+    cache = RAGResponseCache(registry=MetricsRegistry())
+    inputs = {"question": "¿Cuánto debo caminar?", "history": ""}
+
+    async def run():
+        leader = stream_chain(chain, inputs, cache, "kb-test", scope="chat")
+        await leader.__anext__()  # Primer token: el líder ya está generando
+        waiter = asyncio.create_task(collect(chain, cache, inputs))
+        await asyncio.sleep(0)
+        await leader.aclose()     # Cliente desconectado
+        return await waiter
+
+    messages = asyncio.run(run())
+    assert chain.calls == 2
+    assert messages[-1]["type"] == "done"
+    assert messages[-1]["coach_message"] == "Camina 30 minutos."
@@ -0,0 +1,42 @@
+# Contenido para: tests/test_transformer.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features import verify_parity
+from src.transformer import COLS_RAW, FeatureTransformer, check_parity
+
+
+def raw_profiles(n: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        COLS_RAW["age"]: rng.integers(18, 80, n).astype(float),
+        COLS_RAW["sex"]: rng.choice([1, 2], n).astype(float),
+        COLS_RAW["height"]: rng.normal(168, 10, n),
+        COLS_RAW["weight"]: rng.normal(75, 15, n),
+        COLS_RAW["waist"]: rng.normal(95, 12, n),
+        COLS_RAW["sleep_hours"]: rng.choice([5, 6, 7, 8, 77, 99], n).astype(float),
+        COLS_RAW["is_smoker"]: rng.choice([1, 2, 7], n).astype(float),
+        COLS_RAW["activity_days"]: rng.choice([0, 3, 7, 9], n).astype(float),
+    })
+    df.iloc[::7, 2] = np.nan   # Alturas faltantes -> IMC/WHtR imputados
+    df.iloc[::11, 2] = 0.0     # Altura inválida
+    return df
+
+
+def test_vectorized_and_single_row_paths_match():
+    df = raw_profiles()
+    transformer = FeatureTransformer().fit(df)
+    assert check_parity(transformer, df) == 0
+    verify_parity(transformer, df, n_rows=100)
+
+
+def test_features_stage_fails_loudly_on_mismatch(monkeypatch):
+    df = raw_profiles()
+    transformer = FeatureTransformer().fit(df)
+    real = FeatureTransformer.transform_one
+    monkeypatch.setattr(FeatureTransformer, "transform_one",
+                        lambda self, profile: [v + 1e-3 for v in real(self, profile)])
+    with pytest.raises(RuntimeError, match="Paridad"):
+        verify_parity(transformer, df)
@@ -0,0 +1,67 @@
+# Contenido para: tests/test_xpt_downloader.py
+
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from xpt_downloader import NHANES_BASE_URL, XptCache, fetch_all
+
+PATHS = ("/Nchs/Data/Nhanes/Public/2015/DataFiles/BPX_I.xpt", "/Nchs/Data/Nhanes/Public/2017/DataFiles/P_BPXO.xpt")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-Modified-Since") is not None))
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def nhanes_server(tmp_path, monkeypatch):
+    root = tmp_path / "www"
+    for i, path in enumerate(PATHS):
+        target = root / path.lstrip("/")
+        target.parent.mkdir(parents=True)
+        target.write_bytes(f"HEADER RECORD {i}".encode() * 1000)
+    QuietHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("NHANES_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    yield root
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_then_revalidate_from_cache(nhanes_server, tmp_path):
+    cache = XptCache(str(tmp_path / "cache"))
+    urls = {("TRAIN", "BPX", "2015"): NHANES_BASE_URL + PATHS[0], ("TEST", "BPX", "2017"): NHANES_BASE_URL + PATHS[1]}
+
+    first = fetch_all(urls, max_workers=2, cache=cache)
+    assert all(r.ok and not r.from_cache for r in first.values())
+    with open(first[("TRAIN", "BPX", "2015")].path, "rb") as f:
+        assert f.read() == (nhanes_server / PATHS[0].lstrip("/")).read_bytes()
+
+    second = fetch_all(urls, max_workers=2, cache=XptCache(str(tmp_path / "cache")))  # Nueva ejecución
+    assert all(r.ok and r.from_cache for r in second.values())
+    assert sorted(QuietHandler.requests_seen[-2:]) == sorted((p, True) for p in PATHS)  # Peticiones condicionales
+
+
+def test_stale_process_does_not_overwrite_newer_index_entries(nhanes_server, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    stale, fresh = XptCache(cache_dir), XptCache(cache_dir)  # Dos procesos con el índice vacío en memoria
+    stale._index["https://viejo/x.xpt"] = {"sha256": "0" * 64, "etag": None, "last_modified": None, "size": 0}
+    fetch_all({"a": NHANES_BASE_URL + PATHS[0]}, max_workers=1, cache=fresh)
+    stale._index[NHANES_BASE_URL + PATHS[0]] = {"sha256": "f" * 64, "etag": None, "last_modified": None, "size": 0}
+
+    fetch_all({"b": NHANES_BASE_URL + PATHS[1]}, max_workers=1, cache=stale)
+
+    index = XptCache(cache_dir)._read_index()
+    assert set(index) == {NHANES_BASE_URL + PATHS[0], NHANES_BASE_URL + PATHS[1]}
+    assert index[NHANES_BASE_URL + PATHS[0]]["sha256"] != "f" * 64
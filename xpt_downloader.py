@@ -0,0 +1,250 @@
+# xpt_downloader.py
+#
+# Etapa de descarga concurrente para los archivos XPT de NHANES.
+# - Un pool acotado de hilos descarga varios ciclos/componentes a la vez.
+# - Una única requests.Session (con pool de conexiones y reintentos) se
+#   comparte entre todos los hilos.
+# - Un caché en disco direccionado por contenido (sha256) guarda cada archivo
+#   una sola vez. El índice se indexa por URL y recuerda ETag/Last-Modified,
+#   de modo que una nueva ejecución solo vuelve a bajar lo que cambió (HTTP 304).
+# - Con NHANES_BASE_URL la descarga va a un espejo o a un servidor local
+#   (tests/test_xpt_downloader.py).
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import fcntl  # POSIX: bloqueo del índice entre procesos
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# --- Configuración ---
+CACHE_DIR = os.path.join("data", "raw", "xpt_cache")
+MAX_WORKERS = int(os.getenv("NEXUSBYTE_DOWNLOAD_WORKERS", "6"))
+REQUEST_TIMEOUT = 120  # segundos
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Permite apuntar la descarga a un espejo (o a un servidor HTTP local en pruebas)
+NHANES_BASE_URL = "https://wwwn.cdc.gov"
+
+K = TypeVar("K", bound=Hashable)
+
+
+@dataclass
+class FetchResult:
+    """Resultado de descargar (o reutilizar del caché) una URL."""
+    url: str
+    path: Optional[str] = None
+    from_cache: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.path is not None
+
+
+def make_session(pool_size: int = MAX_WORKERS, retries: int = 3) -> requests.Session:
+    """
+    Crea una Session con pool de conexiones del tamaño del pool de hilos
+    y reintentos con backoff para errores transitorios del servidor.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def rewrite_base_url(url: str, base_url: Optional[str] = None) -> str:
+    """Reemplaza el host de NHANES por otro (espejo o servidor local)."""
+    base_url = base_url or os.getenv("NHANES_BASE_URL")
+    if base_url and url.startswith(NHANES_BASE_URL):
+        return base_url.rstrip("/") + url[len(NHANES_BASE_URL):]
+    return url
+
+
+class XptCache:
+    """
+    Caché en disco direccionado por contenido.
+
+    - blobs/<sha[:2]>/<sha>.xpt: el contenido, guardado una sola vez.
+    - index.json: {url: {"sha256", "etag", "last_modified", "size"}}.
+
+    Las escrituras son atómicas (archivo temporal + os.replace), así que dos
+    procesos descargando a la vez nunca dejan un archivo a medio escribir; el
+    índice se relee y actualiza con flock sobre 'index.json.lock', y cada
+    proceso solo escribe la entrada que guardó (nunca su copia vieja del resto).
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._index = self._read_index()
+
+    def _read_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], f"{sha256}.xpt")
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Entrada del índice para la URL, solo si su blob sigue en disco."""
+        with self._lock:
+            entry = self._index.get(url)
+        if entry and os.path.exists(self.blob_path(entry["sha256"])):
+            return entry
+        return None
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Cabeceras condicionales (If-None-Match / If-Modified-Since)."""
+        entry = self.lookup(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, tmp_path: str, sha256: str, size: int,
+              etag: Optional[str], last_modified: Optional[str]) -> str:
+        """Mueve el archivo descargado a su blob y registra la URL en el índice."""
+        final_path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)  # Mismo contenido ya guardado (p.ej. por otra URL)
+        else:
+            os.replace(tmp_path, final_path)
+
+        entry = {"sha256": sha256, "etag": etag, "last_modified": last_modified, "size": size}
+        with self._lock, self._index_lock():
+            # Releer y agregar solo esta entrada: otro proceso pudo haber escrito
+            # entradas más nuevas que las de nuestra copia en memoria
+            merged = self._read_index()
+            merged[url] = entry
+            self._index = merged
+            fd, tmp_index = tempfile.mkstemp(dir=self.cache_dir, suffix=".json.tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(merged, f, indent=1, sort_keys=True)
+            os.replace(tmp_index, self.index_path)
+        return final_path
+
+    @contextmanager
+    def _index_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.index_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Cerrar libera el flock
+
+
+def fetch_one(url: str, session: requests.Session, cache: XptCache) -> FetchResult:
+    """
+    Descarga una URL con petición condicional. Si el servidor responde 304
+    (o el contenido descargado es idéntico al cacheado) se reutiliza el blob.
+    """
+    request_url = rewrite_base_url(url)
+    try:
+        headers = cache.validators(url)
+        with session.get(request_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 304:
+                entry = cache.lookup(url)
+                if entry:
+                    return FetchResult(url, cache.blob_path(entry["sha256"]), from_cache=True)
+                # El blob desapareció entre la consulta y la respuesta: forzar descarga
+                return fetch_one_uncached(url, session, cache)
+            response.raise_for_status()
+            return _save_response(url, response, cache)
+    except Exception as e:
+        return FetchResult(url, error=str(e))
+
+
+def fetch_one_uncached(url: str, session: requests.Session, cache: XptCache) -> FetchResult:
+    """Descarga sin cabeceras condicionales."""
+    try:
+        with session.get(rewrite_base_url(url), stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            return _save_response(url, response, cache)
+    except Exception as e:
+        return FetchResult(url, error=str(e))
+
+
+def _save_response(url: str, response: requests.Response, cache: XptCache) -> FetchResult:
+    previous = cache.lookup(url)
+    digest = hashlib.sha256()
+    size = 0
+    # Cada descarga escribe su propio temporal: nada de un 'temp.xpt' compartido
+    fd, tmp_path = tempfile.mkstemp(dir=cache.blob_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    path = cache.store(
+        url, tmp_path, sha256, size,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+    unchanged = previous is not None and previous["sha256"] == sha256
+    return FetchResult(url, path, from_cache=unchanged)
+
+
+def fetch_all(urls: Dict[K, str],
+              max_workers: int = MAX_WORKERS,
+              session: Optional[requests.Session] = None,
+              cache: Optional[XptCache] = None) -> Dict[K, FetchResult]:
+    """
+    Descarga en paralelo un diccionario {clave: url} y devuelve {clave: FetchResult}.
+    Las claves pueden ser cualquier valor hashable (p.ej. tuplas (split, componente, año)).
+    Los errores no detienen el resto de descargas; quedan en FetchResult.error.
+    """
+    session = session or make_session(pool_size=max_workers)
+    cache = cache or XptCache()
+    results: Dict[K, FetchResult] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_one, url, session, cache): key for key, url in urls.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            result = future.result()
+            results[key] = result
+            if result.ok:
+                origen = "caché" if result.from_cache else "descargado"
+                print(f"  [{origen}] {key}")
+            else:
+                print(f"  ERROR: No se pudo descargar {result.url}. Error: {result.error}")
+    return results
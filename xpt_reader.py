@@ -1,22 +1,34 @@
+import argparse
+import os
 import xport.v56
-import requests
+import numpy as np
 import pandas as pd
-import os
+import pyarrow as pa
+import pyarrow.parquet as pq
 from urls_and_columns import (
     TRAIN_URLS,
     TEST_URLS,
     COLUMNS_TO_SAVE
 )
+from xpt_downloader import fetch_all
+from xpt_stream import read_header, iter_columns
+
+# Directorio de salida de los datasets columnares (uno por componente y split,
+# particionados por 'year': data/raw/<Componente>_<SPLIT>/year=<año>/part-0.parquet)
+RAW_DIR = os.path.join("data", "raw")
+SLEEP_COLS = ['SLD010H', 'SLD012']
 
-# --- Tus funciones de lectura (sin cambios) ---
+# --- Tus funciones de lectura ---
 def request_and_save_xpt_data_from_url(url):
     """
-    Descarga y guarda los datos XPT de la URL.
+    Descarga (o reutiliza del caché) los datos XPT de la URL.
+    Devuelve la ruta local del archivo; cada URL tiene su propio archivo,
+    así que dos ejecuciones simultáneas no se pisan.
     """
-    response = requests.get(url)
-    response.raise_for_status()
-    with open('temp.xpt', 'wb') as temp_file:
-        temp_file.write(response.content)
+    result = fetch_all({url: url}, max_workers=1)[url]
+    if not result.ok:
+        raise RuntimeError(result.error)
+    return result.path
 
 def read_xpt_file(file_path):
     """
@@ -27,16 +39,19 @@ def read_xpt_file(file_path):
     return library
 
 # --- Función de procesamiento (CON LÓGICA DE SUEÑO MEJORADA) ---
-def make_csv_from_url(years_and_urls, columns_to_save, output_csv):
+def make_csv_from_url(years_and_urls, columns_to_save, output_csv, xpt_paths=None):
     """
     Procesa un conjunto de URLs (Train o Test) y las guarda en un CSV.
+    'xpt_paths' ({year: ruta_local}) permite pasar archivos ya descargados
+    por la etapa concurrente; si falta un año, se descarga aquí.
     """
-    df = pd.DataFrame()
+    xpt_paths = xpt_paths or {}
+    frames = []
     for year, url in years_and_urls.items():
         print(f"Procesando {output_csv}, Año: {year}...")
         try:
-            request_and_save_xpt_data_from_url(url)
-            xpt_data = read_xpt_file('temp.xpt')
+            xpt_path = xpt_paths.get(year) or request_and_save_xpt_data_from_url(url)
+            xpt_data = read_xpt_file(xpt_path)
         except Exception as e:
             print(f"  ERROR: No se pudo descargar o leer {url}. Error: {e}")
             continue
@@ -82,13 +97,93 @@ def make_csv_from_url(years_and_urls, columns_to_save, output_csv):
             
             final_cols_exist = [col for col in cols_to_use if col in table_df.columns]
             
-            filtered_df = table_df[final_cols_exist]
-            df = pd.concat([df, filtered_df], ignore_index=True)
+            frames.append(table_df[final_cols_exist])
 
+    # Un solo concat al final (no uno por ciclo, que es cuadrático)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
     df.to_csv(output_csv, index=False)
     print(f"✅ Archivo guardado: {output_csv}")
 
 
+# --- Conversión en streaming XPT -> Parquet (con proyección de columnas) ---
+def projected_columns(columns_to_save, available):
+    """
+    Columnas a decodificar del XPT y columnas finales a escribir.
+    Si el componente pide columnas de sueño, se reemplazan por 'SLD_HOURS'.
+    """
+    to_decode = [col for col in columns_to_save if col in available]
+    if "SEQN" not in to_decode and "SEQN" in available:
+        to_decode.insert(0, "SEQN")
+
+    output = [col for col in to_decode if col not in SLEEP_COLS]
+    if any(col in columns_to_save for col in SLEEP_COLS):
+        output.append('SLD_HOURS')
+    return to_decode, output
+
+
+def _coalesce_sleep(chunk):
+    """SLD_HOURS = SLD010H (ciclos antiguos) y, si falta, SLD012 (ciclos nuevos)."""
+    sld010h = chunk.pop('SLD010H', None)
+    sld012 = chunk.pop('SLD012', None)
+    if sld010h is not None and sld012 is not None:
+        return np.where(np.isnan(sld010h), sld012, sld010h)
+    if sld010h is not None:
+        return sld010h
+    if sld012 is not None:
+        return sld012
+    return None
+
+
+def convert_xpt_to_parquet(xpt_path, columns_to_save, dataset_dir, year):
+    """
+    Convierte un XPT en un archivo Parquet dentro de la partición 'year=<año>'.
+    Solo se decodifican las columnas proyectadas, por bloques de filas, y
+    SLD_HOURS se calcula en la misma pasada. Devuelve el número de filas.
+    """
+    header = read_header(xpt_path)
+    numeric = {v.name: v.is_numeric for v in header.variables}
+    to_decode, output = projected_columns(columns_to_save, set(header.names))
+    schema = pa.schema([
+        (col, pa.float64() if numeric.get(col, True) else pa.string())
+        for col in output
+    ])
+
+    partition_dir = os.path.join(dataset_dir, f"year={year}")
+    os.makedirs(partition_dir, exist_ok=True)
+    final_path = os.path.join(partition_dir, "part-0.parquet")
+    tmp_path = f"{final_path}.{os.getpid()}.tmp"
+
+    n_rows = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for chunk in iter_columns(xpt_path, to_decode, header=header):
+            if 'SLD_HOURS' in output:
+                sleep_hours = _coalesce_sleep(chunk)
+                if sleep_hours is None:
+                    sleep_hours = np.full(len(chunk['SEQN']), np.nan)
+                chunk['SLD_HOURS'] = sleep_hours
+            arrays = [pa.array(chunk[col], type=schema.field(col).type, from_pandas=True) for col in output]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            n_rows += len(arrays[0]) if arrays else 0
+    os.replace(tmp_path, final_path)
+    return n_rows
+
+
+def make_dataset_from_xpt(xpt_paths, columns_to_save, dataset_name):
+    """
+    Procesa los XPT ya descargados de un componente ({year: ruta_local})
+    y escribe un archivo columnar por ciclo en data/raw/<dataset_name>/.
+    """
+    dataset_dir = os.path.join(RAW_DIR, dataset_name)
+    for year, xpt_path in sorted(xpt_paths.items()):
+        try:
+            n_rows = convert_xpt_to_parquet(xpt_path, columns_to_save, dataset_dir, year)
+        except Exception as e:
+            print(f"  ERROR: No se pudo convertir {xpt_path} ({dataset_name}, {year}). Error: {e}")
+            continue
+        print(f"  {dataset_name}, Año: {year} -> {n_rows} filas")
+    print(f"✅ Dataset guardado: {dataset_dir}")
+
+
 # --- Bloque Principal (MODIFICADO CON NUEVOS NOMBRES) ---
     
 # --- MODIFICACIÓN: Mapeo de nombres de archivos ---
@@ -103,30 +198,54 @@ FILENAME_MAP = {
     "SMQ": "TabacoUse"
 }
 
+def prefetch_all(splits):
+    """
+    Etapa de descarga: baja en paralelo todos los (split, componente, año)
+    y devuelve {(split, file_key): {year: ruta_local}}.
+    """
+    urls = {}
+    for split, split_urls in splits.items():
+        for file_key in FILENAME_MAP:
+            for year, url in split_urls[file_key].items():
+                urls[(split, file_key, year)] = url
+
+    results = fetch_all(urls)
+    paths = {}
+    for (split, file_key, year), result in results.items():
+        if result.ok:
+            paths.setdefault((split, file_key), {})[year] = result.path
+    return paths
+
+
 if __name__ == "__main__":
-    
-    # 1. Procesar y guardar archivos de ENTRENAMIENTO (2007-2016)
-    print("--- INICIANDO DESCARGA DE DATOS DE ENTRENAMIENTO ---")
-    for file_key, descriptive_name in FILENAME_MAP.items():
-        make_csv_from_url(
-            years_and_urls=TRAIN_URLS[file_key],
-            columns_to_save=COLUMNS_TO_SAVE[file_key],
-            output_csv=f"{descriptive_name}_TRAIN.csv" # ¡Nombre cambiado!
-        )
-
-    # 2. Procesar y guardar archivos de TEST (2017-2020)
-    print("\n--- INICIANDO DESCARGA DE DATOS DE TEST ---")
-    for file_key, descriptive_name in FILENAME_MAP.items():
-        make_csv_from_url(
-            years_and_urls=TEST_URLS[file_key],
-            columns_to_save=COLUMNS_TO_SAVE[file_key],
-            output_csv=f"{descriptive_name}_TEST.csv" # ¡Nombre cambiado!
-        )
-
-    # 3. Limpiar archivo temporal
-    try:
-        os.remove('temp.xpt')
-    except OSError:
-        pass
-
-    print("\n--- PROCESO DE CARGA DE DATOS COMPLETADO ---")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Descarga y convierte los datos NHANES.")
+    parser.add_argument("--csv", action="store_true",
+                        help="Genera además el CSV único por componente (formato antiguo).")
+    args = parser.parse_args()
+
+    splits = {"TRAIN": TRAIN_URLS, "TEST": TEST_URLS}
+
+    # 0. Descargar todo en paralelo (solo lo que cambió desde la última vez)
+    print("--- INICIANDO DESCARGA CONCURRENTE (con caché) ---")
+    xpt_paths = prefetch_all(splits)
+
+    # 1. Convertir a Parquet particionado por año: ENTRENAMIENTO (2007-2016) y TEST (2017-2020)
+    for split, split_urls in splits.items():
+        print(f"\n--- PROCESANDO DATOS DE {split} ---")
+        for file_key, descriptive_name in FILENAME_MAP.items():
+            make_dataset_from_xpt(
+                xpt_paths=xpt_paths.get((split, file_key), {}),
+                columns_to_save=COLUMNS_TO_SAVE[file_key],
+                dataset_name=f"{descriptive_name}_{split}"
+            )
+
+            # 2. (Opcional) CSV único por componente, como antes
+            if args.csv:
+                make_csv_from_url(
+                    years_and_urls=split_urls[file_key],
+                    columns_to_save=COLUMNS_TO_SAVE[file_key],
+                    output_csv=f"{descriptive_name}_{split}.csv",
+                    xpt_paths=xpt_paths.get((split, file_key))
+                )
+
+    print("\n--- PROCESO DE CARGA DE DATOS COMPLETADO ---")
@@ -0,0 +1,178 @@
+# xpt_stream.py
+#
+# Lector en streaming de archivos SAS XPORT (v5, el formato de NHANES)
+# con proyección de columnas.
+#
+# A diferencia de xport.v56.load (que decodifica el archivo completo y todas
+# sus columnas), aquí se leen los descriptores de variables (NAMESTR), se
+# eligen solo las columnas pedidas y las observaciones se procesan por bloques
+# de filas: cada bloque es un array de bytes (filas x largo_obs) del que se
+# cortan solo los bytes de las columnas proyectadas. Los números IBM-370 se
+# convierten a IEEE de forma vectorizada con numpy.
+
+import os
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+RECORD_LEN = 80
+HEADER_PREFIX = b"HEADER RECORD*******"
+MEMBER_HEADER = HEADER_PREFIX + b"MEMBER  HEADER RECORD"
+NAMESTR_HEADER = HEADER_PREFIX + b"NAMESTR HEADER RECORD"
+OBS_HEADER = HEADER_PREFIX + b"OBS     HEADER RECORD"
+
+# Primer byte de un valor numérico faltante: '.', '_' o 'A'..'Z' (resto en cero)
+MISSING_FIRST_BYTES = np.frombuffer(b"._ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+
+DEFAULT_CHUNK_ROWS = 65536
+
+
+@dataclass
+class XptVariable:
+    """Descriptor (NAMESTR) de una variable del archivo XPT."""
+    name: str
+    is_numeric: bool
+    length: int
+    position: int
+    label: str = ""
+
+
+@dataclass
+class XptHeader:
+    variables: List[XptVariable]
+    obs_length: int
+    data_offset: int  # Byte donde empiezan las observaciones
+    data_end: int     # Byte donde terminan las observaciones
+
+    @property
+    def names(self) -> List[str]:
+        return [v.name for v in self.variables]
+
+    @property
+    def n_rows(self) -> int:
+        return (self.data_end - self.data_offset) // self.obs_length
+
+
+def _parse_namestr(raw: bytes) -> XptVariable:
+    ntype, _nhfun, nlng, _nvar0 = struct.unpack(">hhhh", raw[:8])
+    name = raw[8:16].decode("latin-1").strip()
+    label = raw[16:56].decode("latin-1").strip()
+    (npos,) = struct.unpack(">i", raw[84:88])
+    return XptVariable(name=name, is_numeric=(ntype == 1), length=nlng, position=npos, label=label)
+
+
+def read_header(path: str) -> XptHeader:
+    """
+    Lee solo las cabeceras del archivo (no las observaciones).
+    Se asume un único miembro por archivo, como en todos los XPT de NHANES.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        # Cabeceras de biblioteca y de miembro: hay que llegar hasta NAMESTR
+        head = f.read(RECORD_LEN * 8)
+        member_at = head.find(MEMBER_HEADER)
+        if member_at < 0:
+            raise ValueError(f"{path} no parece un archivo SAS XPORT v5.")
+        namestr_len = int(head[member_at + 74:member_at + 78])
+        namestr_at = head.find(NAMESTR_HEADER)
+        if namestr_at < 0:
+            raise ValueError(f"{path}: no se encontró la cabecera NAMESTR.")
+        n_vars = int(head[namestr_at + 54:namestr_at + 58])
+
+        f.seek(namestr_at + RECORD_LEN)
+        raw = f.read(n_vars * namestr_len)
+        variables = [
+            _parse_namestr(raw[i * namestr_len:(i + 1) * namestr_len])
+            for i in range(n_vars)
+        ]
+
+        # Los NAMESTR se rellenan hasta múltiplo de 80; luego viene OBS HEADER
+        namestr_bytes = n_vars * namestr_len
+        padded = -(-namestr_bytes // RECORD_LEN) * RECORD_LEN
+        obs_header_at = namestr_at + RECORD_LEN + padded
+        f.seek(obs_header_at)
+        if not f.read(RECORD_LEN).startswith(OBS_HEADER):
+            raise ValueError(f"{path}: no se encontró la cabecera OBS.")
+        data_offset = obs_header_at + RECORD_LEN
+
+    # NHANES publica un solo miembro por archivo: los datos llegan hasta el final
+    data_end = file_size
+    obs_length = max(v.position + v.length for v in variables)
+    return XptHeader(variables=variables, obs_length=obs_length,
+                     data_offset=data_offset, data_end=data_end)
+
+
+def ibm_to_ieee(raw: np.ndarray) -> np.ndarray:
+    """
+    Convierte una matriz (n, largo<=8) de bytes IBM-370 a float64.
+    Los valores faltantes de SAS (., ._, .A-.Z) se devuelven como NaN.
+    """
+    n, width = raw.shape
+    if width < 8:
+        raw = np.concatenate([raw, np.zeros((n, 8 - width), dtype=np.uint8)], axis=1)
+    words = np.ascontiguousarray(raw).view(">u8").ravel().astype(np.uint64)
+
+    first = (words >> np.uint64(56)).astype(np.uint8)
+    mantissa = words & np.uint64(0x00FFFFFFFFFFFFFF)
+    exponent = (first & 0x7F).astype(np.int64)
+    sign = np.where(first & 0x80, -1.0, 1.0)
+
+    # valor = mantisa / 2^56 * 16^(exp - 64)
+    values = sign * np.ldexp(mantissa.astype(np.float64), (4 * (exponent - 64) - 56).astype(np.int32))
+    missing = (mantissa == 0) & np.isin(first, MISSING_FIRST_BYTES)
+    values[missing] = np.nan
+    return values
+
+
+def _decode_chars(raw: np.ndarray) -> np.ndarray:
+    out = np.empty(raw.shape[0], dtype=object)
+    for i, row in enumerate(raw):
+        text = row.tobytes().decode("latin-1").rstrip()
+        out[i] = text if text else None
+    return out
+
+
+def iter_columns(path: str,
+                 columns: Optional[Sequence[str]] = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 header: Optional[XptHeader] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Itera el archivo por bloques de 'chunk_rows' filas y entrega
+    {columna: array} solo para las columnas proyectadas que existan.
+    """
+    header = header or read_header(path)
+    wanted = set(columns) if columns is not None else None
+    selected = [v for v in header.variables if wanted is None or v.name in wanted]
+    obs_len = header.obs_length
+    n_rows = header.n_rows
+
+    with open(path, "rb") as f:
+        f.seek(header.data_offset)
+        remaining = n_rows
+        while remaining > 0:
+            take = min(chunk_rows, remaining)
+            buf = f.read(take * obs_len)
+            take = len(buf) // obs_len
+            if take == 0:
+                break
+            remaining -= take
+            block = np.frombuffer(buf[:take * obs_len], dtype=np.uint8).reshape(take, obs_len)
+
+            # El último registro se rellena con espacios hasta múltiplo de 80:
+            # esas "filas" en blanco al final no son observaciones.
+            if remaining == 0:
+                blank = (block == 0x20).all(axis=1)
+                n_valid = len(blank)
+                while n_valid > 0 and blank[n_valid - 1]:
+                    n_valid -= 1
+                block = block[:n_valid]
+            if block.shape[0] == 0:
+                break
+
+            chunk = {}
+            for var in selected:
+                raw = block[:, var.position:var.position + var.length]
+                chunk[var.name] = ibm_to_ieee(raw) if var.is_numeric else _decode_chars(raw)
+            yield chunk